@@ -1,8 +1,6 @@
 import os
 import pandas as pd
 from pydantic import BaseModel, ValidationError
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_experimental.agents import create_pandas_dataframe_agent
 from typing import Optional
 
 # --------- Padronização das colunas ------------
@@ -86,7 +84,7 @@ def validar_dados(df: pd.DataFrame, modelo: BaseModel) -> pd.DataFrame:
         dados = row.to_dict()
         try:
             registro = modelo(**dados)
-            registros_validos.append(registro.dict())
+            registros_validos.append(registro.model_dump())
         except ValidationError as e:
             erros.append((i, e.errors()))
     if erros:
@@ -155,6 +153,10 @@ def criar_agente(df: pd.DataFrame):
     if not api_key:
         raise EnvironmentError("Variável de ambiente GOOGLE_API_KEY não definida. Configure sua chave API do Google.")
 
+    # Importados apenas aqui: o LangChain é pesado e só é necessário para perguntas abertas
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_experimental.agents import create_pandas_dataframe_agent
+
     llm = ChatGoogleGenerativeAI(
         model="gemini-1.5-flash",
         temperature=0,
@@ -0,0 +1,328 @@
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+import duckdb
+import pandas as pd
+
+from agent import padronizar_colunas
+
+
+PROMPT_SQL = """Você é um especialista em SQL (dialeto DuckDB) e em notas fiscais brasileiras.
+Escreva UMA consulta SQL (SELECT ou WITH) que responda à pergunta usando apenas as tabelas abaixo.
+Use os nomes de colunas exatamente como listados. Responda somente com o SQL, sem explicações.
+
+Tabelas:
+{esquema}
+
+Pergunta: {pergunta}
+{erro}"""
+
+PROMPT_RESPOSTA = """Você é um especialista em análise de dados e deve responder em português de forma clara,
+objetiva e direta, sem escrever código.
+
+Pergunta: {pergunta}
+Resultado da consulta ({linhas} linha(s){truncado}):
+{resultado}
+
+Resposta:"""
+
+
+def _citar(nome: str) -> str:
+    return '"' + nome.replace('"', '""') + '"'
+
+
+def _citar_literal(texto: str) -> str:
+    return "'" + texto.replace("'", "''") + "'"
+
+
+# Identificadores numéricos (chave de acesso de 44 dígitos, CNPJ/CPF, NCM, CFOP) são lidos como texto:
+# como DOUBLE perdem dígitos e zeros à esquerda, e as junções pela chave deixam de bater
+COLUNAS_TEXTO = re.compile(r'CHAVE|CNPJ|CPF|NCM|CFOP|INSCRICAO', re.IGNORECASE)
+
+
+def _identificador(coluna: str) -> str:
+    # Identificadores SQL simples: sem acentos restantes nem parênteses (ex.: NCM_SH_(TIPO_DE_PRODUTO))
+    coluna = unicodedata.normalize('NFKD', coluna)
+    coluna = ''.join(c for c in coluna if not unicodedata.combining(c))
+    return re.sub(r'_+', '_', re.sub(r'[^A-Za-z0-9_]', '_', coluna)).strip('_')
+
+
+# --------- Guarda de segurança para o SQL gerado ------------
+# Tokens: literais ('...' e $$...$$), identificadores entre aspas, palavras e símbolos; comentários são ignorados
+_TOKEN = re.compile(
+    r"(?P<comentario>--[^\n]*|/\*.*?\*/)"
+    r"|(?P<literal>'(?:[^']|'')*'|\$\$.*?\$\$)"
+    r"|(?P<citado>\"(?:[^\"]|\"\")*\")"
+    r"|(?P<palavra>[A-Za-z_][A-Za-z0-9_$]*)"
+    r"|(?P<simbolo>\S)",
+    re.DOTALL
+)
+
+COMANDOS_PROIBIDOS = {
+    'insert', 'update', 'delete', 'drop', 'create', 'alter', 'copy', 'attach', 'detach', 'install', 'load',
+    'pragma', 'set', 'reset', 'export', 'import', 'call', 'checkpoint', 'vacuum', 'truncate', 'use',
+}
+# Funções que leem arquivos, URLs, variáveis de ambiente ou o catálogo interno
+FUNCOES_PROIBIDAS = re.compile(
+    r'^(read_\w+|\w+_scan|glob|getenv|current_setting|query|query_table|sniff_csv|parquet_\w+|duckdb_\w+|pragma_\w+)$'
+)
+# Literais com cara de caminho de arquivo ou URL
+LITERAL_CAMINHO = re.compile(
+    r'^\s*([/\\~]|[A-Za-z]:[/\\]|\.\.?[/\\])|://'
+    r'|\.(csv|tsv|txt|json|ndjson|parquet|xlsx?|db|duckdb|sqlite)(\.(gz|zst|bz2|xz|zip))?\s*$',
+    re.IGNORECASE
+)
+# Palavras que encerram a lista de tabelas do FROM
+FIM_DO_FROM = {
+    'where', 'group', 'having', 'order', 'limit', 'offset', 'qualify', 'window', 'union', 'except',
+    'intersect', 'on', 'using', 'select',
+}
+# Funções cuja sintaxe usa FROM sem ser uma lista de tabelas
+FUNCOES_COM_FROM = {'extract', 'trim', 'substring', 'overlay'}
+
+
+def _tokens(sql: str) -> List[re.Match]:
+    return [t for t in _TOKEN.finditer(sql) if t.lastgroup != 'comentario']
+
+
+def _nome(token: re.Match) -> str:
+    if token.lastgroup == 'citado':
+        return token.group()[1:-1].replace('""', '"').lower()
+    return token.group().lower()
+
+
+def validar_sql(sql: str, tabelas: Iterable[str] = ()) -> str:
+    """Aceita apenas uma consulta de leitura (SELECT/WITH) sobre as tabelas registradas"""
+    tokens = _tokens(sql)
+    while tokens and tokens[-1].group() == ';':
+        tokens.pop()
+    if not tokens:
+        raise ValueError("Consulta SQL vazia.")
+    if any(t.group() == ';' for t in tokens):
+        raise ValueError("Apenas uma instrução SQL é permitida.")
+    if tokens[0].group().lower() not in ('select', 'with'):
+        raise ValueError("Apenas consultas SELECT são permitidas.")
+
+    tipos = [t.lastgroup for t in tokens]
+    textos = [t.group().lower() if t.lastgroup == 'palavra' else t.group() for t in tokens]
+    # CTEs declaradas na própria consulta: nome AS ( ... ) / nome AS MATERIALIZED ( ... )
+    permitidas = {nome.lower() for nome in tabelas}
+    for i in range(len(tokens) - 2):
+        if tipos[i] in ('palavra', 'citado') and textos[i + 1] == 'as' and textos[i + 2] in ('(', 'materialized', 'not'):
+            permitidas.add(_nome(tokens[i]))
+
+    # Tabelas são verificadas em qualquer nível de parênteses, inclusive em subconsultas
+    # FROM-first do DuckDB, ex.: SELECT (FROM t SELECT x); só os argumentos de
+    # EXTRACT/TRIM/SUBSTRING/OVERLAY usam FROM como parte da expressão
+    consulta = [True]  # por nível de parênteses: FROM/JOIN introduzem tabelas?
+    no_from = [False]  # por nível de parênteses: dentro da lista de tabelas do FROM?
+    espera_tabela = False
+    for i, (tipo, texto) in enumerate(zip(tipos, textos)):
+        anterior = textos[i - 1] if i else ''
+        proximo = textos[i + 1] if i + 1 < len(textos) else ''
+        if tipo == 'literal' and LITERAL_CAMINHO.search(texto.strip("'$")):
+            raise ValueError("A consulta não pode referenciar arquivos ou URLs.")
+        if tipo == 'palavra' and texto in COMANDOS_PROIBIDOS:
+            raise ValueError("A consulta contém comandos não permitidos.")
+        if tipo in ('palavra', 'citado') and proximo == '(' and FUNCOES_PROIBIDAS.match(_nome(tokens[i])):
+            raise ValueError(f"Função não permitida: {tokens[i].group()}.")
+
+        if espera_tabela:
+            espera_tabela = False
+            if texto == '(':
+                pass  # subconsulta
+            elif tipo not in ('palavra', 'citado') or proximo in ('(', '.') or _nome(tokens[i]) not in permitidas:
+                raise ValueError(
+                    f"Tabela não permitida: {tokens[i].group()}. Use apenas: {', '.join(sorted(tabelas))}."
+                )
+        if texto == '(':
+            consulta.append(anterior not in FUNCOES_COM_FROM)
+            no_from.append(False)
+        elif texto == ')':
+            if len(consulta) > 1:
+                consulta.pop()
+                no_from.pop()
+        elif not consulta[-1]:
+            continue  # ex.: EXTRACT(YEAR FROM data), TRIM(BOTH ' ' FROM nome)
+        elif tipo == 'palavra' and texto in ('from', 'join'):
+            no_from[-1] = espera_tabela = True
+        elif tipo == 'palavra' and texto in FIM_DO_FROM:
+            no_from[-1] = False
+        elif texto == ',' and no_from[-1]:
+            espera_tabela = True
+    if espera_tabela:
+        raise ValueError("Consulta incompleta: falta a tabela do FROM.")
+    return sql[:tokens[-1].end()].strip()
+
+
+def extrair_sql(texto: str) -> str:
+    bloco = re.search(r'```(?:sql)?\s*(.*?)```', texto, re.DOTALL | re.IGNORECASE)
+    return (bloco.group(1) if bloco else texto).strip()
+
+
+class AgenteSQL:
+    """Agente que gera SQL e executa no DuckDB sobre os CSVs (ou Parquet) sem carregá-los na memória"""
+
+    def __init__(
+        self,
+        pasta_csv: str,
+        llm=None,
+        limite_linhas: int = 1000,
+        timeout_s: float = 60.0,
+        threads: Optional[int] = None,
+        usar_parquet: bool = True
+    ):
+        self.llm = llm
+        self.limite_linhas = limite_linhas
+        self.timeout_s = timeout_s
+
+        # Multithread e com área temporária em disco para consultas maiores que a memória
+        self.con = duckdb.connect(database=':memory:', config={'threads': threads or os.cpu_count() or 1})
+        self.temp_directory = os.path.join(tempfile.gettempdir(), 'duckdb_spill')
+        self.con.execute(f"SET temp_directory = {_citar_literal(self.temp_directory)}")
+
+        self.tabelas: Dict[str, str] = {}
+        self._arquivos_lidos: List[str] = []
+        self._registrar_tabelas(pasta_csv, usar_parquet)
+        self._bloquear_acesso_externo()
+
+    # --------- Registro das views padronizadas ------------
+    def _colunas_csv(self, caminho: str) -> List[str]:
+        return [linha[0] for linha in self.con.execute(
+            f"DESCRIBE SELECT * FROM read_csv_auto({_citar_literal(caminho)})"
+        ).fetchall()]
+
+    @staticmethod
+    def _fonte_csv(caminho: str, texto: List[str]) -> str:
+        if not texto:
+            return f"read_csv_auto({_citar_literal(caminho)})"
+        tipos = ', '.join(f"{_citar_literal(c)}: 'VARCHAR'" for c in texto)
+        return f"read_csv_auto({_citar_literal(caminho)}, types={{{tipos}}})"
+
+    def _parquet_atualizado(self, parquet: str, caminho: str, texto: List[str]) -> bool:
+        if not os.path.exists(parquet) or os.path.getmtime(parquet) < os.path.getmtime(caminho):
+            return False
+        # Parquet gerado por versões que liam a chave como DOUBLE é refeito
+        tipos = dict(linha[:2] for linha in self.con.execute(
+            f"DESCRIBE SELECT * FROM read_parquet({_citar_literal(parquet)})"
+        ).fetchall())
+        return all(tipos.get(c) == 'VARCHAR' for c in texto)
+
+    def _registrar_tabelas(self, pasta_csv: str, usar_parquet: bool) -> None:
+        arquivos = sorted(f for f in os.listdir(pasta_csv) if f.endswith('.csv'))
+        if len(arquivos) < 2:
+            raise ValueError("Esperado pelo menos 2 arquivos CSV na pasta para notas fiscais e produtos.")
+
+        origens = {}
+        for arquivo in arquivos[:2]:
+            caminho = os.path.join(pasta_csv, arquivo)
+            colunas = self._colunas_csv(caminho)
+            # O arquivo de itens é o que traz NCM/descrição do produto
+            nome = 'itens' if any('NCM' in c.upper() for c in colunas) else 'notas'
+            if nome in origens:
+                nome = 'notas' if nome == 'itens' else 'itens'
+            origens[nome] = (caminho, colunas)
+
+        for nome, (caminho, colunas) in origens.items():
+            padronizadas = [_identificador(c) for c in padronizar_colunas(pd.DataFrame(columns=colunas)).columns]
+            selecao = ', '.join(f"{_citar(orig)} AS {_citar(nova)}" for orig, nova in zip(colunas, padronizadas))
+            texto = [(orig, nova) for orig, nova in zip(colunas, padronizadas) if COLUNAS_TEXTO.search(_identificador(orig))]
+            fonte = self._fonte_csv(caminho, [orig for orig, _ in texto])
+
+            if usar_parquet:
+                # Conversão única para Parquet (colunar e comprimido); reaproveitada se estiver atualizada
+                parquet = os.path.splitext(caminho)[0] + '.parquet'
+                if not self._parquet_atualizado(parquet, caminho, [nova for _, nova in texto]):
+                    self.con.execute(f"COPY (SELECT {selecao} FROM {fonte}) TO {_citar_literal(parquet)} (FORMAT PARQUET)")
+                self.con.execute(f"CREATE OR REPLACE VIEW {nome} AS SELECT * FROM read_parquet({_citar_literal(parquet)})")
+                self._arquivos_lidos.append(parquet)
+            else:
+                self.con.execute(f"CREATE OR REPLACE VIEW {nome} AS SELECT {selecao} FROM {fonte}")
+                self._arquivos_lidos.append(caminho)
+            self.tabelas[nome] = caminho
+
+    def _bloquear_acesso_externo(self) -> None:
+        # Segunda barreira além do validar_sql: só os arquivos das views e a área temporária
+        # continuam acessíveis, e a configuração não pode mais ser alterada pela consulta
+        caminhos = ', '.join(_citar_literal(c) for c in self._arquivos_lidos)
+        self.con.execute(f"SET allowed_paths = [{caminhos}]")
+        self.con.execute(f"SET allowed_directories = [{_citar_literal(self.temp_directory)}]")
+        self.con.execute("SET enable_external_access = false")
+        self.con.execute("SET lock_configuration = true")
+
+    def esquema(self) -> str:
+        linhas = []
+        for nome in self.tabelas:
+            colunas = self.con.execute(f"DESCRIBE {nome}").fetchall()
+            linhas.append(f"{nome}(" + ', '.join(f"{c[0]} {c[1]}" for c in colunas) + ")")
+        return '\n'.join(linhas)
+
+    def amostra(self, tabela: str = 'notas', linhas: int = 5) -> pd.DataFrame:
+        return self.executar_sql(f"SELECT * FROM {tabela}", limite=linhas)
+
+    # --------- Execução com limite de linhas e timeout ------------
+    def executar_sql(self, sql: str, limite: Optional[int] = None) -> pd.DataFrame:
+        sql = validar_sql(sql, self.tabelas)
+        limite = limite or self.limite_linhas
+        consulta = f"SELECT * FROM ({sql}) AS consulta LIMIT {int(limite) + 1}"
+
+        # Cada consulta usa seu próprio cursor, permitindo sessões concorrentes
+        cursor = self.con.cursor()
+        temporizador = threading.Timer(self.timeout_s, cursor.interrupt)
+        temporizador.start()
+        try:
+            df = cursor.execute(consulta).df()
+        except duckdb.InterruptException:
+            raise TimeoutError(f"Consulta excedeu o tempo limite de {self.timeout_s:g}s.")
+        finally:
+            temporizador.cancel()
+            cursor.close()
+
+        truncado = len(df) > limite
+        df = df.head(limite)
+        df.attrs['truncado'] = truncado
+        return df
+
+    # --------- Interface compatível com o agente LangChain ------------
+    def _gerar_sql(self, pergunta: str, erro: str = "") -> str:
+        prompt = PROMPT_SQL.format(esquema=self.esquema(), pergunta=pergunta, erro=erro)
+        return extrair_sql(self.llm.invoke(prompt).content)
+
+    def invoke(self, entrada: Dict[str, str]) -> Dict[str, object]:
+        if self.llm is None:
+            raise EnvironmentError("AgenteSQL criado sem LLM.")
+        pergunta = entrada["input"]
+
+        sql = self._gerar_sql(pergunta)
+        try:
+            resultado = self.executar_sql(sql)
+        except (duckdb.Error, ValueError) as e:
+            # Uma nova tentativa informando o erro ao modelo
+            sql = self._gerar_sql(pergunta, erro=f"\nA consulta anterior falhou:\n{sql}\nErro: {e}\nCorrija a consulta.")
+            resultado = self.executar_sql(sql)
+
+        truncado = resultado.attrs.get('truncado', False)
+        prompt = PROMPT_RESPOSTA.format(
+            pergunta=pergunta,
+            linhas=len(resultado),
+            truncado=", truncado" if truncado else "",
+            resultado=resultado.head(50).to_markdown(index=False)
+        )
+        return {"output": self.llm.invoke(prompt).content, "sql": sql, "tabela": resultado}
+
+
+def criar_agente_sql(pasta_csv: str) -> AgenteSQL:
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise EnvironmentError("Variável de ambiente GOOGLE_API_KEY não definida. Configure sua chave API do Google.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    llm = ChatGoogleGenerativeAI(
+        model="gemini-1.5-flash",
+        temperature=0,
+        streaming=False
+    )
+    return AgenteSQL(pasta_csv, llm=llm)
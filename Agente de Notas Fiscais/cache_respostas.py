@@ -0,0 +1,102 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import pandas as pd
+
+from consultas import normalizar_texto
+
+
+# --------- Identificação da pergunta e do conjunto de dados ------------
+def normalizar_pergunta(pergunta: str) -> str:
+    texto = normalizar_texto(pergunta)
+    texto = re.sub(r'[^\w\s]', ' ', texto)
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def fingerprint_dataframe(df: pd.DataFrame) -> str:
+    """Hash do esquema (colunas e tipos) e do conteúdo do DataFrame"""
+    h = hashlib.sha256()
+    for col, tipo in df.dtypes.items():
+        h.update(f"{col}:{tipo};".encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+# --------- Cache persistente de respostas do agente ------------
+class CacheRespostas:
+    """Cache em disco (SQLite) das respostas do agente com despejo LRU"""
+
+    def __init__(self, caminho: str = 'dados/cache_respostas.sqlite', max_entradas: int = 1000):
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(caminho, timeout=30, check_same_thread=False)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                pergunta TEXT NOT NULL,
+                resposta TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                acessos INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._con.execute('CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (ultimo_acesso)')
+        self._con.commit()
+
+    @staticmethod
+    def _chave(pergunta: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\n{normalizar_pergunta(pergunta)}".encode('utf-8')).hexdigest()
+
+    def obter(self, pergunta: str, fingerprint: str) -> Optional[str]:
+        chave = self._chave(pergunta, fingerprint)
+        with self._lock:
+            linha = self._con.execute('SELECT resposta FROM respostas WHERE chave = ?', (chave,)).fetchone()
+            if linha is None:
+                return None
+            self._con.execute(
+                'UPDATE respostas SET ultimo_acesso = ?, acessos = acessos + 1 WHERE chave = ?',
+                (time.time(), chave)
+            )
+            self._con.commit()
+        return linha[0]
+
+    def salvar(self, pergunta: str, fingerprint: str, resposta: str) -> None:
+        agora = time.time()
+        with self._lock:
+            self._con.execute(
+                'INSERT OR REPLACE INTO respostas '
+                '(chave, fingerprint, pergunta, resposta, criado_em, ultimo_acesso, acessos) '
+                'VALUES (?, ?, ?, ?, ?, ?, 0)',
+                (self._chave(pergunta, fingerprint), fingerprint, normalizar_pergunta(pergunta),
+                 resposta, agora, agora)
+            )
+            # Despejo LRU: mantém apenas as entradas acessadas mais recentemente
+            self._con.execute(
+                'DELETE FROM respostas WHERE chave NOT IN '
+                '(SELECT chave FROM respostas ORDER BY ultimo_acesso DESC LIMIT ?)',
+                (self.max_entradas,)
+            )
+            self._con.commit()
+
+    def invalidar_exceto(self, fingerprint: str, prefixo: str = '') -> int:
+        """Remove respostas de versões anteriores dos dados do motor em `prefixo`; retorna quantas foram removidas"""
+        with self._lock:
+            cursor = self._con.execute(
+                'DELETE FROM respostas WHERE fingerprint != ? AND substr(fingerprint, 1, ?) = ?',
+                (fingerprint, len(prefixo), prefixo)
+            )
+            self._con.commit()
+        return cursor.rowcount
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._con.execute('DELETE FROM respostas')
+            self._con.commit()
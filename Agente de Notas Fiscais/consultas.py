@@ -0,0 +1,272 @@
+import re
+import unicodedata
+from typing import Dict, NamedTuple, Optional, Set
+
+import pandas as pd
+
+
+# --------- Normalização de texto e colunas ------------
+def normalizar_texto(texto: str) -> str:
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto.lower()).strip()
+
+
+def _chave_coluna(col: str) -> str:
+    # padronizar_colunas não remove todos os acentos (ex.: "Ã") e o merge acrescenta sufixos
+    chave = normalizar_texto(col).upper()
+    return re.sub(r'_(NF|PROD)$', '', chave)
+
+
+def localizar_coluna(df: pd.DataFrame, *candidatos: str) -> Optional[str]:
+    """Encontra a coluna real a partir de nomes padronizados (preferindo o sufixo _NF)"""
+    por_chave: Dict[str, str] = {}
+    for col in df.columns:
+        chave = _chave_coluna(col)
+        if chave not in por_chave or col.endswith('_NF'):
+            por_chave[chave] = col
+    for candidato in candidatos:
+        if candidato in por_chave:
+            return por_chave[candidato]
+    return None
+
+
+def _numerico(serie: pd.Series) -> pd.Series:
+    return pd.to_numeric(serie, errors='coerce').fillna(0.0)
+
+
+# --------- Respostas da camada rápida ------------
+class RespostaRapida(NamedTuple):
+    texto: str
+    tabela: Optional[pd.DataFrame] = None
+
+
+# Dimensões reconhecidas na pergunta -> nome da tabela pré-calculada
+DIMENSOES = [
+    (r'\bdestinat|\bcliente|\bcomprador', 'destinatario'),
+    (r'\bfornecedor|\bemitente|\bempresa|\bemissor', 'emitente'),
+    (r'\bncm\b', 'ncm'),
+    (r'\bcfop\b', 'cfop'),
+    (r'\b(uf|estado)s?\b', 'uf'),
+    (r'\bmes\b|\bmeses\b|\bmensal', 'mes'),
+    (r'\bprodutos?\b|\bitens\b|\bitem\b', 'produto'),
+]
+
+ROTULOS = {
+    'emitente': 'fornecedor (emitente)',
+    'destinatario': 'destinatário',
+    'uf': 'UF do emitente',
+    'uf_destinatario': 'UF do destinatário',
+    'ncm': 'NCM',
+    'cfop': 'CFOP',
+    'mes': 'mês',
+    'produto': 'produto',
+}
+
+# Papel da entidade pelo verbo: quem compra é o destinatário, quem vende é o emitente
+VERBOS_COMPRA = r'\bcompr(a|am|ou|aram|ador(es)?)\b|\breceb|\badquir'
+VERBOS_VENDA = r'\bvend(e|em|eu|eram)\b|\bemit(e|em|iu|iram)\b|\bfornec(e|em|eu|eram)\b|\bfatur'
+
+# Perguntas com estes termos exigem raciocínio e seguem para o agente
+TERMOS_ABERTOS = r'\bpor que\b|\bporque\b|\bexpli|\bcompar|\btendenc|\banalis|\bquando\b|\bcomo\b|\brelac|\bentre\b|\bexceto\b|\bsem\b'
+
+# Métricas que as tabelas pré-calculadas não têm (impostos, preço unitário, proporções...)
+METRICAS_AUSENTES = (
+    r'\bicms\b|\bipi\b|\bpis\b|\bcofins\b|\bimpost|\btribut|\baliquota|\bcar[oa]s?\b|\bbarat|\bpreco'
+    r'|\bunitari|\bdesconto|\bfrete|\bseguro|\bmediana|\bpercent|\bproporc|\bparticipa|\bmargem|\blucro'
+    r'|\bdesvio|\bvariac|\bcresc|\bminimo|\bmaximo'
+)
+
+# Atributos de uma entidade que as tabelas não guardam (a resposta seria só o nome)
+ATRIBUTOS_AUSENTES = (
+    r'\bcnpj|\bcpf\b|\bdocumento|\bmunicipio|\bcidade|\bendereco|\binscricao|\bcodigo|\bdata\b|\bdia\b'
+    r'|\bchave|\bserie|\bmodelo|\bnatureza|\bunidade de medida|\bdescricao'
+)
+
+# Métrica pedida -> coluna das tabelas; vale a primeira que casar
+METRICAS = [
+    (r'\bmedi[ao]s?\b|\bticket', 'Media'),
+    (r'\b(numero|quantidade|qtd|contagem) de notas\b|(?<!valor )\btotal de notas\b|\b(mais|menos|quant[ao]s) notas\b|\bnotas emitidas', 'Notas'),
+    (r'\bquantidade\b|\bvendid|\bvolume\b|\bunidades\b', 'Quantidade'),
+    (r'\bvalor|\bfaturament|\breceita|\bmontante|\bsoma\b|\bsomatorio|\btota(l|is)\b|\bgast|\bcompr|\badquir|\bvend', 'Valor'),
+]
+
+DESCRICOES_METRICA = {
+    'Valor': 'valor total',
+    'Notas': 'número de notas',
+    'Media': 'valor médio por nota',
+    'Quantidade': 'quantidade',
+}
+
+
+def _formatar(metrica: str, valor: float) -> str:
+    if metrica == 'Notas':
+        return f"{int(valor):,} notas"
+    if metrica == 'Quantidade':
+        return f"{valor:,.2f} unidades"
+    return f"R$ {valor:,.2f}"
+
+
+class ConsultasPrecomputadas:
+    """Agregações calculadas uma vez no carregamento para perguntas frequentes"""
+
+    def __init__(self, df: pd.DataFrame):
+        col_chave = localizar_coluna(df, 'CHAVE_DE_ACESSO')
+        col_emitente = localizar_coluna(df, 'RAZAO_SOCIAL_EMITENTE')
+        col_destinatario = localizar_coluna(df, 'NOME_DESTINATARIO')
+        col_uf_emit = localizar_coluna(df, 'UF_EMITENTE')
+        col_uf_dest = localizar_coluna(df, 'UF_DESTINATARIO')
+        col_data = localizar_coluna(df, 'DATA_EMISSAO')
+        col_valor_nota = localizar_coluna(df, 'VALOR_NOTA_FISCAL')
+        col_ncm = localizar_coluna(df, 'CODIGO_NCM_SH', 'NCM')
+        col_cfop = localizar_coluna(df, 'CFOP')
+        col_produto = localizar_coluna(df, 'DESCRICAO_DO_PRODUTO_SERVICO')
+        col_qtd = localizar_coluna(df, 'QUANTIDADE')
+        col_valor_item = localizar_coluna(df, 'VALOR_TOTAL')
+
+        self.tabelas: Dict[str, pd.DataFrame] = {}
+
+        # Nível nota: uma linha por chave (o merge repete a nota em cada item)
+        notas = df.drop_duplicates(subset=col_chave) if col_chave else df
+        valor_nota = _numerico(notas[col_valor_nota]) if col_valor_nota else None
+        self.total_notas = len(notas)
+        self.valor_total = float(valor_nota.sum()) if valor_nota is not None else None
+
+        if valor_nota is not None:
+            base_notas = notas.assign(_VALOR=valor_nota)
+            for nome, col in (('emitente', col_emitente), ('destinatario', col_destinatario),
+                              ('uf', col_uf_emit), ('uf_destinatario', col_uf_dest)):
+                if col:
+                    self.tabelas[nome] = self._agrupar(base_notas, col, '_VALOR', 'Notas')
+            if col_data:
+                datas = pd.to_datetime(base_notas[col_data], errors='coerce', dayfirst=False)
+                base_mes = base_notas.assign(_MES=datas.dt.to_period('M').astype(str))
+                self.tabelas['mes'] = self._agrupar(base_mes, '_MES', '_VALOR', 'Notas').sort_index()
+
+        # Nível item
+        if col_valor_item:
+            itens = df.assign(_VALOR=_numerico(df[col_valor_item]),
+                              _QTD=_numerico(df[col_qtd]) if col_qtd else 0.0)
+            self.total_itens = int(df[col_valor_item].notna().sum())
+            for nome, col in (('ncm', col_ncm), ('cfop', col_cfop), ('produto', col_produto)):
+                if col:
+                    tabela = itens.groupby(col).agg(Valor=('_VALOR', 'sum'), Quantidade=('_QTD', 'sum'),
+                                                     Itens=('_VALOR', 'size'))
+                    self.tabelas[nome] = tabela.sort_values('Valor', ascending=False)
+        else:
+            self.total_itens = None
+
+        for nome, tabela in self.tabelas.items():
+            tabela.index.name = ROTULOS[nome]
+
+        # Siglas presentes nos dados: "em SP", "do RJ" filtram a pergunta e a levam ao agente
+        self._ufs = {normalizar_texto(uf) for nome in ('uf', 'uf_destinatario') if nome in self.tabelas
+                     for uf in self.tabelas[nome].index}
+
+    @staticmethod
+    def _agrupar(df: pd.DataFrame, coluna: str, valor: str, contagem: str) -> pd.DataFrame:
+        tabela = df.groupby(coluna).agg(Valor=(valor, 'sum'), **{contagem: (valor, 'size')})
+        tabela['Media'] = tabela['Valor'] / tabela[contagem]
+        return tabela.sort_values('Valor', ascending=False)
+
+    def _dimensoes(self, pergunta: str) -> Optional[Set[str]]:
+        """Dimensões citadas na pergunta; None quando o papel (comprador ou vendedor) é ambíguo"""
+        compra = bool(re.search(VERBOS_COMPRA, pergunta))
+        venda = bool(re.search(VERBOS_VENDA, pergunta))
+        if compra and venda:
+            return None
+        dimensoes = set()
+        for padrao, nome in DIMENSOES:
+            if re.search(padrao, pergunta):
+                if nome == 'uf' and (compra or re.search(r'destin', pergunta)):
+                    nome = 'uf_destinatario'
+                elif nome == 'emitente' and compra:
+                    # "qual empresa comprou mais?" é o destinatário; "qual fornecedor comprou?" não tem resposta aqui
+                    if not re.search(r'\bempresa', pergunta) or re.search(r'\bfornecedor|\bemitente|\bemissor', pergunta):
+                        return None
+                    nome = 'destinatario'
+                dimensoes.add(nome)
+        if 'uf_destinatario' in dimensoes:
+            dimensoes.discard('destinatario')  # "UF do destinatário" é uma dimensão só
+        return dimensoes
+
+    @staticmethod
+    def _metrica(pergunta: str) -> Optional[str]:
+        for padrao, nome in METRICAS:
+            if re.search(padrao, pergunta):
+                return nome
+        return None
+
+    def _filtra_uf(self, pergunta: str) -> bool:
+        return any(sigla in self._ufs for sigla in re.findall(r'\b(?:em|de|do|da|no|na|para)\s+([a-z]{2})\b', pergunta))
+
+    def responder(self, pergunta: str) -> Optional[RespostaRapida]:
+        """Responde perguntas agregadas comuns; None quando a pergunta deve ir ao agente"""
+        p = normalizar_texto(pergunta)
+        if re.search(TERMOS_ABERTOS, p) or re.search(r'\d', p) or '"' in p or "'" in p:
+            return None
+        # Métrica ou atributo que as tabelas não têm, ou filtro por UF: só o agente responde certo
+        if re.search(METRICAS_AUSENTES, p) or re.search(ATRIBUTOS_AUSENTES, p) or self._filtra_uf(p):
+            return None
+
+        dimensoes = self._dimensoes(p)
+        if dimensoes is None:
+            return None
+        metrica = self._metrica(p)
+
+        maior = re.search(r'\bmaior|\bmais\b|\bprincipa|\blider|\btop\b', p)
+        menor = re.search(r'\bmenor|\bmenos\b', p)
+        listagem = re.search(r'\bpor\b|\bcada\b|\bdistribui|\bagrupad|\branking|\blist', p)
+
+        # Totais gerais; "quem mais comprou?" pede um ranking sem dizer de quê
+        if not dimensoes:
+            if maior or menor:
+                return None
+            if metrica == 'Notas':
+                return RespostaRapida(f"Foram carregadas {self.total_notas:,} notas fiscais.")
+            if metrica == 'Valor' and self.valor_total is not None:
+                return RespostaRapida(f"O valor total das notas fiscais é R$ {self.valor_total:,.2f}.")
+            return None
+
+        # Duas entidades ("o estado do maior fornecedor") pedem um atributo de outra tabela
+        if len(dimensoes) > 1:
+            return None
+        dimensao = dimensoes.pop()
+
+        # Dimensão sem coluna correspondente nos dados: deixa para o agente
+        tabela = self.tabelas.get(dimensao)
+        if tabela is None or tabela.empty:
+            return None
+        rotulo = ROTULOS[dimensao]
+
+        if metrica is None:
+            if not (maior or menor or listagem) and re.search(r'\bquant[ao]s\b|\bnumero de', p):
+                # "Quantos itens" conta as linhas de produto; só "produtos distintos" conta descrições
+                if dimensao == 'produto' and not re.search(r'\bdistint|\bdiferent', p):
+                    if re.search(r'\bite(m|ns)\b', p) and self.total_itens is not None:
+                        return RespostaRapida(f"As notas fiscais têm {self.total_itens:,} itens.")
+                    return None
+                return RespostaRapida(f"Há {len(tabela):,} valores distintos de {rotulo} nos dados.")
+            return None
+        if metrica not in tabela.columns:
+            return None
+        descricao = DESCRICOES_METRICA[metrica]
+
+        if maior and not menor:
+            nome = tabela[metrica].idxmax()
+            return RespostaRapida(
+                f"O {rotulo} com maior {descricao} é **{nome}**, com {_formatar(metrica, tabela.loc[nome, metrica])}.",
+                tabela.sort_values(metrica, ascending=False).head(10)
+            )
+
+        if menor and not maior:
+            nome = tabela[metrica].idxmin()
+            return RespostaRapida(
+                f"O {rotulo} com menor {descricao} é **{nome}**, com {_formatar(metrica, tabela.loc[nome, metrica])}.",
+                tabela.sort_values(metrica, ascending=True).head(10)
+            )
+
+        if listagem and not (maior or menor):
+            return RespostaRapida(f"{descricao.capitalize()} por {rotulo}:", tabela.sort_values(metrica, ascending=False))
+
+        return None
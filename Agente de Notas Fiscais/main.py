@@ -1,36 +1,74 @@
-import streamlit as st
-from dotenv import load_dotenv
-from utils import descompactar_arquivos  # Sua função para extrair zip
-from agent import carregar_csvs_de_zip, criar_agente
-
-load_dotenv()
-
-st.title("📊 Agente Inteligente - Análise de Notas Fiscais")
-
-# Extrair arquivos zip para pasta temporária
-pasta_csv = descompactar_arquivos()
-
-# Carregar e validar CSVs, retornar DataFrame completo
-df = carregar_csvs_de_zip(pasta_csv)
-
-st.write("✅ Dados carregados com sucesso:")
-st.dataframe(df.head())
-if df.empty:
-    st.error("❌ Erro: DataFrame está vazio. Verifique os arquivos CSV.")
-
-# Criar agente com LLM
-agente = criar_agente(df)
-
-# Pergunta do usuário
-pergunta = st.text_input("Digite sua pergunta sobre os dados:")
-
-if pergunta:
-    with st.spinner("🧠 Processando a resposta..."):
-        try:
-            resposta = agente.invoke({"input": pergunta})
-            st.success("Resposta:")
-            st.write(resposta["output"] if isinstance(resposta, dict) else resposta)
-        except StopIteration:
-            st.error("Erro interno: modelo retornou resposta incompleta ou vazia.")
-        except Exception as e:
-            st.error(f"Erro ao processar a pergunta: {e}")
\ No newline at end of file
+import streamlit as st
+from dotenv import load_dotenv
+from recursos import (
+    assinatura_fonte, carregar_dados, fingerprint_sql, obter_agente, obter_agente_sql,
+    obter_cache_respostas, recarregar_dados
+)
+
+load_dotenv()
+
+st.title("📊 Agente Inteligente - Análise de Notas Fiscais")
+
+with st.sidebar:
+    motor = st.radio(
+        "Motor de consulta:",
+        ["pandas (em memória)", "SQL (DuckDB)"],
+        help="O DuckDB consulta os arquivos diretamente, em paralelo e sem carregá-los na memória"
+    )
+    if st.button("🔄 Recarregar dados"):
+        recarregar_dados()
+
+assinatura = assinatura_fonte()
+cache = obter_cache_respostas()
+
+if motor == "SQL (DuckDB)":
+    agente_sql = obter_agente_sql(assinatura)
+    consultas = None
+    fingerprint = fingerprint_sql(assinatura)
+
+    st.write("✅ Tabelas registradas no DuckDB:")
+    st.dataframe(agente_sql.amostra())
+else:
+    # Dados, agregações e fingerprint ficam em cache até o zip de origem mudar
+    dados = carregar_dados(assinatura)
+    df = dados.df
+    consultas = dados.consultas
+    fingerprint = dados.fingerprint
+
+    st.write("✅ Dados carregados com sucesso:")
+    st.dataframe(df.head())
+    if df.empty:
+        st.error("❌ Erro: DataFrame está vazio. Verifique os arquivos CSV.")
+
+# Pergunta do usuário
+pergunta = st.text_input("Digite sua pergunta sobre os dados:")
+
+if pergunta:
+    # Caminho rápido: perguntas agregadas respondidas sem LLM
+    resposta_rapida = consultas.responder(pergunta) if consultas is not None else None
+    if resposta_rapida is not None:
+        st.success("Resposta:")
+        st.write(resposta_rapida.texto)
+        if resposta_rapida.tabela is not None:
+            st.dataframe(resposta_rapida.tabela)
+    elif (resposta_cache := cache.obter(pergunta, fingerprint)) is not None:
+        st.success("Resposta:")
+        st.write(resposta_cache)
+    else:
+        with st.spinner("🧠 Processando a resposta..."):
+            try:
+                # Agente com LLM apenas para perguntas abertas
+                agente = agente_sql if consultas is None else obter_agente(assinatura)
+                resposta = agente.invoke({"input": pergunta})
+                texto = resposta["output"] if isinstance(resposta, dict) else str(resposta)
+                cache.salvar(pergunta, fingerprint, texto)
+                st.success("Resposta:")
+                st.write(texto)
+                if isinstance(resposta, dict) and "sql" in resposta:
+                    with st.expander("SQL executado"):
+                        st.code(resposta["sql"], language="sql")
+                        st.dataframe(resposta["tabela"])
+            except StopIteration:
+                st.error("Erro interno: modelo retornou resposta incompleta ou vazia.")
+            except Exception as e:
+                st.error(f"Erro ao processar a pergunta: {e}")
@@ -0,0 +1,78 @@
+import os
+from typing import TYPE_CHECKING, NamedTuple
+
+import pandas as pd
+import streamlit as st
+
+from utils import descompactar_arquivos
+from agent import carregar_csvs_de_zip, criar_agente
+from consultas import ConsultasPrecomputadas
+from cache_respostas import CacheRespostas, fingerprint_dataframe
+
+if TYPE_CHECKING:
+    from agente_sql import AgenteSQL
+
+
+ZIP_DADOS = 'dados/arquivos.zip'
+
+# Prefixo do fingerprint por motor: cada um invalida apenas as próprias respostas em cache
+PREFIXO_PANDAS = 'pandas:'
+PREFIXO_SQL = 'duckdb:'
+
+
+class DadosCarregados(NamedTuple):
+    df: pd.DataFrame
+    consultas: ConsultasPrecomputadas
+    fingerprint: str
+
+
+# --------- Assinatura da fonte: muda quando o zip é substituído ------------
+def assinatura_fonte(caminho: str = ZIP_DADOS) -> str:
+    info = os.stat(caminho)
+    return f"{os.path.abspath(caminho)}:{info.st_size}:{info.st_mtime_ns}"
+
+
+def fingerprint_sql(assinatura: str) -> str:
+    return PREFIXO_SQL + assinatura
+
+
+# --------- Recursos compartilhados entre reruns e sessões ------------
+@st.cache_resource
+def obter_cache_respostas() -> CacheRespostas:
+    return CacheRespostas()
+
+
+@st.cache_resource(max_entries=1, show_spinner="📦 Carregando dados...")
+def carregar_dados(assinatura: str) -> DadosCarregados:
+    """Extrai, lê e combina os CSVs uma única vez por versão da fonte"""
+    pasta_csv = descompactar_arquivos(ZIP_DADOS)
+    df = carregar_csvs_de_zip(pasta_csv)
+    fingerprint = PREFIXO_PANDAS + fingerprint_dataframe(df)
+
+    # Respostas em cache de versões anteriores dos dados deixam de valer
+    obter_cache_respostas().invalidar_exceto(fingerprint, PREFIXO_PANDAS)
+
+    return DadosCarregados(df, ConsultasPrecomputadas(df), fingerprint)
+
+
+@st.cache_resource(max_entries=1, show_spinner="🤖 Preparando o agente...")
+def obter_agente(assinatura: str):
+    """Agente LangChain criado uma vez por versão da fonte"""
+    return criar_agente(carregar_dados(assinatura).df)
+
+
+@st.cache_resource(max_entries=1, show_spinner="🦆 Registrando tabelas no DuckDB...")
+def obter_agente_sql(assinatura: str) -> "AgenteSQL":
+    """Agente SQL sobre os CSVs extraídos, sem carregar os dados no pandas"""
+    # DuckDB só é importado quando o motor SQL é escolhido
+    from agente_sql import criar_agente_sql
+    agente = criar_agente_sql(descompactar_arquivos(ZIP_DADOS))
+    obter_cache_respostas().invalidar_exceto(fingerprint_sql(assinatura), PREFIXO_SQL)
+    return agente
+
+
+def recarregar_dados() -> None:
+    """Invalidação explícita (ex.: botão na interface)"""
+    carregar_dados.clear()
+    obter_agente.clear()
+    obter_agente_sql.clear()
@@ -0,0 +1,123 @@
+import pytest
+
+duckdb = pytest.importorskip('duckdb')
+
+from agente_sql import AgenteSQL, validar_sql
+
+
+CHAVE = '35240112345678000190550010000012341000012345'
+
+CABECALHO = (
+    'CHAVE DE ACESSO,CPF/CNPJ Emitente,UF EMITENTE,VALOR NOTA FISCAL\n'
+    f'{CHAVE},00123456000190,SP,1500.50\n'
+    '35240112345678000190550010000012351000012346,00123456000190,SP,99.90\n'
+)
+ITENS = (
+    'CHAVE DE ACESSO,CÓDIGO NCM/SH,CFOP,QUANTIDADE,VALOR TOTAL\n'
+    f'{CHAVE},04029900,5102,2,1000.50\n'
+    f'{CHAVE},84713012,5102,1,500.00\n'
+    '35240112345678000190550010000012351000012346,04029900,6933,1,99.90\n'
+)
+
+
+@pytest.fixture(params=[True, False], ids=['parquet', 'csv'])
+def agente(request, tmp_path):
+    (tmp_path / '202401_NFs_Cabecalho.csv').write_text(CABECALHO, encoding='utf-8')
+    (tmp_path / '202401_NFs_Itens.csv').write_text(ITENS, encoding='utf-8')
+    return AgenteSQL(str(tmp_path), usar_parquet=request.param, timeout_s=10)
+
+
+# --------- Tipos das colunas de identificação ------------
+def test_identificadores_lidos_como_texto(agente):
+    tipos = {linha[0]: linha[1] for nome in ('notas', 'itens') for linha in agente.con.execute(f"DESCRIBE {nome}").fetchall()}
+    for coluna in ('CHAVE_DE_ACESSO', 'CPF_CNPJ_EMITENTE', 'CODIGO_NCM_SH', 'CFOP'):
+        assert tipos[coluna] == 'VARCHAR', coluna
+    assert tipos['VALOR_NOTA_FISCAL'] == 'DOUBLE'
+
+
+def test_chave_preservada_e_juncao_exata(agente):
+    df = agente.executar_sql(
+        "SELECT n.CHAVE_DE_ACESSO, n.CPF_CNPJ_EMITENTE, COUNT(*) AS itens "
+        "FROM notas n JOIN itens i ON n.CHAVE_DE_ACESSO = i.CHAVE_DE_ACESSO "
+        "GROUP BY ALL ORDER BY itens DESC"
+    )
+    assert df['itens'].tolist() == [2, 1]
+    assert df['CHAVE_DE_ACESSO'].iloc[0] == CHAVE
+    assert df['CPF_CNPJ_EMITENTE'].iloc[0] == '00123456000190'
+
+
+def test_parquet_antigo_com_chave_double_e_refeito(tmp_path):
+    (tmp_path / '202401_NFs_Cabecalho.csv').write_text(CABECALHO, encoding='utf-8')
+    (tmp_path / '202401_NFs_Itens.csv').write_text(ITENS, encoding='utf-8')
+    AgenteSQL(str(tmp_path))
+    duckdb.connect().execute(
+        f"COPY (SELECT 3.5e43::DOUBLE AS CHAVE_DE_ACESSO) TO '{tmp_path / '202401_NFs_Cabecalho.parquet'}' (FORMAT PARQUET)"
+    )
+    agente = AgenteSQL(str(tmp_path))
+    assert agente.executar_sql("SELECT CHAVE_DE_ACESSO FROM notas ORDER BY 1")['CHAVE_DE_ACESSO'].iloc[0] == CHAVE
+
+
+# --------- Guarda do SQL gerado ------------
+TABELAS = ('notas', 'itens')
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM notas",
+    "select count(*) from notas;",
+    "SELECT * FROM notas WHERE RAZAO_SOCIAL = 'A; B'",
+    "SELECT * FROM notas WHERE obs = 'drop table; delete'",
+    "SELECT UF, SUM(v) FROM notas n JOIN itens i USING (CHAVE_DE_ACESSO) GROUP BY UF -- total; por UF",
+    "SELECT * FROM notas, itens WHERE notas.CHAVE_DE_ACESSO = itens.CHAVE_DE_ACESSO",
+    "WITH t AS (SELECT * FROM itens) SELECT * FROM t JOIN notas ON true",
+    "SELECT EXTRACT(YEAR FROM DATA_EMISSAO), TRIM(BOTH ' ' FROM RAZAO_SOCIAL) FROM \"notas\"",
+    "SELECT * FROM (SELECT * FROM notas) AS x",
+    "SELECT * FROM notas WHERE NCM_SH = 'NCM/SH 0402'",
+    "SELECT (FROM notas SELECT COUNT(*)) AS total",
+    "SELECT SUBSTRING(RAZAO_SOCIAL FROM 1 FOR 3), OVERLAY(UF PLACING 'X' FROM 1) FROM notas",
+])
+def test_consultas_aceitas(sql):
+    assert validar_sql(sql, TABELAS)
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM read_text('/etc/hostname')",
+    "SELECT * FROM notas, read_csv_auto('x')",
+    "SELECT content FROM notas JOIN read_blob('segredo') ON true",
+    "SELECT * FROM glob('*')",
+    "SELECT * FROM parquet_scan('dados')",
+    "SELECT * FROM '/etc/passwd'",
+    "SELECT * FROM 'https://exemplo.com/dados.csv'",
+    "SELECT * FROM 'dados.parquet'",
+    "SELECT * FROM outra_tabela",
+    "SELECT * FROM information_schema.tables",
+    "SELECT * FROM duckdb_settings()",
+    "SELECT getenv('GOOGLE_API_KEY')",
+    "SELECT * FROM notas; DROP TABLE notas",
+    "SELECT 1; SELECT 2",
+    "DELETE FROM notas",
+    "SELECT * FROM notas WHERE 1 = (SELECT 1 FROM read_text('/etc/hostname'))",
+    "SELECT * FROM",
+    "SELECT (FROM 'segredo.csv.gz' SELECT valor) AS x",
+    "SELECT (FROM outra_tabela SELECT valor) AS x",
+    "SELECT * FROM notas WHERE UF IN (FROM information_schema.tables SELECT table_name)",
+    "SELECT (FROM read_csv('segredo') SELECT valor) AS x",
+    "SELECT * FROM read_csv('segredo.csv.gz')",
+    "SELECT EXTRACT(YEAR FROM (SELECT MAX(d) FROM outra_tabela))",
+])
+def test_consultas_rejeitadas(sql):
+    with pytest.raises(ValueError):
+        validar_sql(sql, TABELAS)
+
+
+def test_executar_sql_rejeita_arquivos(agente):
+    with pytest.raises(ValueError):
+        agente.executar_sql("SELECT * FROM read_text('/etc/hostname')")
+
+
+def test_acesso_externo_bloqueado_no_duckdb(agente):
+    # Mesmo sem passar pelo validar_sql, a conexão só lê os arquivos das views
+    assert agente.executar_sql("SELECT COUNT(*) AS n FROM notas")['n'].iloc[0] == 2
+    with pytest.raises(Exception, match="disabled by configuration"):
+        agente.con.execute("SELECT * FROM read_text('/etc/hostname')")
+    with pytest.raises(Exception, match="locked"):
+        agente.con.execute("SET enable_external_access = true")
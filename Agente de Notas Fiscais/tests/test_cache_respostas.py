@@ -0,0 +1,11 @@
+from cache_respostas import CacheRespostas
+
+
+def test_invalidar_exceto_preserva_outros_motores(tmp_path):
+    cache = CacheRespostas(str(tmp_path / 'cache.sqlite'))
+    cache.salvar('total de notas', 'pandas:v1', 'pandas antigo')
+    cache.salvar('total de notas', 'duckdb:zip:1', 'duckdb atual')
+
+    assert cache.invalidar_exceto('pandas:v2', 'pandas:') == 1
+    assert cache.obter('total de notas', 'pandas:v1') is None
+    assert cache.obter('total de notas', 'duckdb:zip:1') == 'duckdb atual'
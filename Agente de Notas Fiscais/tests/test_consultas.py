@@ -0,0 +1,144 @@
+import contextlib
+import io
+import shutil
+import subprocess
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from consultas import ConsultasPrecomputadas
+
+
+def _dados() -> pd.DataFrame:
+    """Seis notas em que as ordens por valor, por quantidade de notas e por média são diferentes"""
+    notas = [
+        # chave, emitente, UF, data, valor da nota, (produto, NCM, quantidade, unitário)
+        ("A1", "ALFA", "SP", "2024-02-10", 1000.0, ("NOTEBOOK", "84713012", 1, 1000.0)),
+        ("B1", "BETA", "RJ", "2024-01-05", 100.0, ("PAPEL A4", "48025610", 10, 10.0)),
+        ("B2", "BETA", "RJ", "2024-01-06", 100.0, ("PAPEL A4", "48025610", 10, 10.0)),
+        ("B3", "BETA", "RJ", "2024-01-07", 100.0, ("PAPEL A4", "48025610", 10, 10.0)),
+        ("C1", "GAMA", "MG", "2024-01-08", 200.0, ("MESA", "94033000", 1, 200.0)),
+        ("C2", "GAMA", "MG", "2024-01-09", 250.0, ("CADEIRA", "94013000", 5, 50.0)),
+    ]
+    linhas = []
+    for chave, emitente, uf, data, valor, (produto, ncm, quantidade, unitario) in notas:
+        linhas.append({
+            "CHAVE_DE_ACESSO": chave,
+            "RAZAO_SOCIAL_EMITENTE_NF": emitente,
+            "RAZAO_SOCIAL_EMITENTE_PROD": emitente,
+            "NOME_DESTINATARIO_NF": "CLIENTE UNICO",
+            "UF_EMITENTE_NF": uf,
+            "UF_DESTINATARIO_NF": "PR",
+            "DATA_EMISSAO_NF": data,
+            "VALOR_NOTA_FISCAL": valor,
+            "DESCRICAO_DO_PRODUTO_SERVICO": produto,
+            "CODIGO_NCM_SH": ncm,
+            "CFOP": "5102",
+            "QUANTIDADE": quantidade,
+            "VALOR_UNITARIO": unitario,
+            "VALOR_TOTAL": quantidade * unitario,
+        })
+    return pd.DataFrame(linhas)
+
+
+# pergunta -> None (segue para o agente) ou (trecho da resposta, primeira linha da tabela ou None)
+CASOS = [
+    # Métrica de imposto ou de preço unitário: as tabelas não têm
+    ("qual o valor total de ICMS?", None),
+    ("quanto de PIS foi pago por fornecedor?", None),
+    ("qual o item mais caro?", None),
+    ("qual o produto mais barato?", None),
+    # Contagem de notas, não valor
+    ("qual fornecedor tem mais notas?", ("**BETA**, com 3 notas", "BETA")),
+    ("fornecedor com maior número de notas", ("**BETA**, com 3 notas", "BETA")),
+    ("qual a UF com menos notas?", ("**SP**, com 1 notas", "SP")),
+    ("quantas notas por estado?", ("Número de notas por UF do emitente", "RJ")),
+    # Média, não soma
+    ("qual a média de valor por UF?", ("Valor médio por nota por UF do emitente", "SP")),
+    ("ticket médio por fornecedor", ("Valor médio por nota por fornecedor (emitente)", "ALFA")),
+    ("qual fornecedor tem o menor ticket médio?", ("**BETA**, com R$ 100.00", "BETA")),
+    # Valor
+    ("qual fornecedor tem o maior valor total?", ("**ALFA**, com R$ 1,000.00", "ALFA")),
+    ("qual o fornecedor com menor valor?", ("**BETA**, com R$ 300.00", "BETA")),
+    ("qual a UF com menor valor total?", ("**RJ**, com R$ 300.00", "RJ")),
+    ("valor total de notas por UF", ("Valor total por UF do emitente", "SP")),
+    ("qual o mês com maior faturamento?", ("**2024-02**", "2024-02")),
+    ("qual o produto mais vendido?", ("**PAPEL A4**, com 30.00 unidades", "PAPEL A4")),
+    # Totais gerais
+    ("quantas notas foram carregadas?", ("6 notas fiscais", None)),
+    ("qual o valor total das notas?", ("R$ 1,750.00", None)),
+    ("quantos fornecedores existem?", ("3 valores distintos", None)),
+    ("quantos itens existem?", ("6 itens", None)),
+    ("quantos produtos distintos existem?", ("4 valores distintos", None)),
+    ("quantos produtos existem?", None),
+    # Ranking sem dimensão reconhecida
+    ("qual o maior?", None),
+    ("quem mais comprou?", None),
+    ("qual o top?", None),
+    # Papel pelo verbo: quem compra é o destinatário
+    ("qual estado comprou mais?", ("**PR**", "PR")),
+    ("qual UF recebeu mais notas?", ("**PR**, com 6 notas", "PR")),
+    ("qual estado vendeu mais?", ("**SP**", "SP")),
+    ("qual fornecedor comprou mais?", None),
+    ("qual UF mais vendeu e comprou?", None),
+    # Atributo de outra entidade ou da própria entidade: a tabela só tem o nome
+    ("qual o estado do maior fornecedor?", None),
+    ("qual o cnpj do fornecedor com mais notas?", None),
+    ("qual a UF do destinatário com maior valor?", ("**PR**", "PR")),
+    # Métrica não identificada, métrica ausente na tabela, filtro ou pergunta aberta
+    ("qual o maior fornecedor?", None),
+    ("qual NCM tem o maior valor médio?", None),
+    ("qual fornecedor tem mais notas em SP?", None),
+    ("qual fornecedor do RJ tem maior valor?", None),
+    ("por que a BETA emite tantas notas?", None),
+    ("compare o valor dos fornecedores", None),
+]
+
+
+@pytest.fixture(scope="module")
+def consultas() -> ConsultasPrecomputadas:
+    return ConsultasPrecomputadas(_dados())
+
+
+@pytest.mark.parametrize("pergunta, esperado", CASOS)
+def test_responder(consultas, pergunta, esperado):
+    resposta = consultas.responder(pergunta)
+    if esperado is None:
+        assert resposta is None, resposta
+        return
+    trecho, primeira = esperado
+    assert resposta is not None
+    assert trecho in resposta.texto
+    if primeira is not None:
+        assert resposta.tabela.index[0] == primeira
+
+
+# --------- CSVs de exemplo do projeto (dentro de "Agente CSV.rar") ------------
+ARQUIVO_AMOSTRA = Path(__file__).resolve().parents[2] / 'Agente CSV.rar'
+PASTA_AMOSTRA = 'Agente CSV/dados/extraidos'
+
+
+@pytest.fixture(scope="module")
+def consultas_amostra(tmp_path_factory) -> ConsultasPrecomputadas:
+    if not ARQUIVO_AMOSTRA.exists() or shutil.which('bsdtar') is None:
+        pytest.skip("CSVs de exemplo indisponíveis (requer 'Agente CSV.rar' e bsdtar)")
+    destino = tmp_path_factory.mktemp('amostra')
+    subprocess.run(['bsdtar', '-xf', str(ARQUIVO_AMOSTRA), '-C', str(destino), PASTA_AMOSTRA], check=True)
+    from agent import carregar_csvs_de_zip
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = carregar_csvs_de_zip(str(destino / PASTA_AMOSTRA))
+    return ConsultasPrecomputadas(df)
+
+
+@pytest.mark.parametrize("pergunta, esperado", [
+    ("quantos itens existem?", "565 itens"),
+    ("quantos produtos distintos existem?", "389 valores distintos"),
+    ("quantos produtos existem?", None),
+])
+def test_contagem_de_itens_na_amostra(consultas_amostra, pergunta, esperado):
+    resposta = consultas_amostra.responder(pergunta)
+    if esperado is None:
+        assert resposta is None, resposta
+    else:
+        assert esperado in resposta.texto
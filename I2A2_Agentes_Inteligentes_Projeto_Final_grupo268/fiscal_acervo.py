@@ -0,0 +1,212 @@
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, NamedTuple, Optional, Union
+
+from diario import hash_conteudo
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+
+# Cabeçalho de cada registro no arquivo de dados: marcador, flags e tamanho do conteúdo gravado
+CABECALHO = struct.Struct("<4sBI")
+MARCADOR = b"NFXA"
+FLAG_ZLIB = 1
+
+
+@contextmanager
+def _travado(arquivo: BinaryIO) -> Iterator[None]:
+    """Trava exclusiva no arquivo de dados: interface e CLI podem anexar ao mesmo acervo"""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(arquivo, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+class EntradaAcervo(NamedTuple):
+    hash: str
+    chave: str  # primeira chave do arquivo; todas ficam na tabela `chaves`
+    nome: str
+    offset: int   # início do conteúdo (após o cabeçalho)
+    tamanho: int  # bytes gravados (comprimidos, se for o caso)
+    comprimido: bool
+
+
+class AcervoXML:
+    """Arquivo append-only com os XMLs originais e índice chave/hash -> (offset, tamanho), lido via mmap"""
+
+    def __init__(self, pasta: str = "acervo_xml", somente_leitura: bool = False):
+        self.pasta = pasta
+        self.somente_leitura = somente_leitura
+        self.caminho_dados = os.path.join(pasta, "acervo.dat")
+        if not somente_leitura:
+            os.makedirs(pasta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._arquivo = None if somente_leitura else open(self.caminho_dados, "ab")
+        self._mapa: Optional[mmap.mmap] = None
+
+        self._con = sqlite3.connect(os.path.join(pasta, "indice.sqlite"), timeout=30, check_same_thread=False)
+        if not somente_leitura:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS xmls (
+                    hash TEXT PRIMARY KEY,
+                    chave TEXT NOT NULL,
+                    nome TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    comprimido INTEGER NOT NULL,
+                    arquivado_em REAL NOT NULL
+                )
+            """)
+            self._con.execute("CREATE INDEX IF NOT EXISTS idx_xmls_chave ON xmls (chave)")
+            # Arquivos com várias NF-e (enviNFe, lotes de nfeProc): uma linha por chave de acesso
+            self._con.execute("CREATE TABLE IF NOT EXISTS chaves (chave TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+            # Acervos anteriores guardavam só a chave da primeira nota, em `xmls`
+            self._con.execute("INSERT OR IGNORE INTO chaves (chave, hash) SELECT chave, hash FROM xmls WHERE chave != ''")
+            self._con.commit()
+
+        # Índice inteiro em memória: busca O(1) por hash ou chave de acesso
+        self._por_hash: Dict[str, EntradaAcervo] = {}
+        self._por_chave: Dict[str, str] = {}
+        for linha in self._con.execute("SELECT hash, chave, nome, offset, tamanho, comprimido FROM xmls"):
+            self._indexar(EntradaAcervo(*linha[:5], bool(linha[5])))
+        tabelas = {nome for (nome,) in self._con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "chaves" in tabelas:
+            for chave, hash_arquivo in self._con.execute("SELECT chave, hash FROM chaves"):
+                self._por_chave.setdefault(chave, hash_arquivo)
+
+    def _indexar(self, entrada: EntradaAcervo, chaves: Iterable[str] = ()) -> None:
+        self._por_hash[entrada.hash] = entrada
+        for chave in (entrada.chave, *chaves):
+            if chave:
+                # A primeira gravação de uma chave prevalece, como na tabela `chaves`
+                self._por_chave.setdefault(chave, entrada.hash)
+
+    def __len__(self) -> int:
+        return len(self._por_hash)
+
+    def __contains__(self, hash_ou_chave: str) -> bool:
+        return hash_ou_chave in self._por_hash or hash_ou_chave in self._por_chave
+
+    # --------- Gravação ---------
+
+    def guardar(
+        self,
+        conteudo: bytes,
+        chave: Union[str, Iterable[str]] = "",
+        nome: str = "",
+        comprimir: bool = False
+    ) -> EntradaAcervo:
+        """Anexa o XML ao acervo (uma vez por conteúdo), indexa cada chave de acesso e retorna sua entrada"""
+        # Sem compressão (padrão) `visao` devolve uma fatia do mmap sem cópia; `comprimir` ocupa
+        # cerca de 3 a 4x menos disco, mas cada leitura descomprime o registro em um novo bytes
+        if self.somente_leitura:
+            raise PermissionError("Acervo aberto somente para leitura")
+        chaves = [chave] if isinstance(chave, str) else list(chave)
+        chaves = [c for c in chaves if c]
+        hash_arquivo = hash_conteudo(conteudo)
+        with self._lock:
+            existente = self._por_hash.get(hash_arquivo)
+            if existente is None:
+                existente = self._gravar(hash_arquivo, conteudo, chaves[0] if chaves else "", nome, comprimir)
+            elif chaves and not existente.chave:
+                existente = existente._replace(chave=chaves[0])
+                self._con.execute("UPDATE xmls SET chave = ? WHERE hash = ?", (chaves[0], hash_arquivo))
+            novas = [c for c in chaves if c not in self._por_chave]
+            if novas:
+                self._con.executemany(
+                    "INSERT OR IGNORE INTO chaves (chave, hash) VALUES (?, ?)", ((c, hash_arquivo) for c in novas)
+                )
+            self._con.commit()
+            self._indexar(existente, novas)
+            return existente
+
+    def _gravar(self, hash_arquivo: str, conteudo: bytes, chave: str, nome: str, comprimir: bool) -> EntradaAcervo:
+        dados = zlib.compress(conteudo, 6) if comprimir else conteudo
+        flags = FLAG_ZLIB if comprimir else 0
+        registro = CABECALHO.pack(MARCADOR, flags, len(dados)) + dados
+        # O conteúdo é gravado e sincronizado antes do índice: nenhuma entrada aponta para bytes ausentes.
+        # O offset é lido sob a trava e o registro vai em uma única escrita, sem intercalar com outro processo
+        with _travado(self._arquivo):
+            inicio = self._arquivo.seek(0, os.SEEK_END)
+            self._arquivo.write(registro)
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+
+        entrada = EntradaAcervo(hash_arquivo, chave, nome, inicio + CABECALHO.size, len(dados), comprimir)
+        # Outro processo (interface e CLI no mesmo acervo) pode ter gravado o mesmo conteúdo depois
+        # que este índice foi carregado: a entrada dele prevalece e os bytes anexados aqui ficam órfãos
+        self._con.execute(
+            "INSERT OR IGNORE INTO xmls (hash, chave, nome, offset, tamanho, comprimido, arquivado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (entrada.hash, chave, nome, entrada.offset, entrada.tamanho, int(comprimir), time.time())
+        )
+        linha = self._con.execute(
+            "SELECT hash, chave, nome, offset, tamanho, comprimido FROM xmls WHERE hash = ?", (hash_arquivo,)
+        ).fetchone()
+        return EntradaAcervo(*linha[:5], bool(linha[5]))
+
+    # --------- Leitura ---------
+
+    def entrada(self, hash_ou_chave: str) -> Optional[EntradaAcervo]:
+        hash_arquivo = self._por_chave.get(hash_ou_chave, hash_ou_chave)
+        return self._por_hash.get(hash_arquivo)
+
+    def entradas(self) -> Iterator[EntradaAcervo]:
+        return iter(list(self._por_hash.values()))
+
+    def _visao(self, entrada: EntradaAcervo) -> memoryview:
+        fim = entrada.offset + entrada.tamanho
+        # O arquivo só cresce: remapeia quando o registro está além do trecho mapeado.
+        # O mapa anterior não é fechado aqui: fatias já entregues continuam válidas até serem liberadas.
+        if self._mapa is None or fim > len(self._mapa):
+            with open(self.caminho_dados, "rb") as f:
+                self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        cabecalho = CABECALHO.unpack_from(self._mapa, entrada.offset - CABECALHO.size)
+        if cabecalho[0] != MARCADOR or cabecalho[2] != entrada.tamanho:
+            raise ValueError(f"Registro corrompido no acervo (offset {entrada.offset})")
+        return memoryview(self._mapa)[entrada.offset:fim]
+
+    def visao(self, hash_ou_chave: str) -> Optional[Union[memoryview, bytes]]:
+        """Conteúdo armazenado; fatia do mmap sem cópia quando o registro não é comprimido"""
+        entrada = self.entrada(hash_ou_chave)
+        if entrada is None:
+            return None
+        with self._lock:
+            visao = self._visao(entrada)
+            return zlib.decompress(visao) if entrada.comprimido else visao
+
+    def obter(self, hash_ou_chave: str) -> Optional[bytes]:
+        """XML original (bytes) pelo hash do conteúdo ou pela chave de acesso"""
+        conteudo = self.visao(hash_ou_chave)
+        return bytes(conteudo) if isinstance(conteudo, memoryview) else conteudo
+
+    def fechar(self) -> None:
+        with self._lock:
+            if self._mapa is not None:
+                try:
+                    self._mapa.close()
+                except BufferError:
+                    pass  # ainda há fatias em uso; o mapa é liberado com elas
+                self._mapa = None
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+            self._con.close()
+
+    def estatisticas(self) -> Dict[str, int]:
+        tamanho = os.path.getsize(self.caminho_dados) if os.path.exists(self.caminho_dados) else 0
+        return {"xmls": len(self), "com_chave": len(self._por_chave), "bytes": tamanho}
@@ -0,0 +1,315 @@
+import math
+import os
+import pickle
+from collections import deque
+from datetime import date, datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from dinheiro import para_float, para_inteiro
+from models import NotaFiscal
+from produtos import CatalogoProdutos
+
+
+# Fator que torna o MAD comparável ao desvio-padrão em dados normais
+FATOR_MAD = 0.6745
+
+
+def _em_utc(data: datetime) -> datetime:
+    """Data sem fuso para comparação: horários com fuso são convertidos para UTC"""
+    if data.tzinfo is None:
+        return data
+    return data.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class EstimadorP2:
+    """Estimador P² (Jain & Chlamtac) de um quantil em fluxo, com memória constante"""
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.n = 0
+        self.q: List[float] = []          # alturas dos marcadores
+        self.pos: List[float] = []        # posições reais
+        self.pos_desejada: List[float] = []
+        self.incremento = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def adicionar(self, x: float) -> None:
+        self.n += 1
+        if self.n <= 5:
+            self.q.append(x)
+            self.q.sort()
+            if self.n == 5:
+                self.pos = [1.0, 2.0, 3.0, 4.0, 5.0]
+                p = self.p
+                self.pos_desejada = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+            return
+
+        q, pos = self.q, self.pos
+
+        # Localiza a célula da nova observação e ajusta os extremos
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.pos_desejada[i] += self.incremento[i]
+
+        # Ajusta os marcadores centrais com interpolação parabólica (ou linear)
+        for i in range(1, 4):
+            d = self.pos_desejada[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                sinal = 1 if d > 0 else -1
+                candidato = self._parabolico(i, sinal)
+                if not q[i - 1] < candidato < q[i + 1]:
+                    candidato = q[i] + sinal * (q[i + sinal] - q[i]) / (pos[i + sinal] - pos[i])
+                q[i] = candidato
+                pos[i] += sinal
+
+    def _parabolico(self, i: int, d: int) -> float:
+        q, n = self.q, self.pos
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def valor(self) -> Optional[float]:
+        if self.n == 0:
+            return None
+        if self.n < 5:
+            # Quantil exato enquanto houver poucas amostras
+            ordenados = sorted(self.q)
+            return ordenados[min(len(ordenados) - 1, int(round(self.p * (len(ordenados) - 1))))]
+        return self.q[2]
+
+
+class EstatisticaRobusta:
+    """Mediana e MAD incrementais de uma série de valores"""
+
+    def __init__(self):
+        self.mediana = EstimadorP2(0.5)
+        self.mad = EstimadorP2(0.5)
+
+    @property
+    def n(self) -> int:
+        return self.mediana.n
+
+    def z_robusto(self, x: float) -> Optional[float]:
+        """z-score robusto de x em relação ao histórico (None se indefinido)"""
+        mediana = self.mediana.valor
+        mad = self.mad.valor
+        if mediana is None or not mad:
+            return None
+        return FATOR_MAD * (x - mediana) / mad
+
+    def adicionar(self, x: float) -> None:
+        mediana = self.mediana.valor
+        self.mediana.adicionar(x)
+        if mediana is not None:
+            self.mad.adicionar(abs(x - mediana))
+
+
+class VolumeDiario:
+    """Volume diário de um emitente com média e variância exponenciais (EWMA)"""
+
+    def __init__(self, alfa: float = 0.2):
+        self.alfa = alfa
+        self.dia: Optional[date] = None
+        self.centavos_dia = 0  # soma exata do dia; média e variância são só estatística (float)
+        self.media: Optional[float] = None
+        self.variancia = 0.0
+        self.dias_fechados = 0
+
+    def __setstate__(self, estado: dict) -> None:
+        # Volumes gravados antes da soma em centavos guardavam o total do dia em float
+        if "total_dia" in estado:
+            estado["centavos_dia"] = round(estado.pop("total_dia") * 100)
+        self.__dict__.update(estado)
+
+    @property
+    def total_dia(self) -> float:
+        return para_float(self.centavos_dia)
+
+    def _fechar_dia(self) -> None:
+        x = self.total_dia
+        if self.media is None:
+            self.media = x
+        else:
+            desvio = x - self.media
+            self.media += self.alfa * desvio
+            self.variancia = (1 - self.alfa) * (self.variancia + self.alfa * desvio * desvio)
+        self.dias_fechados += 1
+
+    def adicionar(self, dia: date, centavos: int) -> bool:
+        """Acumula o valor (em centavos); retorna False para notas de dias já fechados"""
+        if self.dia is None:
+            self.dia = dia
+        elif dia > self.dia:
+            self._fechar_dia()
+            self.dia = dia
+            self.centavos_dia = 0
+        elif dia < self.dia:
+            return False
+        self.centavos_dia += centavos
+        return True
+
+    @property
+    def desvio(self) -> float:
+        return math.sqrt(self.variancia)
+
+
+class DetectorAnomalias:
+    """Detecção incremental de anomalias sobre o histórico de notas"""
+
+    def __init__(
+        self,
+        limite_z: float = 3.5,
+        min_amostras: int = 8,
+        fator_pico: float = 3.0,
+        min_dias: int = 5,
+        janela_duplicidade_min: float = 60.0
+    ):
+        self.limite_z = limite_z
+        self.min_amostras = min_amostras
+        self.fator_pico = fator_pico
+        self.min_dias = min_dias
+        self.janela_duplicidade_min = janela_duplicidade_min
+
+        self.precos: Dict[Tuple[str, str], EstatisticaRobusta] = {}
+        # Preço por produto canônico (todos os emitentes) e unidade comercial
+        self.catalogo = CatalogoProdutos()
+        self.precos_produto: Dict[Tuple[int, str], EstatisticaRobusta] = {}
+        self.volumes: Dict[str, VolumeDiario] = {}
+        self.recentes: Dict[Tuple[str, int], Deque[Tuple[datetime, str]]] = {}
+        self.total_notas = 0
+
+    def _verificar_precos(self, nota: NotaFiscal) -> List[str]:
+        alertas = []
+        for idx, produto in enumerate(nota.produtos):
+            chave = (nota.emitente.cnpj, produto.codigo or produto.ncm)
+            estatistica = self.precos.get(chave)
+            if estatistica is None:
+                estatistica = self.precos[chave] = EstatisticaRobusta()
+
+            preco = float(produto.valor_unitario)
+            alertou = False
+            if estatistica.n >= self.min_amostras:
+                z = estatistica.z_robusto(preco)
+                if z is not None and abs(z) > self.limite_z:
+                    referencia = estatistica.mediana.valor
+                    alertas.append(
+                        f"Produto {idx+1} ({produto.descricao}): preço unitário R$ {preco:,.2f} fora do padrão "
+                        f"do emitente (mediana R$ {referencia:,.2f}, z robusto {z:+.1f})"
+                    )
+                    alertou = True
+            estatistica.adicionar(preco)
+
+            # Mesmo produto em outros emitentes: cobre fornecedores novos e itens sem histórico próprio
+            cluster = self.catalogo.classificar(produto.descricao, produto.ncm)
+            chave_produto = (cluster.id, produto.unidade.upper())
+            estatistica = self.precos_produto.get(chave_produto)
+            if estatistica is None:
+                estatistica = self.precos_produto[chave_produto] = EstatisticaRobusta()
+            if not alertou and estatistica.n >= self.min_amostras:
+                z = estatistica.z_robusto(preco)
+                if z is not None and abs(z) > self.limite_z:
+                    alertas.append(
+                        f"Produto {idx+1} ({produto.descricao}): preço unitário R$ {preco:,.2f} fora do padrão "
+                        f"de mercado de \"{cluster.descricao}\" (mediana R$ {estatistica.mediana.valor:,.2f}, "
+                        f"z robusto {z:+.1f})"
+                    )
+            estatistica.adicionar(preco)
+        return alertas
+
+    def preco_produto(self, descricao: str, ncm: str = "", unidade: str = "") -> Optional[float]:
+        """Mediana do preço unitário do produto canônico correspondente (None se desconhecido)"""
+        cluster = self.catalogo.classificar(descricao, ncm, criar=False)
+        if cluster is None:
+            return None
+        estatistica = self.precos_produto.get((cluster.id, unidade.upper()))
+        return estatistica.mediana.valor if estatistica is not None else None
+
+    def _verificar_volume(self, nota: NotaFiscal) -> List[str]:
+        volume = self.volumes.get(nota.emitente.cnpj)
+        if volume is None:
+            volume = self.volumes[nota.emitente.cnpj] = VolumeDiario()
+
+        if not volume.adicionar(nota.data_emissao.date(), para_inteiro(nota.totalizadores.valor_total_nota)):
+            return []
+        if volume.dias_fechados < self.min_dias or not volume.media:
+            return []
+
+        limite = max(volume.media * self.fator_pico, volume.media + self.fator_pico * volume.desvio)
+        if volume.total_dia > limite:
+            return [
+                f"Pico de volume do emitente em {volume.dia.strftime('%d/%m/%Y')}: "
+                f"R$ {volume.total_dia:,.2f} no dia contra média de R$ {volume.media:,.2f}"
+            ]
+        return []
+
+    def _verificar_duplicidade(self, nota: NotaFiscal) -> List[str]:
+        centavos = para_inteiro(nota.totalizadores.valor_total_nota)
+        chave = (nota.emitente.cnpj, centavos)
+        recentes = self.recentes.get(chave)
+        if recentes is None:
+            recentes = self.recentes[chave] = deque(maxlen=5)
+
+        alertas = []
+        data = _em_utc(nota.data_emissao)
+        for data_anterior, chave_anterior in recentes:
+            minutos = abs((data - data_anterior).total_seconds()) / 60
+            if chave_anterior == nota.chave_acesso:
+                alertas.append("Nota já registrada anteriormente (mesma chave de acesso)")
+                break
+            if minutos <= self.janela_duplicidade_min:
+                alertas.append(
+                    f"Possível duplicidade: nota do mesmo emitente e mesmo valor emitida com "
+                    f"{minutos:.0f} min de diferença (chave {chave_anterior})"
+                )
+                break
+        recentes.append((data, nota.chave_acesso))
+        return alertas
+
+    def registrar(self, nota: NotaFiscal) -> List[str]:
+        """Avalia a nota contra o histórico e a incorpora; retorna os alertas"""
+        alertas = []
+        alertas.extend(self._verificar_duplicidade(nota))
+        alertas.extend(self._verificar_precos(nota))
+        alertas.extend(self._verificar_volume(nota))
+        self.total_notas += 1
+        return alertas
+
+    def registrar_lote(self, notas: List[NotaFiscal]) -> List[List[str]]:
+        """Registra notas em ordem de emissão (útil para reconstruir o histórico)"""
+        ordem = sorted(range(len(notas)), key=lambda i: _em_utc(notas[i].data_emissao))
+        alertas: List[List[str]] = [[] for _ in notas]
+        for i in ordem:
+            alertas[i] = self.registrar(notas[i])
+        return alertas
+
+    def salvar(self, caminho: str) -> None:
+        """Persiste o estado incremental (gravação atômica)"""
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: str, **kwargs) -> "DetectorAnomalias":
+        """Carrega o estado salvo ou cria um detector vazio"""
+        if os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                detector = pickle.load(f)
+            # Históricos salvos por versões anteriores ganham os atributos novos, vazios
+            for atributo, valor in cls(**kwargs).__dict__.items():
+                detector.__dict__.setdefault(atributo, valor)
+            return detector
+        return cls(**kwargs)
@@ -1,12 +1,34 @@
+import os
 import streamlit as st
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime
-import pandas as pd
-from extractor import NFeExtractor
-from validator import ValidadorInteligente
-from reporter import GeradorRelatorios
 from models import NotaFiscal
+from anomalias import DetectorAnomalias
+from diario import DiarioProcessamento, processar_arquivo
+from indice import IndiceNotas
+from cubo import CuboFiscal
+from acervo import AcervoXML
+from participantes import RegistroParticipantes
+from metricas import metricas
+from dinheiro import para_decimal, para_float
+
+# plotly, pandas, extractor, validator (Gemini) e reporter (reportlab) são
+# importados dentro das páginas que os usam, acelerando o carregamento inicial
+
+
+# Estado incremental do detector de anomalias, preservado entre sessões
+ARQUIVO_HISTORICO_ANOMALIAS = "historico_anomalias.pkl"
+
+# Diário de processamento: permite retomar um lote interrompido sem refazer etapas concluídas
+PASTA_DIARIO = "diario_processamento"
+
+# Acervo append-only com os XMLs originais (auditoria e reextração)
+PASTA_ACERVO = "acervo_xml"
+
+# Perfis de emitentes e destinatários, preservados entre sessões
+ARQUIVO_PARTICIPANTES = "participantes.pkl"
+
+# Perfis do modo de perfilamento (uma subpasta por processamento)
+PASTA_PERFIS = "perfis"
 
 
 # Configuração da página
@@ -64,58 +86,253 @@ def inicializar_sessao():
         st.session_state.notas_processadas = []
     if 'validacoes' not in st.session_state:
         st.session_state.validacoes = []
+    if 'detector_anomalias' not in st.session_state:
+        st.session_state.detector_anomalias = DetectorAnomalias.carregar(ARQUIVO_HISTORICO_ANOMALIAS)
+    if 'diario' not in st.session_state:
+        st.session_state.diario = DiarioProcessamento(PASTA_DIARIO)
+    if 'hashes_processados' not in st.session_state:
+        st.session_state.hashes_processados = set()
+    if 'indice_notas' not in st.session_state:
+        st.session_state.indice_notas = IndiceNotas()
+    if 'cubo' not in st.session_state:
+        st.session_state.cubo = CuboFiscal()
+    if 'acervo' not in st.session_state:
+        st.session_state.acervo = AcervoXML(PASTA_ACERVO)
+    if 'participantes' not in st.session_state:
+        st.session_state.participantes = RegistroParticipantes.carregar(ARQUIVO_PARTICIPANTES)
+
+
+def exibir_detalhes_nota(nota, validacao):
+    """Métricas, dados, produtos e validação de uma única nota"""
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Número", nota.numero)
+    with col2:
+        st.metric("Valor Total", f"R$ {nota.totalizadores.valor_total_nota:,.2f}")
+    with col3:
+        status = "✅ Válida" if validacao.valido else "⚠️ Pendente"
+        st.metric("Status", status)
+    with col4:
+        st.metric("Confiança", f"{validacao.score_confianca * 100:.1f}%")
+    
+    # Detalhes
+    tab1, tab2, tab3 = st.tabs(["📄 Dados", "✓ Validação", "🤖 Análise IA"])
+    
+    with tab1:
+        st.markdown("**Emitente:**")
+        st.text(f"{nota.emitente.razao_social} - CNPJ: {nota.emitente.cnpj}")
+    
+        st.markdown("**Destinatário:**")
+        st.text(f"{nota.destinatario.nome} - Doc: {nota.destinatario.cpf_cnpj}")
+        
+        xml_original = st.session_state.acervo.obter(nota.chave_acesso)
+        if xml_original is not None:
+            st.download_button(
+                label="⬇️ XML original",
+                data=xml_original,
+                file_name=f"{nota.chave_acesso}.xml",
+                mime="application/xml",
+                key=f"xml_{nota.chave_acesso}"
+            )
+    
+        st.markdown("**Produtos:**")
+        import pandas as pd
+        df_produtos = pd.DataFrame([
+            {
+                'Código': p.codigo,
+                'Descrição': p.descricao[:40] + '...' if len(p.descricao) > 40 else p.descricao,
+                'Qtd': float(p.quantidade),
+                'Valor Unit.': f"R$ {float(p.valor_unitario):.2f}",
+                'Total': f"R$ {float(p.valor_total):.2f}"
+            }
+            for p in nota.produtos
+        ])
+        st.dataframe(df_produtos, use_container_width=True)
+    
+    with tab2:
+        if validacao.inconsistencias:
+            st.markdown('<div class="error-box">', unsafe_allow_html=True)
+            st.markdown("**❌ Inconsistências:**")
+            for inc in validacao.inconsistencias:
+                st.markdown(f"- {inc}")
+            st.markdown('</div>', unsafe_allow_html=True)
+    
+        if validacao.alertas:
+            st.markdown('<div class="warning-box">', unsafe_allow_html=True)
+            st.markdown("**⚠️ Alertas:**")
+            for alerta in validacao.alertas:
+                st.markdown(f"- {alerta}")
+            st.markdown('</div>', unsafe_allow_html=True)
+    
+        if validacao.recomendacoes:
+            st.info("**💡 Recomendações:**\n" + "\n".join(f"- {r}" for r in validacao.recomendacoes))
+    
+        if not validacao.inconsistencias and not validacao.alertas:
+            st.markdown('<div class="success-box">', unsafe_allow_html=True)
+            st.markdown("✅ **Nenhuma inconsistência encontrada!**")
+            st.markdown('</div>', unsafe_allow_html=True)
+    
+    with tab3:
+        if validacao.analise_ia:
+            st.markdown(validacao.analise_ia)
+        else:
+            st.info("Análise de IA não disponível")
 
 
-def criar_graficos_dashboard(notas):
-    """Cria gráficos para o dashboard"""
-    if not notas:
+def exibir_lista_notas():
+    """Lista paginada das notas da sessão; o custo de renderização é o de uma página"""
+    from decimal import Decimal
+    from indice import ORDENACOES, paginar
+    import pandas as pd
+    
+    indice = st.session_state.indice_notas
+    indice.sincronizar(st.session_state.notas_processadas, st.session_state.validacoes)
+    data_min, data_max = indice.intervalo_datas()
+    
+    col1, col2, col3 = st.columns([2, 1, 2])
+    with col1:
+        emitente = st.text_input("Emitente (nome ou CNPJ)", key="filtro_emitente")
+    with col2:
+        status = st.selectbox("Status", ["Todas", "✅ Válidas", "⚠️ Pendentes"], key="filtro_status")
+    with col3:
+        periodo = st.date_input(
+            "Data de emissão",
+            value=(data_min, data_max),
+            key="filtro_periodo"
+        )
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        valor_min = st.number_input("Valor mínimo (R$)", min_value=0.0, value=0.0, step=100.0, key="filtro_valor_min")
+    with col2:
+        valor_max = st.number_input("Valor máximo (R$)", min_value=0.0, value=0.0, step=100.0, key="filtro_valor_max",
+                                    help="0 = sem limite")
+    with col3:
+        ordenar_por = st.selectbox("Ordenar por", list(ORDENACOES), key="ordenar_por")
+    with col4:
+        decrescente = st.toggle("Decrescente", key="ordem_decrescente")
+    with col5:
+        tamanho = st.selectbox("Por página", [10, 25, 50, 100], index=1, key="tamanho_pagina")
+    
+    # Período parcial (só a data inicial escolhida) filtra a partir dela
+    data_inicio = periodo[0] if len(periodo) > 0 else None
+    data_fim = periodo[1] if len(periodo) > 1 else None
+    resultado = indice.consultar(
+        emitente=emitente,
+        status={"Todas": None, "✅ Válidas": True, "⚠️ Pendentes": False}[status],
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        valor_min=Decimal(str(valor_min)) if valor_min else None,
+        valor_max=Decimal(str(valor_max)) if valor_max else None,
+        ordenar_por=ordenar_por,
+        decrescente=decrescente
+    )
+    
+    if not resultado:
+        st.info("Nenhuma nota corresponde aos filtros.")
+        return
+    
+    _, total_paginas = paginar(resultado, 1, tamanho)
+    if st.session_state.get("pagina_notas", 1) > total_paginas:
+        st.session_state.pagina_notas = 1  # filtros reduziram o número de páginas
+    pagina = st.number_input(
+        f"Página (de {total_paginas}) — {len(resultado)} nota(s)",
+        min_value=1,
+        max_value=total_paginas,
+        value=1,
+        key="pagina_notas"
+    )
+    itens, _ = paginar(resultado, pagina, tamanho)
+    
+    st.dataframe(
+        pd.DataFrame([
+            {
+                "NF-e": e.numero,
+                "Emitente": e.emitente,
+                "CNPJ": e.cnpj,
+                "Emissão": e.data_emissao.strftime("%d/%m/%Y"),
+                "Valor Total": f"R$ {e.valor_total:,.2f}",
+                "Status": "✅ Válida" if e.valido else "⚠️ Pendente",
+                "Confiança": f"{e.score * 100:.1f}%",
+            }
+            for e in itens
+        ]),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    # Só a nota escolhida monta métricas, abas e a tabela de produtos
+    por_posicao = {e.posicao: e for e in itens}
+    posicao = st.selectbox(
+        "Detalhar nota:",
+        list(por_posicao),
+        format_func=lambda p: f"NF-e {por_posicao[p].numero} - {por_posicao[p].emitente}",
+        key="nota_detalhada"
+    )
+    if posicao is not None:
+        with st.container(border=True):
+            exibir_detalhes_nota(st.session_state.notas_processadas[posicao], st.session_state.validacoes[posicao])
+
+
+# Dimensões do cubo oferecidas nos filtros cruzados e no agrupamento do dashboard
+DIMENSOES_DASHBOARD = {
+    "Emitente": "emitente",
+    "UF do emitente": "uf_emitente",
+    "UF do destinatário": "uf_destinatario",
+    "NCM": "ncm",
+    "CFOP": "cfop",
+    "Mês": "mes",
+}
+
+
+def criar_graficos_dashboard(cubo, filtros, agrupar_por="emitente"):
+    """Cria gráficos para o dashboard a partir do cubo (todas as notas que passam nos filtros)"""
+    if not len(cubo):
         return None, None, None
     
-    # Gráfico 1: Valores por Nota
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
+    rotulo = next(r for r, d in DIMENSOES_DASHBOARD.items() if d == agrupar_por)
+    
+    # Gráfico 1: Valores por dimensão (20 maiores)
+    grupos = cubo.agrupar([agrupar_por], filtros=filtros).head(20)
     fig_valores = go.Figure()
     fig_valores.add_trace(go.Bar(
-        x=[f"NF-e {n.numero}" for n in notas],
-        y=[float(n.totalizadores.valor_total_nota) for n in notas],
+        x=grupos[agrupar_por].astype(str),
+        y=grupos["valor_total"],
         name='Valor Total',
         marker_color='#1a237e'
     ))
     fig_valores.update_layout(
-        title="Valor Total por Nota Fiscal",
-        xaxis_title="Nota Fiscal",
+        title=f"Valor Total por {rotulo}",
+        xaxis_title=rotulo,
         yaxis_title="Valor (R$)",
         height=400
     )
     
     # Gráfico 2: Distribuição de Impostos
-    if notas:
-        nota_exemplo = notas[0]
-        impostos_data = {
-            'Imposto': ['ICMS', 'IPI', 'PIS', 'COFINS'],
-            'Valor': [
-                float(nota_exemplo.totalizadores.valor_icms),
-                float(nota_exemplo.totalizadores.valor_ipi),
-                float(nota_exemplo.totalizadores.valor_pis),
-                float(nota_exemplo.totalizadores.valor_cofins)
-            ]
-        }
-        fig_impostos = px.pie(
-            impostos_data,
-            values='Valor',
-            names='Imposto',
-            title='Distribuição de Impostos (Primeira Nota)',
-            color_discrete_sequence=px.colors.sequential.Blues_r
-        )
-    else:
-        fig_impostos = None
+    totais = cubo.totais_impostos(filtros)
+    impostos_data = {
+        'Imposto': ['ICMS', 'IPI', 'PIS', 'COFINS'],
+        'Valor': [totais['icms'], totais['ipi'], totais['pis'], totais['cofins']]
+    }
+    fig_impostos = px.pie(
+        impostos_data,
+        values='Valor',
+        names='Imposto',
+        title='Distribuição de Impostos',
+        color_discrete_sequence=px.colors.sequential.Blues_r
+    )
     
-    # Gráfico 3: Timeline de Emissões
-    datas = [n.data_emissao for n in notas]
-    valores = [float(n.totalizadores.valor_total_nota) for n in notas]
+    # Gráfico 3: Timeline de Emissões (por mês)
+    por_mes = cubo.agrupar(["mes"], filtros=filtros).sort_values("mes")
     
     fig_timeline = go.Figure()
     fig_timeline.add_trace(go.Scatter(
-        x=datas,
-        y=valores,
+        x=por_mes["mes"].astype(str),
+        y=por_mes["valor_total"],
         mode='lines+markers',
         name='Valor',
         line=dict(color='#667eea', width=3),
@@ -123,7 +340,7 @@ def criar_graficos_dashboard(notas):
     ))
     fig_timeline.update_layout(
         title="Timeline de Emissões",
-        xaxis_title="Data",
+        xaxis_title="Mês",
         yaxis_title="Valor (R$)",
         height=400
     )
@@ -131,6 +348,43 @@ def criar_graficos_dashboard(notas):
     return fig_valores, fig_impostos, fig_timeline
 
 
+def exibir_participantes(registro):
+    """Perfis acumulados de emitentes e destinatários, com destaque para os fornecedores novos"""
+    import pandas as pd
+    from datetime import timedelta
+    
+    st.markdown("---")
+    st.subheader("🏢 Participantes")
+    papel = st.radio("Perfis de", ["emitente", "destinatário"], horizontal=True, key="papel_participantes")
+    papel = "emitente" if papel == "emitente" else "destinatario"
+    perfis = registro.ranking(papel)
+    if not perfis:
+        st.info("Nenhum participante registrado.")
+        return
+    
+    ultima = max(p.ultima_emissao for p in perfis)
+    novos = {p.documento for p in registro.novos_desde(ultima - timedelta(days=30), papel)}
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Participantes", len(perfis))
+    with col2:
+        st.metric("Novos nos últimos 30 dias", len(novos), help="Primeira nota até 30 dias antes da nota mais recente")
+    
+    st.dataframe(pd.DataFrame([{
+        "Documento": p.documento,
+        "Nome": p.nome,
+        "Notas": p.notas,
+        "Valor Total": para_float(p.centavos_total),
+        "Ticket Médio": float(p.ticket_medio),
+        "Impostos": para_float(sum(p.centavos_impostos.values())),
+        "ICMS (%)": p.mix_impostos()["icms"] * 100,
+        "CFOPs Típicos": ", ".join(p.cfops_tipicos()),
+        "Primeira Nota": p.primeira_emissao.strftime("%d/%m/%Y"),
+        "Última Nota": p.ultima_emissao.strftime("%d/%m/%Y"),
+        "Novo": "🆕" if p.documento in novos else "",
+    } for p in perfis[:200]]), use_container_width=True, hide_index=True)
+
+
 def main():
     """Função principal da aplicação"""
     inicializar_sessao()
@@ -156,10 +410,28 @@ def main():
         st.markdown("### 📋 Menu")
         pagina = st.radio(
             "Selecione:",
-            ["📤 Upload e Processamento", "📊 Dashboard", "📈 Relatórios"],
+            ["📤 Upload e Processamento", "📊 Dashboard", "📈 Relatórios", "⏱️ Performance"],
             label_visibility="collapsed"
         )
         
+        metricas.habilitado = st.checkbox(
+            "Coletar métricas de desempenho",
+            value=metricas.habilitado,
+            help="Mede o tempo de cada etapa do pipeline (extração, validação, IA, relatórios)"
+        )
+        
+        perfilar = st.checkbox(
+            "Perfilar processamento",
+            value=False,
+            help="cProfile por etapa e pilhas amostradas (flame graph); deixa o processamento mais lento"
+        )
+        
+        extracao_tolerante = st.checkbox(
+            "Extração tolerante",
+            value=False,
+            help="Campos inválidos (CNPJ, valores, datas) viram inconsistências em vez de descartar a nota"
+        )
+        
         st.markdown("---")
         st.markdown("### 📚 Sobre")
         st.info(
@@ -201,113 +473,106 @@ def main():
             4. Visualize os resultados
             """)
         
+        # Retomada de um processamento anterior (ex.: processo reiniciado no meio de um lote)
+        diario = st.session_state.diario
+        resumo_diario = diario.resumo()
+        concluidas = resumo_diario["validado"] + resumo_diario["analisado_ia"]
+        if concluidas and not st.session_state.notas_processadas:
+            st.info(
+                f"📒 O diário de processamento tem {concluidas} nota(s) já processada(s)"
+                f" e {resumo_diario['com_falha']} com falha pendente. Reenvie os arquivos para"
+                " continuar de onde parou ou restaure os resultados já concluídos."
+            )
+            col_restaurar, col_limpar = st.columns(2)
+            with col_restaurar:
+                if st.button("♻️ Restaurar notas processadas", use_container_width=True):
+                    for entrada, nota, validacao in diario.concluidos():
+                        st.session_state.participantes.registrar(nota)
+                        st.session_state.hashes_processados.add(entrada.hash)
+                        st.session_state.notas_processadas.append(nota)
+                        st.session_state.validacoes.append(validacao)
+                        st.session_state.cubo.adicionar(nota, validacao)
+                    st.rerun()
+            with col_limpar:
+                if st.button("🗑️ Limpar diário", use_container_width=True):
+                    diario.limpar()
+                    st.rerun()
+        
         if uploaded_files and api_key:
             if st.button("🚀 Processar Notas Fiscais", type="primary", use_container_width=True):
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                extractor = NFeExtractor()
-                validador = ValidadorInteligente(api_key)
+                from extractor import NFeExtractor
+                from validator import ValidadorInteligente
+                
+                extractor = NFeExtractor(tolerante=extracao_tolerante)
+                validador = ValidadorInteligente(api_key, participantes=st.session_state.participantes)
                 
                 total_files = len(uploaded_files)
+                total_notas = 0
+                retomadas = 0
+                
+                if perfilar:
+                    from perfilador import ativar
+                    st.session_state.perfilador = ativar()
                 
                 for idx, uploaded_file in enumerate(uploaded_files):
                     try:
                         status_text.text(f"Processando {uploaded_file.name}...")
                         progress_bar.progress((idx + 1) / total_files)
                         
-                        # Extração
+                        # Extração, validação (com anomalias) e IA; etapas já registradas no diário são puladas
                         xml_content = uploaded_file.read()
-                        extractor.carregar_xml(xml_content)
-                        nota = extractor.extrair_nota_fiscal()
+                        processado = processar_arquivo(
+                            diario,
+                            xml_content,
+                            uploaded_file.name,
+                            extractor,
+                            validador,
+                            usar_ia=True,
+                            detector=st.session_state.detector_anomalias,
+                            acervo=st.session_state.acervo,
+                            participantes=st.session_state.participantes
+                        )
+                        retomadas += processado.retomado
+                        total_notas += len(processado.notas)
                         
-                        # Validação
-                        validacao = validador.validar_nota(nota)
-                        
-                        # Armazena resultados
-                        st.session_state.notas_processadas.append(nota)
-                        st.session_state.validacoes.append(validacao)
+                        # Armazena resultados (uma vez por arquivo, mesmo se reenviado); lotes enviNFe/nfeProc
+                        # trazem uma nota por NF-e
+                        if processado.hash not in st.session_state.hashes_processados:
+                            st.session_state.hashes_processados.add(processado.hash)
+                            for nota, validacao in zip(processado.notas, processado.validacoes):
+                                st.session_state.notas_processadas.append(nota)
+                                st.session_state.validacoes.append(validacao)
+                                st.session_state.cubo.adicionar(nota, validacao)
                         
                     except Exception as e:
                         st.error(f"Erro ao processar {uploaded_file.name}: {str(e)}")
                 
+                if perfilar:
+                    from perfilador import desativar
+                    desativar()
+                    pasta_perfil = os.path.join(PASTA_PERFIS, datetime.now().strftime("%Y%m%d_%H%M%S"))
+                    st.session_state.perfilador.salvar(pasta_perfil)
+                    st.info(f"🔬 Perfil gravado em {pasta_perfil} (detalhes na página Performance)")
+                
+                st.session_state.detector_anomalias.salvar(ARQUIVO_HISTORICO_ANOMALIAS)
+                st.session_state.participantes.salvar(ARQUIVO_PARTICIPANTES)
                 status_text.text("✅ Processamento concluído!")
-                st.success(f"**{total_files} nota(s) processada(s) com sucesso!**")
+                st.success(f"**{total_notas} nota(s) de {total_files} arquivo(s) processada(s) com sucesso!**")
+                if retomadas:
+                    st.info(f"{retomadas} arquivo(s) já estavam concluídos no diário e não foram reprocessados.")
+                if not validador.referencias.ncm_completa:
+                    from referencias import AVISO_NCM_PARCIAL
+                    st.info(AVISO_NCM_PARCIAL)
                 st.balloons()
         
-        # Exibe resultados
+        # Exibe resultados: filtros e ordenação sobre o índice, detalhes só da nota selecionada
         if st.session_state.notas_processadas:
             st.markdown("---")
             st.subheader("📋 Notas Processadas")
-            
-            for idx, (nota, validacao) in enumerate(zip(
-                st.session_state.notas_processadas,
-                st.session_state.validacoes
-            )):
-                with st.expander(f"NF-e {nota.numero} - {nota.emitente.razao_social}"):
-                    col1, col2, col3, col4 = st.columns(4)
-                    
-                    with col1:
-                        st.metric("Número", nota.numero)
-                    with col2:
-                        st.metric("Valor Total", f"R$ {nota.totalizadores.valor_total_nota:,.2f}")
-                    with col3:
-                        status = "✅ Válida" if validacao.valido else "⚠️ Pendente"
-                        st.metric("Status", status)
-                    with col4:
-                        st.metric("Confiança", f"{validacao.score_confianca * 100:.1f}%")
-                    
-                    # Detalhes
-                    tab1, tab2, tab3 = st.tabs(["📄 Dados", "✓ Validação", "🤖 Análise IA"])
-                    
-                    with tab1:
-                        st.markdown("**Emitente:**")
-                        st.text(f"{nota.emitente.razao_social} - CNPJ: {nota.emitente.cnpj}")
-                        
-                        st.markdown("**Destinatário:**")
-                        st.text(f"{nota.destinatario.nome} - Doc: {nota.destinatario.cpf_cnpj}")
-                        
-                        st.markdown("**Produtos:**")
-                        df_produtos = pd.DataFrame([
-                            {
-                                'Código': p.codigo,
-                                'Descrição': p.descricao[:40] + '...' if len(p.descricao) > 40 else p.descricao,
-                                'Qtd': float(p.quantidade),
-                                'Valor Unit.': f"R$ {float(p.valor_unitario):.2f}",
-                                'Total': f"R$ {float(p.valor_total):.2f}"
-                            }
-                            for p in nota.produtos
-                        ])
-                        st.dataframe(df_produtos, use_container_width=True)
-                    
-                    with tab2:
-                        if validacao.inconsistencias:
-                            st.markdown('<div class="error-box">', unsafe_allow_html=True)
-                            st.markdown("**❌ Inconsistências:**")
-                            for inc in validacao.inconsistencias:
-                                st.markdown(f"- {inc}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        if validacao.alertas:
-                            st.markdown('<div class="warning-box">', unsafe_allow_html=True)
-                            st.markdown("**⚠️ Alertas:**")
-                            for alerta in validacao.alertas:
-                                st.markdown(f"- {alerta}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        if validacao.recomendacoes:
-                            st.info("**💡 Recomendações:**\n" + "\n".join(f"- {r}" for r in validacao.recomendacoes))
-                        
-                        if not validacao.inconsistencias and not validacao.alertas:
-                            st.markdown('<div class="success-box">', unsafe_allow_html=True)
-                            st.markdown("✅ **Nenhuma inconsistência encontrada!**")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    with tab3:
-                        if validacao.analise_ia:
-                            st.markdown(validacao.analise_ia)
-                        else:
-                            st.info("Análise de IA não disponível")
+            exibir_lista_notas()
     
     # Página: Dashboard
     elif pagina == "📊 Dashboard":
@@ -316,8 +581,18 @@ def main():
         if not st.session_state.notas_processadas:
             st.warning("⚠️ Nenhuma nota processada. Faça upload de arquivos XML na página de Processamento.")
         else:
-            notas = st.session_state.notas_processadas
-            validacoes = st.session_state.validacoes
+            cubo = st.session_state.cubo
+            cubo.sincronizar(st.session_state.notas_processadas, st.session_state.validacoes)
+            
+            # Filtros cruzados: valem para as métricas e para todos os gráficos
+            with st.expander("🔎 Filtros", expanded=False):
+                filtros = {}
+                colunas = st.columns(3)
+                for i, (rotulo, dimensao) in enumerate(DIMENSOES_DASHBOARD.items()):
+                    with colunas[i % 3]:
+                        filtros[dimensao] = st.multiselect(rotulo, cubo.valores(dimensao), key=f"filtro_cubo_{dimensao}")
+            filtros = {d: v for d, v in filtros.items() if v}
+            notas_filtradas = cubo.filtrar_notas(filtros)
             
             # Métricas principais
             col1, col2, col3, col4 = st.columns(4)
@@ -325,12 +600,12 @@ def main():
             with col1:
                 st.metric(
                     "Total de Notas",
-                    len(notas),
+                    len(notas_filtradas),
                     help="Quantidade de notas processadas"
                 )
             
             with col2:
-                valor_total = sum(float(n.totalizadores.valor_total_nota) for n in notas)
+                valor_total = para_decimal(int(notas_filtradas["valor_total"].sum()))
                 st.metric(
                     "Valor Total",
                     f"R$ {valor_total:,.2f}",
@@ -338,11 +613,7 @@ def main():
                 )
             
             with col3:
-                impostos_total = sum(
-                    float(n.totalizadores.valor_icms + n.totalizadores.valor_ipi +
-                          n.totalizadores.valor_pis + n.totalizadores.valor_cofins)
-                    for n in notas
-                )
+                impostos_total = sum(cubo.totais_impostos(filtros).values())
                 st.metric(
                     "Total de Impostos",
                     f"R$ {impostos_total:,.2f}",
@@ -350,16 +621,19 @@ def main():
                 )
             
             with col4:
-                notas_validas = sum(1 for v in validacoes if v.valido)
+                notas_validas = int(notas_filtradas["valido"].sum())
                 st.metric(
                     "Notas Válidas",
-                    f"{notas_validas}/{len(notas)}",
+                    f"{notas_validas}/{len(notas_filtradas)}",
                     help="Notas sem inconsistências"
                 )
             
             # Gráficos
             st.markdown("---")
-            fig_valores, fig_impostos, fig_timeline = criar_graficos_dashboard(notas)
+            rotulo_agrupamento = st.selectbox("Agrupar por", list(DIMENSOES_DASHBOARD), key="agrupar_dashboard")
+            fig_valores, fig_impostos, fig_timeline = criar_graficos_dashboard(
+                cubo, filtros, DIMENSOES_DASHBOARD[rotulo_agrupamento]
+            )
             
             col1, col2 = st.columns(2)
             with col1:
@@ -371,6 +645,8 @@ def main():
             
             if fig_timeline:
                 st.plotly_chart(fig_timeline, use_container_width=True)
+            
+            exibir_participantes(st.session_state.participantes)
     
     # Página: Relatórios
     elif pagina == "📈 Relatórios":
@@ -392,8 +668,10 @@ def main():
                 """)
                 
                 if st.button("📥 Gerar Excel", use_container_width=True):
+                    from reporter import GeradorRelatorios
                     gerador = GeradorRelatorios()
-                    excel_data = gerador.gerar_excel(st.session_state.notas_processadas)
+                    st.session_state.cubo.sincronizar(st.session_state.notas_processadas, st.session_state.validacoes)
+                    excel_data = gerador.gerar_excel(st.session_state.notas_processadas, st.session_state.cubo)
                     
                     st.download_button(
                         label="⬇️ Download Excel",
@@ -402,6 +680,26 @@ def main():
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                         use_container_width=True
                     )
+                
+                if st.button("📦 Gerar NDJSON (.gz)", use_container_width=True):
+                    import io
+                    from exportacao import exportar_ndjson
+                    
+                    # Uma linha por nota com a validação; decimais exatos para integração com outros sistemas
+                    buffer = io.BytesIO()
+                    exportar_ndjson(
+                        zip(st.session_state.notas_processadas, st.session_state.validacoes),
+                        buffer,
+                        compressao="gzip"
+                    )
+                    
+                    st.download_button(
+                        label="⬇️ Download NDJSON",
+                        data=buffer.getvalue(),
+                        file_name=f"notas_fiscais_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz",
+                        mime="application/gzip",
+                        use_container_width=True
+                    )
             
             with col2:
                 st.subheader("📄 Relatório PDF")
@@ -418,6 +716,7 @@ def main():
                 )
                 
                 if st.button("📥 Gerar PDF", use_container_width=True):
+                    from reporter import GeradorRelatorios
                     gerador = GeradorRelatorios()
                     nota = st.session_state.notas_processadas[nota_selecionada]
                     validacao = st.session_state.validacoes[nota_selecionada]
@@ -432,6 +731,97 @@ def main():
                         use_container_width=True
                     )
     
+    # Página: Performance
+    elif pagina == "⏱️ Performance":
+        st.header("⏱️ Performance do Pipeline")
+        
+        resumo = metricas.resumo()
+        if not metricas.habilitado:
+            st.info("A coleta de métricas está desligada. Ative-a na barra lateral e processe algumas notas.")
+        
+        if resumo:
+            import pandas as pd
+            import plotly.express as px
+            
+            df_metricas = pd.DataFrame(resumo).rename(columns={
+                'etapa': 'Etapa', 'contagem': 'Chamadas', 'erros': 'Erros', 'total_ms': 'Total (ms)',
+                'media_ms': 'Média (ms)', 'p50_ms': 'p50 (ms)', 'p95_ms': 'p95 (ms)', 'p99_ms': 'p99 (ms)'
+            })
+            st.dataframe(
+                df_metricas.style.format(precision=2),
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            fig_etapas = px.bar(
+                df_metricas.sort_values('Total (ms)'),
+                x='Total (ms)',
+                y='Etapa',
+                orientation='h',
+                title='Tempo total por etapa'
+            )
+            st.plotly_chart(fig_etapas, use_container_width=True)
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.download_button(
+                    "⬇️ Prometheus",
+                    data=metricas.exportar_prometheus(),
+                    file_name="metricas_fiscal.prom",
+                    mime="text/plain",
+                    use_container_width=True
+                )
+            with col2:
+                st.download_button(
+                    "⬇️ JSON",
+                    data=metricas.exportar_json(),
+                    file_name="metricas_fiscal.json",
+                    mime="application/json",
+                    use_container_width=True
+                )
+            with col3:
+                if st.button("🗑️ Limpar métricas", use_container_width=True):
+                    metricas.limpar()
+                    st.rerun()
+        else:
+            st.warning("⚠️ Nenhuma métrica coletada ainda.")
+        
+        perfilador = st.session_state.get('perfilador')
+        if perfilador is not None:
+            import pandas as pd
+            
+            st.markdown("---")
+            st.subheader("🔬 Perfil do último processamento")
+            st.caption(
+                "Funções com maior tempo próprio. Chamadas do lxml e do pydantic-core são contadas na "
+                "função Python que as fez; a aritmética Decimal, na função que faz as contas."
+            )
+            df_hotspots = pd.DataFrame(perfilador.hotspots(25)).rename(columns={
+                'etapa': 'Etapa', 'funcao': 'Função', 'biblioteca': 'Biblioteca', 'chamadas': 'Chamadas',
+                'proprio_ms': 'Próprio (ms)', 'acumulado_ms': 'Acumulado (ms)'
+            })
+            st.dataframe(df_hotspots.style.format(precision=2), use_container_width=True, hide_index=True)
+            
+            df_bibliotecas = pd.DataFrame([
+                {'Etapa': etapa, 'Biblioteca': nome, 'Próprio (ms)': ms}
+                for etapa, tempos in perfilador.por_biblioteca().items()
+                for nome, ms in tempos.items()
+            ])
+            if not df_bibliotecas.empty:
+                st.dataframe(
+                    df_bibliotecas.pivot_table(index='Etapa', columns='Biblioteca', values='Próprio (ms)', fill_value=0)
+                    .style.format(precision=1),
+                    use_container_width=True
+                )
+            
+            st.download_button(
+                "⬇️ Pilhas colapsadas (flame graph)",
+                data=perfilador.pilhas_colapsadas(),
+                file_name="pilhas.collapsed",
+                mime="text/plain",
+                help="Abra em speedscope.app ou gere o SVG com flamegraph.pl"
+            )
+    
     # Footer
     st.markdown("---")
     st.markdown(
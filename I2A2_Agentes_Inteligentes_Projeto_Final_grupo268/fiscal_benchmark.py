@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sintetico import GeradorNFe, gerar_csvs
+from cubo import CASAS, CuboFiscal
+from dinheiro import CASAS_VALOR, para_decimal
+from extractor import NFeExtractor
+from models import Destinatario, Emitente, Endereco, Imposto, NotaFiscal, Produto, Totalizadores
+from participantes import RegistroParticipantes
+from validator import ValidadorInteligente
+from reporter import GeradorRelatorios
+
+
+# Pasta do agente de notas (para o benchmark de carga dos CSVs)
+PASTA_AGENTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Agente de Notas Fiscais")
+
+
+class ModeloFalso:
+    """Substituto determinístico do Gemini: mede o pipeline sem custo de rede"""
+
+    RESPOSTA = json.dumps({
+        "status": "válida",
+        "inconsistencias": [],
+        "alertas": [],
+        "recomendacoes": ["Nota analisada pelo modelo falso do benchmark"],
+    })
+
+    class _Resposta:
+        def __init__(self, text: str):
+            self.text = text
+
+    def generate_content(self, prompt: str):
+        return self._Resposta(self.RESPOSTA)
+
+
+class Cronometro:
+    """Acumula tempo e pico de memória (opcional) de uma etapa"""
+
+    def __init__(self, medir_memoria: bool = False):
+        self.medir_memoria = medir_memoria
+        self.segundos = 0.0
+        self.pico_bytes = 0
+
+    @contextmanager
+    def medir(self):
+        if self.medir_memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            if self.medir_memoria:
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.pico_bytes = max(self.pico_bytes, pico)
+
+    def resultado(self, quantidade: int) -> Dict:
+        resultado = {
+            "quantidade": quantidade,
+            "segundos": round(self.segundos, 6),
+            "por_segundo": round(quantidade / self.segundos, 2) if self.segundos else None,
+        }
+        if self.medir_memoria:
+            resultado["pico_mb"] = round(self.pico_bytes / 2**20, 2)
+        return resultado
+
+
+def _carregar_csvs_agente(pasta_csv: str):
+    """Importa o carregador do agente de notas; None se as dependências não estiverem instaladas"""
+    if PASTA_AGENTE not in sys.path:
+        sys.path.append(PASTA_AGENTE)
+    try:
+        from agent import carregar_csvs_de_zip
+    except ImportError:
+        return None
+    return carregar_csvs_de_zip(pasta_csv)
+
+
+def _construir_por_modelo(dados: Dict) -> NotaFiscal:
+    """Construção aninhada, um modelo validado por vez (como o extrator fazia antes)"""
+    return NotaFiscal(**{
+        **dados,
+        "emitente": Emitente(**{**dados["emitente"], "endereco": Endereco(**dados["emitente"]["endereco"])}),
+        "destinatario": Destinatario(
+            **{**dados["destinatario"], "endereco": Endereco(**dados["destinatario"]["endereco"])}
+        ),
+        "produtos": [Produto(**{**p, "impostos": Imposto(**p["impostos"])}) for p in dados["produtos"]],
+        "totalizadores": Totalizadores(**dados["totalizadores"]),
+    })
+
+
+# Medida do cubo -> campo do modelo, para conferir as somas em ponto fixo contra as somas Decimal
+CAMPOS_NOTA = {
+    "valor_total": "valor_total_nota", "valor_produtos": "valor_produtos",
+    "icms": "valor_icms", "ipi": "valor_ipi", "pis": "valor_pis", "cofins": "valor_cofins",
+}
+CAMPOS_ITEM = {"quantidade": "quantidade", "valor_unitario": "valor_unitario", "valor_total": "valor_total"}
+CAMPOS_IMPOSTO_ITEM = {"icms": "icms_valor", "ipi": "ipi_valor", "pis": "pis_valor", "cofins": "cofins_valor"}
+
+
+def _totais_decimal(notas: List[NotaFiscal]) -> Dict[str, Decimal]:
+    """Totais das notas somando os Decimal dos modelos (referência da agregação em inteiros)"""
+    return {
+        medida: sum((getattr(nota.totalizadores, campo) for nota in notas), Decimal("0"))
+        for medida, campo in CAMPOS_NOTA.items()
+    }
+
+
+def conferir_totais(notas: List[NotaFiscal], cubo: CuboFiscal, participantes: RegistroParticipantes) -> List[str]:
+    """Divergências entre as somas em ponto fixo (cubo, perfis) e as somas Decimal; vazio quando idênticas"""
+    divergencias = []
+
+    def conferir(origem: str, esperado: Decimal, obtido: Decimal) -> None:
+        if esperado != obtido:
+            divergencias.append(f"{origem}: Decimal {esperado} x ponto fixo {obtido}")
+
+    esperados = _totais_decimal(notas)
+    for medida, total in cubo.totais(tuple(CAMPOS_NOTA)).items():
+        conferir(f"notas.{medida}", esperados[medida], total)
+
+    itens = cubo.filtrar_itens()
+    produtos = [produto for nota in notas for produto in nota.produtos]
+    for medida, campo in {**CAMPOS_ITEM, **CAMPOS_IMPOSTO_ITEM}.items():
+        if medida in CAMPOS_IMPOSTO_ITEM:
+            esperado = sum((getattr(p.impostos, campo) for p in produtos), Decimal("0"))
+        else:
+            esperado = sum((getattr(p, campo) for p in produtos), Decimal("0"))
+        conferir(f"itens.{medida}", esperado, para_decimal(int(itens[medida].sum()), CASAS.get(medida, CASAS_VALOR)))
+
+    por_emitente: Dict[str, Decimal] = {}
+    for nota in notas:
+        cnpj = nota.emitente.cnpj
+        por_emitente[cnpj] = por_emitente.get(cnpj, Decimal("0")) + nota.totalizadores.valor_total_nota
+    for cnpj, esperado in por_emitente.items():
+        conferir(f"participantes.{cnpj}", esperado, participantes.emitente(cnpj).valor_total)
+    return divergencias
+
+
+def executar_escala(
+    escala: int,
+    seed: int = 42,
+    amostra_pdf: int = 20,
+    amostra_ia: int = 100,
+    limite_excel: int = 10000,
+    taxa_erros: float = 0.05,
+    medir_memoria: bool = False,
+    incluir_csv: bool = True,
+    amostra_construcao: int = 1000
+) -> Dict[str, Dict]:
+    """Executa todas as etapas do pipeline para `escala` notas sintéticas"""
+    etapas: Dict[str, Dict] = {}
+    gerador = GeradorNFe(seed=seed, taxa_erros=taxa_erros)
+
+    # Geração e extração intercaladas: os XMLs não ficam todos na memória
+    crono_geracao = Cronometro()
+    crono_extracao = Cronometro(medir_memoria)
+    notas = []
+    itens = 0
+    lote = gerador.gerar_lote(escala)
+    for _ in range(escala):
+        with crono_geracao.medir():
+            xml, _meta = next(lote)
+        with crono_extracao.medir():
+            extrator = NFeExtractor()
+            if not extrator.carregar_xml(xml):
+                raise RuntimeError("XML sintético inválido")
+            nota = extrator.extrair_nota_fiscal()
+        notas.append(nota)
+        itens += len(nota.produtos)
+    etapas["geracao"] = crono_geracao.resultado(escala)
+    etapas["extracao"] = crono_extracao.resultado(escala)
+    etapas["extracao"]["itens"] = itens
+
+    # Construção dos modelos a partir dos campos já normalizados: um modelo por nível x validação única
+    campos = [nota.model_dump() for nota in notas[:min(amostra_construcao, escala)]]
+    for etapa, construir in (("construcao_aninhada", _construir_por_modelo), ("construcao_unica", NotaFiscal.model_validate)):
+        crono = Cronometro()
+        with crono.medir():
+            for dados in campos:
+                construir(dados)
+        etapas[etapa] = crono.resultado(len(campos))
+    if etapas["construcao_unica"]["segundos"]:
+        etapas["construcao_unica"]["aceleracao"] = round(
+            etapas["construcao_aninhada"]["segundos"] / etapas["construcao_unica"]["segundos"], 2
+        )
+
+    # Agregação: cubo e perfis somam inteiros de ponto fixo; os totais têm de coincidir com as somas Decimal
+    crono = Cronometro(medir_memoria)
+    with crono.medir():
+        cubo = CuboFiscal.de_notas(notas)
+    etapas["cubo"] = crono.resultado(escala)
+    participantes = RegistroParticipantes()
+    for nota in notas:
+        participantes.registrar(nota)
+    divergencias = conferir_totais(notas, cubo, participantes)
+    if divergencias:
+        raise RuntimeError("Totais em ponto fixo divergem das somas Decimal: " + "; ".join(divergencias[:5]))
+    for etapa, totalizar in (("totais_decimal", lambda: _totais_decimal(notas)), ("totais_ponto_fixo", cubo.totais)):
+        crono = Cronometro()
+        with crono.medir():
+            for _ in range(10):  # a interface refaz os totais a cada interação
+                totalizar()
+        etapas[etapa] = crono.resultado(escala * 10)
+    if etapas["totais_ponto_fixo"]["segundos"]:
+        etapas["totais_ponto_fixo"]["aceleracao"] = round(
+            etapas["totais_decimal"]["segundos"] / etapas["totais_ponto_fixo"]["segundos"], 2
+        )
+
+    validador = ValidadorInteligente(api_key="", modelo=ModeloFalso())
+
+    crono = Cronometro(medir_memoria)
+    with crono.medir():
+        resultados = validador.validar_lote(notas, usar_ia=False)
+    etapas["validacao_lote"] = crono.resultado(escala)
+    etapas["validacao_lote"]["invalidas"] = sum(1 for r in resultados if not r.valido)
+
+    amostra = notas[:min(amostra_ia, escala)]
+    crono = Cronometro(medir_memoria)
+    with crono.medir():
+        validacoes = [validador.validar_nota(nota, usar_ia=True) for nota in amostra]
+    etapas["validacao_ia_falsa"] = crono.resultado(len(amostra))
+
+    relatorios = GeradorRelatorios()
+    notas_excel = notas[:min(limite_excel, escala)]
+    crono = Cronometro(medir_memoria)
+    with crono.medir():
+        excel = relatorios.gerar_excel(notas_excel)
+    etapas["excel"] = crono.resultado(len(notas_excel))
+    etapas["excel"]["bytes"] = len(excel)
+
+    crono = Cronometro(medir_memoria)
+    quantidade_pdf = min(amostra_pdf, len(validacoes))
+    with crono.medir():
+        for nota, validacao in zip(notas[:quantidade_pdf], validacoes):
+            relatorios.gerar_pdf_relatorio(nota, validacao)
+    etapas["pdf"] = crono.resultado(quantidade_pdf)
+
+    if incluir_csv:
+        with tempfile.TemporaryDirectory() as pasta:
+            gerar_csvs(pasta, escala, gerador=GeradorNFe(seed=seed, taxa_erros=taxa_erros))
+            crono = Cronometro(medir_memoria)
+            with crono.medir():
+                df = _carregar_csvs_agente(pasta)
+            if df is None:
+                etapas["csv_agente"] = {"ignorada": "dependências do agente de notas não instaladas"}
+            else:
+                etapas["csv_agente"] = crono.resultado(escala)
+                etapas["csv_agente"]["linhas"] = len(df)
+
+    return etapas
+
+
+def comparar(atual: Dict, referencia: Dict, tolerancia: float) -> List[str]:
+    """Lista as etapas cujo tempo piorou mais que `tolerancia` (fração) em relação à referência"""
+    regressoes = []
+    for escala, etapas in atual["escalas"].items():
+        etapas_ref = referencia.get("escalas", {}).get(escala, {})
+        for etapa, dados in etapas.items():
+            ref = etapas_ref.get(etapa, {})
+            if "segundos" not in dados or not ref.get("segundos"):
+                continue
+            variacao = dados["segundos"] / ref["segundos"] - 1
+            if variacao > tolerancia:
+                regressoes.append(
+                    f"{escala} notas / {etapa}: {ref['segundos']:.3f}s -> {dados['segundos']:.3f}s (+{variacao:.0%})"
+                )
+    return regressoes
+
+
+def _imprimir(resultado: Dict) -> None:
+    for escala, etapas in resultado["escalas"].items():
+        print(f"\n== {escala} notas ==")
+        for etapa, dados in etapas.items():
+            if "ignorada" in dados:
+                print(f"  {etapa:<20} ignorada ({dados['ignorada']})")
+                continue
+            linha = f"  {etapa:<20} {dados['quantidade']:>8} em {dados['segundos']:>9.3f}s"
+            if dados["por_segundo"]:
+                linha += f"  ({dados['por_segundo']:>10.1f}/s)"
+            if "pico_mb" in dados:
+                linha += f"  pico {dados['pico_mb']:.1f} MB"
+            if "aceleracao" in dados:
+                linha += f"  {dados['aceleracao']:.2f}x"
+            print(linha)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark reprodutível do pipeline fiscal com NF-e sintéticas")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--taxa-erros", type=float, default=0.05)
+    parser.add_argument("--amostra-pdf", type=int, default=20)
+    parser.add_argument("--amostra-ia", type=int, default=100)
+    parser.add_argument("--limite-excel", type=int, default=10000)
+    parser.add_argument("--amostra-construcao", type=int, default=1000, help="Notas usadas na comparação de construção dos modelos")
+    parser.add_argument("--memoria", action="store_true", help="Mede o pico de memória de cada etapa (mais lento)")
+    parser.add_argument("--sem-csv", action="store_true", help="Não mede a carga dos CSVs do agente de notas")
+    parser.add_argument("--saida", default="benchmark_resultados.json")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora máxima aceita (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    resultado = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "seed": args.seed,
+        "escalas": {},
+    }
+    for escala in args.escalas:
+        resultado["escalas"][str(escala)] = executar_escala(
+            escala,
+            seed=args.seed,
+            amostra_pdf=args.amostra_pdf,
+            amostra_ia=args.amostra_ia,
+            limite_excel=args.limite_excel,
+            taxa_erros=args.taxa_erros,
+            medir_memoria=args.memoria,
+            incluir_csv=not args.sem_csv,
+            amostra_construcao=args.amostra_construcao,
+        )
+
+    _imprimir(resultado)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            referencia = json.load(f)
+        regressoes = comparar(resultado, referencia, args.tolerancia)
+        if regressoes:
+            print("\nRegressões detectadas:")
+            for r in regressoes:
+                print(f"  {r}")
+            return 1
+        print("\nSem regressões em relação à referência")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+
+# Colunas gravadas por nota processada (uma linha por arquivo XML)
+COLUNAS = [
+    "hash", "arquivo", "chave_acesso", "numero", "serie", "data_emissao",
+    "emitente_cnpj", "emitente_nome", "destinatario_doc", "valor_total",
+    "valido", "score_confianca", "inconsistencias", "alertas", "recomendacoes",
+    "analise_ia", "erro", "nota_json", "processado_em",
+]
+
+
+# --------- Fontes de XML: pasta (recursiva) ou arquivo zip ---------
+
+def listar_xmls(fonte: str) -> Iterator[Tuple[str, bytes]]:
+    """Gera (nome, conteúdo) um arquivo por vez, sem carregar o lote inteiro"""
+    if zipfile.is_zipfile(fonte):
+        with zipfile.ZipFile(fonte) as arquivo_zip:
+            for nome in sorted(arquivo_zip.namelist()):
+                if nome.lower().endswith(".xml"):
+                    yield nome, arquivo_zip.read(nome)
+        return
+
+    if not os.path.isdir(fonte):
+        raise FileNotFoundError(f"Fonte não encontrada ou não suportada: {fonte}")
+    for raiz, pastas, arquivos in os.walk(fonte):
+        pastas.sort()
+        for nome in sorted(arquivos):
+            if nome.lower().endswith(".xml"):
+                caminho = os.path.join(raiz, nome)
+                with open(caminho, "rb") as f:
+                    yield os.path.relpath(caminho, fonte), f.read()
+
+
+# --------- Saídas com gravação incremental ---------
+
+class SaidaSQLite:
+    """Resultados em SQLite; o próprio banco serve de checkpoint (hash como chave)"""
+
+    def __init__(self, caminho: str):
+        self.con = sqlite3.connect(caminho)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        colunas = ", ".join(f"{c} TEXT" if c != "hash" else "hash TEXT PRIMARY KEY" for c in COLUNAS)
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS notas ({colunas})")
+        self.con.commit()
+
+    def hashes_processados(self) -> Set[str]:
+        return {linha[0] for linha in self.con.execute("SELECT hash FROM notas WHERE erro IS NULL")}
+
+    def gravar(self, linhas: List[Dict]) -> None:
+        marcadores = ", ".join("?" for _ in COLUNAS)
+        self.con.executemany(
+            f"INSERT OR REPLACE INTO notas ({', '.join(COLUNAS)}) VALUES ({marcadores})",
+            [[linha.get(c) for c in COLUNAS] for linha in linhas],
+        )
+        self.con.commit()
+
+    def fechar(self) -> None:
+        self.con.close()
+
+
+class SaidaNDJSON:
+    """Resultados em JSON Lines (.ndjson/.jsonl, opcionalmente .gz/.zst), no formato do módulo exportacao"""
+
+    def __init__(self, caminho: str):
+        from exportacao import abrir_escrita, ler_linhas
+
+        self.caminho = caminho
+        self._ler_linhas = ler_linhas
+        # Cada execução anexa um novo membro gzip / frame zstd ao arquivo
+        self.arquivo = abrir_escrita(caminho, anexar=True)
+
+    def hashes_processados(self) -> Set[str]:
+        from pydantic_core import from_json
+
+        if not os.path.getsize(self.caminho):
+            return set()
+        hashes = set()
+        for linha in self._ler_linhas(self.caminho):
+            registro = from_json(linha)
+            if not registro.get("erro"):
+                hashes.add(registro["hash"])
+        return hashes
+
+    def gravar(self, linhas: List[Dict]) -> None:
+        from pydantic_core import to_json
+
+        for linha in linhas:
+            registro = to_json({c: linha[c] for c in ("hash", "arquivo", "processado_em", "erro") if c in linha})
+            if linha.get("nota_json"):
+                # Os JSONs da nota e da validação já vêm prontos do worker: só são concatenados
+                registro = (
+                    registro[:-1] + b',"nota":' + linha["nota_json"].encode("utf-8")
+                    + b',"validacao":' + linha["validacao_json"].encode("utf-8") + b"}"
+                )
+            self.arquivo.write(registro + b"\n")
+        self.arquivo.flush()
+
+    def fechar(self) -> None:
+        self.arquivo.close()
+
+
+class SaidaParquet:
+    """Resultados em uma pasta de partes Parquet, uma por bloco gravado"""
+
+    def __init__(self, pasta: str):
+        import importlib.util
+        import pandas as pd
+
+        # Falha antes de processar qualquer arquivo se não houver engine Parquet
+        if not any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")):
+            raise ImportError("Saída Parquet requer pyarrow ou fastparquet (pip install pyarrow)")
+        self.pd = pd
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+        self.proxima_parte = len(self._partes())
+
+    def _partes(self) -> List[str]:
+        return sorted(p for p in os.listdir(self.pasta) if p.startswith("parte-") and p.endswith(".parquet"))
+
+    def hashes_processados(self) -> Set[str]:
+        hashes = set()
+        for parte in self._partes():
+            df = self.pd.read_parquet(os.path.join(self.pasta, parte), columns=["hash", "erro"])
+            hashes.update(df.loc[df["erro"].isna(), "hash"])
+        return hashes
+
+    def gravar(self, linhas: List[Dict]) -> None:
+        df = self.pd.DataFrame(linhas, columns=COLUNAS)
+        destino = os.path.join(self.pasta, f"parte-{self.proxima_parte:06d}.parquet")
+        # Grava em arquivo temporário e renomeia: uma parte nunca fica pela metade
+        df.to_parquet(destino + ".tmp", index=False)
+        os.replace(destino + ".tmp", destino)
+        self.proxima_parte += 1
+
+    def fechar(self) -> None:
+        pass
+
+
+def abrir_saida(caminho: str):
+    if caminho.endswith((".ndjson", ".jsonl")) or ".ndjson." in caminho or ".jsonl." in caminho:
+        return SaidaNDJSON(caminho)
+    if caminho.endswith(".parquet"):
+        return SaidaParquet(caminho)
+    if caminho.endswith((".db", ".sqlite", ".sqlite3")):
+        return SaidaSQLite(caminho)
+    raise ValueError(
+        "Saída deve terminar em .db/.sqlite (SQLite), .parquet (pasta de partes Parquet) "
+        "ou .ndjson/.jsonl (JSON Lines, opcionalmente .gz/.zst)"
+    )
+
+
+# --------- Processamento em paralelo (um bloco de arquivos por tarefa) ---------
+
+_WORKER: Dict[str, object] = {}
+
+
+def _inicializar_worker(
+    api_key: str,
+    usar_ia: bool,
+    pasta_pdf: Optional[str],
+    tolerante: bool = False,
+    pasta_perfil: Optional[str] = None
+) -> None:
+    from extractor import NFeExtractor
+    from validator import ModeloDesligado, ValidadorInteligente
+
+    _WORKER["perfilador"] = None
+    if pasta_perfil:
+        from perfilador import ativar
+        _WORKER["perfilador"] = ativar()
+        _WORKER["pasta_perfil"] = pasta_perfil
+
+    _WORKER["extrator"] = NFeExtractor(tolerante=tolerante)
+    _WORKER["validador"] = ValidadorInteligente(api_key, modelo=None if usar_ia else ModeloDesligado())
+    _WORKER["usar_ia"] = usar_ia
+    _WORKER["pasta_pdf"] = pasta_pdf
+    if pasta_pdf:
+        from reporter import GeradorRelatorios
+        _WORKER["relatorios"] = GeradorRelatorios()
+
+
+def _processar_bloco(bloco: List[Tuple[str, str, bytes]]) -> List[Dict]:
+    """Extrai cada arquivo do bloco e valida as notas extraídas em um único lote"""
+    try:
+        return _extrair_validar_bloco(bloco)
+    finally:
+        if _WORKER["perfilador"] is not None:
+            # Sem gancho de encerramento nos workers: o perfil acumulado é regravado a cada bloco
+            _WORKER["perfilador"].exportar(_WORKER["pasta_perfil"], str(os.getpid()))
+
+
+def _extrair_validar_bloco(bloco: List[Tuple[str, str, bytes]]) -> List[Dict]:
+    from exportacao import nota_para_json
+    from pydantic_core import to_json
+
+    extrator = _WORKER["extrator"]
+    validador = _WORKER["validador"]
+    agora = datetime.now().isoformat(timespec="seconds")
+
+    linhas, notas = [], []
+    for nome, hash_arquivo, conteudo in bloco:
+        linha = {"hash": hash_arquivo, "arquivo": nome, "processado_em": agora}
+        try:
+            extraidas = list(extrator.extrair_notas(conteudo))
+            if not extraidas:
+                raise ValueError("nenhuma NFe no arquivo")
+        except Exception as e:
+            linha["erro"] = f"extração: {e}"
+            linhas.append(linha)
+            continue
+        # Arquivos com várias NF-e (enviNFe, lotes de nfeProc) geram uma linha por nota;
+        # a primeira leva o hash do arquivo, que é o que marca o arquivo como processado
+        for indice, nota in enumerate(extraidas):
+            linha_nota = linha if indice == 0 else {**linha, "hash": f"{hash_arquivo}#{indice + 1}"}
+            notas.append((linha_nota, nota))
+            linhas.append(linha_nota)
+
+    if notas:
+        try:
+            validacoes = validador.validar_lote([nota for _, nota in notas], usar_ia=_WORKER["usar_ia"])
+        except Exception as e:
+            for linha, _ in notas:
+                linha["erro"] = f"validação: {e}"
+            return linhas
+
+        for (linha, nota), validacao in zip(notas, validacoes):
+            linha.update({
+                "chave_acesso": nota.chave_acesso,
+                "numero": nota.numero,
+                "serie": nota.serie,
+                "data_emissao": nota.data_emissao.isoformat(),
+                "emitente_cnpj": nota.emitente.cnpj,
+                "emitente_nome": nota.emitente.razao_social,
+                "destinatario_doc": nota.destinatario.cpf_cnpj,
+                "valor_total": str(nota.totalizadores.valor_total_nota),
+                "valido": str(int(validacao.valido)),
+                "score_confianca": f"{validacao.score_confianca:.2f}",
+                "inconsistencias": json.dumps(validacao.inconsistencias, ensure_ascii=False),
+                "alertas": json.dumps(validacao.alertas, ensure_ascii=False),
+                "recomendacoes": json.dumps(validacao.recomendacoes, ensure_ascii=False),
+                "analise_ia": validacao.analise_ia,
+                # Decimais como strings exatas (o model_dump_json os converteria para float)
+                "nota_json": nota_para_json(nota).decode("utf-8"),
+                "validacao_json": to_json(validacao.model_dump()).decode("utf-8"),
+            })
+            if _WORKER["pasta_pdf"]:
+                caminho_pdf = os.path.join(_WORKER["pasta_pdf"], f"{nota.chave_acesso or linha['hash']}.pdf")
+                with open(caminho_pdf, "wb") as f:
+                    f.write(_WORKER["relatorios"].gerar_pdf_relatorio(nota, validacao))
+    return linhas
+
+
+def _blocos_pendentes(
+    fonte: str,
+    concluidos: Set[str],
+    tamanho_bloco: int,
+    contadores: Dict[str, int],
+    receber: Optional[Callable[[str, str, bytes], None]] = None
+) -> Iterator[List[Tuple[str, str, bytes]]]:
+    bloco = []
+    for nome, conteudo in listar_xmls(fonte):
+        hash_arquivo = hashlib.sha256(conteudo).hexdigest()
+        if hash_arquivo in concluidos:
+            contadores["ignorados"] += 1
+            continue
+        concluidos.add(hash_arquivo)  # duplicatas dentro da mesma fonte são processadas uma vez
+        if receber is not None:
+            receber(nome, hash_arquivo, conteudo)
+        bloco.append((nome, hash_arquivo, conteudo))
+        if len(bloco) >= tamanho_bloco:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def _receber_arquivo(diario, recebidos: Dict[str, Tuple[str, bytes]], nome: str, hash_arquivo: str, conteudo: bytes) -> None:
+    """Registra o arquivo no diário e guarda seu conteúdo até o bloco ser concluído"""
+    if diario is not None:
+        diario.registrar(conteudo, nome)
+    recebidos[hash_arquivo] = (nome, conteudo)
+
+
+def _registrar_arquivos(linhas: List[Dict], recebidos: Dict[str, Tuple[str, bytes]], diario, acervo) -> None:
+    """Grava no diário e no acervo o resultado de cada arquivo, como processar_arquivo: permite a reextração"""
+    from validator import PREFIXO_ERRO_IA
+
+    por_arquivo: Dict[str, List[Dict]] = {}
+    for linha in linhas:
+        por_arquivo.setdefault(linha["hash"].split("#")[0], []).append(linha)
+
+    for hash_arquivo, linhas_arquivo in por_arquivo.items():
+        nome, conteudo = recebidos.pop(hash_arquivo)
+        erro = linhas_arquivo[0].get("erro")
+        if erro:
+            if diario is not None:
+                diario.falhar(hash_arquivo, "extraido" if erro.startswith("extração") else "validado", erro)
+            continue
+        notas = [json.loads(linha["nota_json"]) for linha in linhas_arquivo]
+        if acervo is not None:
+            acervo.guardar(conteudo, [nota["chave_acesso"] for nota in notas], nome)
+        if diario is not None:
+            validacoes = [json.loads(linha["validacao_json"]) for linha in linhas_arquivo]
+            erros_ia = [
+                v["analise_ia"] for v in validacoes
+                if v.get("analise_ia") and v["analise_ia"].startswith(PREFIXO_ERRO_IA)
+            ]
+            ia_concluida = all(v.get("analise_ia") for v in validacoes) and not erros_ia
+            diario.concluir_etapa(
+                hash_arquivo, "analisado_ia" if ia_concluida else "validado", {"notas": notas, "validacoes": validacoes}
+            )
+            if erros_ia:
+                diario.falhar(hash_arquivo, "analisado_ia", erros_ia[0])
+
+
+def processar_lote(
+    fonte: str,
+    saida: str,
+    workers: int = os.cpu_count() or 1,
+    tamanho_bloco: int = 32,
+    usar_ia: bool = False,
+    api_key: str = "",
+    pasta_pdf: Optional[str] = None,
+    arquivo_anomalias: Optional[str] = None,
+    silencioso: bool = False,
+    tolerante: bool = False,
+    arquivo_participantes: Optional[str] = None,
+    pasta_perfil: Optional[str] = None,
+    pasta_diario: Optional[str] = None,
+    pasta_acervo: Optional[str] = None
+) -> Dict[str, int]:
+    """Processa todos os XMLs de `fonte`, retomando do ponto em que uma execução anterior parou"""
+    destino = abrir_saida(saida)
+    concluidos = destino.hashes_processados()
+    contadores = {"ignorados": 0, "processados": 0, "erros": 0, "invalidas": 0}
+    if pasta_pdf:
+        os.makedirs(pasta_pdf, exist_ok=True)
+
+    from models import NotaFiscal
+
+    detector = None
+    if arquivo_anomalias:
+        from anomalias import DetectorAnomalias
+        detector = DetectorAnomalias.carregar(arquivo_anomalias)
+
+    participantes = None
+    if arquivo_participantes:
+        from participantes import RegistroParticipantes
+        participantes = RegistroParticipantes.carregar(arquivo_participantes)
+
+    # Diário e acervo ficam no processo principal (um único escritor de cada SQLite);
+    # o conteúdo de cada arquivo é mantido só enquanto seu bloco está em processamento
+    diario = acervo = None
+    recebidos: Dict[str, Tuple[str, bytes]] = {}
+    if pasta_diario:
+        from diario import DiarioProcessamento
+        diario = DiarioProcessamento(pasta_diario)
+    if pasta_acervo:
+        from acervo import AcervoXML
+        acervo = AcervoXML(pasta_acervo)
+    receber = partial(_receber_arquivo, diario, recebidos) if diario is not None or acervo is not None else None
+
+    pasta_brutos = None
+    if pasta_perfil:
+        # Perfis brutos de cada worker; consolidados em `pasta_perfil` ao final
+        pasta_brutos = os.path.join(pasta_perfil, "brutos")
+        os.makedirs(pasta_brutos, exist_ok=True)
+        for nome in os.listdir(pasta_brutos):
+            os.remove(os.path.join(pasta_brutos, nome))
+
+    inicio = time.perf_counter()
+
+    def registrar(linhas: List[Dict]) -> None:
+        for linha in linhas:
+            if linha.get("erro"):
+                contadores["erros"] += 1
+                continue
+            contadores["processados"] += 1
+            contadores["invalidas"] += linha["valido"] == "0"
+            if detector is not None or participantes is not None:
+                # Detector e perfis são incrementais e dependem da ordem: rodam no processo principal
+                nota = NotaFiscal.de_dict(json.loads(linha["nota_json"]))
+                alertas = json.loads(linha["alertas"])
+                if detector is not None:
+                    alertas.extend(detector.registrar(nota))
+                if participantes is not None:
+                    alertas.extend(participantes.sinais_risco(nota))
+                    participantes.registrar(nota)
+                linha["alertas"] = json.dumps(alertas, ensure_ascii=False)
+                validacao = json.loads(linha["validacao_json"])
+                validacao["alertas"] = alertas
+                linha["validacao_json"] = json.dumps(validacao, ensure_ascii=False)
+        if receber is not None:
+            # Antes da saída, que é o checkpoint: um arquivo interrompido aqui é refeito na próxima execução
+            _registrar_arquivos(linhas, recebidos, diario, acervo)
+        destino.gravar(linhas)
+        if not silencioso:
+            total = contadores["processados"] + contadores["erros"]
+            taxa = total / (time.perf_counter() - inicio)
+            print(f"\r{total} processado(s), {contadores['erros']} erro(s), {taxa:.1f} arquivos/s", end="", flush=True)
+
+    blocos = _blocos_pendentes(fonte, concluidos, tamanho_bloco, contadores, receber)
+    try:
+        if workers <= 1:
+            _inicializar_worker(api_key, usar_ia, pasta_pdf, tolerante, pasta_brutos)
+            for bloco in blocos:
+                registrar(_processar_bloco(bloco))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_inicializar_worker,
+                initargs=(api_key, usar_ia, pasta_pdf, tolerante, pasta_brutos),
+            ) as executor:
+                # Número limitado de blocos em voo: a leitura da fonte acompanha o processamento
+                pendentes = set()
+                for bloco in blocos:
+                    pendentes.add(executor.submit(_processar_bloco, bloco))
+                    if len(pendentes) >= workers * 2:
+                        prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                        for futuro in prontos:
+                            registrar(futuro.result())
+                for futuro in pendentes:
+                    registrar(futuro.result())
+    finally:
+        destino.fechar()
+        if acervo is not None:
+            acervo.fechar()
+        if detector is not None:
+            detector.salvar(arquivo_anomalias)
+        if participantes is not None:
+            participantes.salvar(arquivo_participantes)
+        if not silencioso:
+            print()
+        if pasta_perfil:
+            from perfilador import Perfilador, desativar
+
+            desativar()
+            perfil = Perfilador(amostrar=False).importar(pasta_brutos)
+            arquivos = perfil.salvar(pasta_perfil)
+            if not silencioso:
+                print(perfil.tabela(15), end="")
+                print(f"Perfil gravado em {pasta_perfil} (flame graph: {arquivos['pilhas']})")
+
+    contadores["segundos"] = round(time.perf_counter() - inicio, 3)
+    return contadores
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Processamento de NF-e em lote, sem interface gráfica")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_batch = sub.add_parser("batch", help="Extrai e valida todos os XMLs de uma pasta ou zip")
+    p_batch.add_argument("fonte", help="Pasta (percorrida recursivamente) ou arquivo .zip com XMLs")
+    p_batch.add_argument("--out", required=True, help="resultados.db (SQLite), resultados.parquet (pasta) ou resultados.ndjson[.gz|.zst]")
+    p_batch.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p_batch.add_argument("--bloco", type=int, default=32, help="Arquivos por tarefa enviada a um worker")
+    p_batch.add_argument("--ia", action="store_true", help="Inclui a análise com o Gemini (requer API key)")
+    p_batch.add_argument("--api-key", default=os.getenv("GOOGLE_API_KEY", ""))
+    p_batch.add_argument("--pdf", help="Pasta onde gravar um relatório PDF por nota")
+    p_batch.add_argument("--anomalias", help="Arquivo de histórico do detector de anomalias (ex.: historico_anomalias.pkl)")
+    p_batch.add_argument("--participantes", help="Arquivo de perfis de emitentes/destinatários (ex.: participantes.pkl)")
+    p_batch.add_argument("--tolerante", action="store_true", help="Campos inválidos viram inconsistências em vez de erro do arquivo")
+    p_batch.add_argument("--diario", default="diario_processamento", help="Pasta do diário de processamento")
+    p_batch.add_argument("--acervo", default="acervo_xml", help="Pasta do acervo de XMLs originais (usado na reextração)")
+    p_batch.add_argument("--sem-diario", action="store_true",
+                         help="Não registra os arquivos no diário nem guarda os XMLs no acervo (sem reextração)")
+    p_batch.add_argument("--perfil", nargs="?", const="", metavar="PASTA",
+                         help="Perfila o lote (cProfile + pilhas amostradas); padrão: <out>.perfil")
+    p_batch.add_argument("--silencioso", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.ia and not args.api_key:
+        parser.error("--ia requer --api-key ou a variável GOOGLE_API_KEY")
+
+    try:
+        resumo = processar_lote(
+            args.fonte,
+            args.out,
+            workers=args.workers,
+            tamanho_bloco=args.bloco,
+            usar_ia=args.ia,
+            api_key=args.api_key,
+            pasta_pdf=args.pdf,
+            arquivo_anomalias=args.anomalias,
+            silencioso=args.silencioso,
+            tolerante=args.tolerante,
+            arquivo_participantes=args.participantes,
+            pasta_perfil=(args.perfil or f"{args.out.rstrip(os.sep)}.perfil") if args.perfil is not None else None,
+            pasta_diario=None if args.sem_diario else args.diario,
+            pasta_acervo=None if args.sem_diario else args.acervo,
+        )
+    except ImportError as e:
+        # A saída é aberta antes do primeiro arquivo: sem pyarrow a saída Parquet falha aqui
+        parser.error(str(e))
+    print(json.dumps(resumo, ensure_ascii=False))
+    # Aviso único por execução, em vez de um alerta de NCM por produto
+    from referencias import AVISO_NCM_PARCIAL, obter_referencias
+    if not args.silencioso and not obter_referencias().ncm_completa:
+        print(AVISO_NCM_PARCIAL, file=sys.stderr)
+    return 1 if resumo["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
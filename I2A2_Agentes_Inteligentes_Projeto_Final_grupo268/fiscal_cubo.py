@@ -0,0 +1,219 @@
+from array import array
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from dinheiro import CASAS_QUANTIDADE, CASAS_UNITARIO, CASAS_VALOR, para_decimal, para_inteiro
+from models import NotaFiscal, ResultadoValidacao
+
+# pandas só é carregado na primeira consulta: a ingestão apenas anexa códigos e valores
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Dimensões (strings codificadas por dicionário) e medidas (inteiros de ponto fixo) de cada tabela
+DIMENSOES_NOTA = ("emitente", "cnpj_emitente", "uf_emitente", "uf_destinatario", "mes", "numero")
+DIMENSOES_ITEM = DIMENSOES_NOTA + ("ncm", "cfop", "codigo", "descricao")
+MEDIDAS_NOTA = ("valor_total", "valor_produtos", "icms", "ipi", "pis", "cofins")
+MEDIDAS_ITEM = ("quantidade", "valor_unitario", "valor_total", "icms", "ipi", "pis", "cofins")
+IMPOSTOS = ("icms", "ipi", "pis", "cofins")
+
+# Casas decimais de cada medida; as demais são valores em centavos
+CASAS = {"quantidade": CASAS_QUANTIDADE, "valor_unitario": CASAS_UNITARIO}
+
+# Dimensões que só existem por item: filtrá-las restringe as notas às que têm itens correspondentes
+SO_ITEM = ("ncm", "cfop", "codigo", "descricao")
+
+
+def _somar_int64(valores) -> int:
+    """Soma exata de um array int64: o numpy só é usado quando a soma não pode estourar 2^63"""
+    if not len(valores):
+        return 0
+    maior = max(abs(int(valores.max())), abs(int(valores.min())))
+    if maior * len(valores) < 2 ** 63:
+        # int() sobre o int64 do numpy: a conversão para Decimal não passa por float
+        return int(valores.sum())
+    return sum(map(int, valores))
+
+
+class _Tabela:
+    """Colunas de uma tabela de fatos: códigos inteiros por dimensão e arrays int64 de ponto fixo por medida"""
+
+    def __init__(self, dimensoes: Sequence[str], medidas: Sequence[str]):
+        self.dimensoes = {d: array("i") for d in dimensoes}
+        self.dicionarios: Dict[str, Dict[str, int]] = {d: {} for d in dimensoes}
+        self.medidas = {m: array("q") for m in medidas}
+        self.nota = array("i")  # posição da nota (chave de junção entre itens e notas)
+        self.valido = array("b")
+        self._frame = None
+
+    def __len__(self) -> int:
+        return len(self.nota)
+
+    def anexar(self, nota: int, valido: bool, dimensoes: Dict[str, str], medidas: Dict[str, Decimal]) -> None:
+        for nome, valor in dimensoes.items():
+            dicionario = self.dicionarios[nome]
+            codigo = dicionario.get(valor)
+            if codigo is None:
+                codigo = dicionario[valor] = len(dicionario)
+            self.dimensoes[nome].append(codigo)
+        for nome, valor in medidas.items():
+            self.medidas[nome].append(para_inteiro(valor, CASAS.get(nome, CASAS_VALOR)))
+        self.nota.append(nota)
+        self.valido.append(valido)
+        self._frame = None
+
+    def frame(self) -> "pd.DataFrame":
+        """DataFrame com colunas categóricas, montado a partir dos arrays e reaproveitado até novas notas"""
+        if self._frame is None:
+            import numpy as np
+            import pandas as pd
+
+            colunas = {"nota": np.asarray(self.nota, dtype=np.int32)}
+            for nome, codigos in self.dimensoes.items():
+                colunas[nome] = pd.Categorical.from_codes(
+                    np.asarray(codigos, dtype=np.int32), categories=list(self.dicionarios[nome])
+                )
+            for nome, valores in self.medidas.items():
+                colunas[nome] = np.asarray(valores, dtype=np.int64)
+            colunas["valido"] = np.asarray(self.valido, dtype=bool)
+            self._frame = pd.DataFrame(colunas)
+        return self._frame
+
+
+class CuboFiscal:
+    """Cubo colunar notas × itens, alimentado na ingestão e consultado com group-bys e filtros cruzados"""
+
+    def __init__(self):
+        self.notas = _Tabela(DIMENSOES_NOTA, MEDIDAS_NOTA)
+        self.itens = _Tabela(DIMENSOES_ITEM, MEDIDAS_ITEM)
+
+    def __len__(self) -> int:
+        return len(self.notas)
+
+    # --------- Ingestão ---------
+
+    def adicionar(self, nota: NotaFiscal, validacao: Optional[ResultadoValidacao] = None) -> None:
+        posicao = len(self.notas)
+        valido = validacao.valido if validacao is not None else True
+        t = nota.totalizadores
+        dimensoes = {
+            "emitente": nota.emitente.razao_social,
+            "cnpj_emitente": nota.emitente.cnpj,
+            "uf_emitente": nota.emitente.endereco.uf,
+            "uf_destinatario": nota.destinatario.endereco.uf,
+            "mes": nota.data_emissao.strftime("%Y-%m"),
+            "numero": nota.numero,
+        }
+        self.notas.anexar(posicao, valido, dimensoes, {
+            "valor_total": t.valor_total_nota,
+            "valor_produtos": t.valor_produtos,
+            "icms": t.valor_icms,
+            "ipi": t.valor_ipi,
+            "pis": t.valor_pis,
+            "cofins": t.valor_cofins,
+        })
+        for produto in nota.produtos:
+            i = produto.impostos
+            self.itens.anexar(posicao, valido, {
+                **dimensoes,
+                "ncm": produto.ncm,
+                "cfop": produto.cfop,
+                "codigo": produto.codigo,
+                "descricao": produto.descricao,
+            }, {
+                "quantidade": produto.quantidade,
+                "valor_unitario": produto.valor_unitario,
+                "valor_total": produto.valor_total,
+                "icms": i.icms_valor,
+                "ipi": i.ipi_valor,
+                "pis": i.pis_valor,
+                "cofins": i.cofins_valor,
+            })
+
+    def sincronizar(self, notas: Sequence[NotaFiscal], validacoes: Sequence[ResultadoValidacao] = ()) -> None:
+        """Adiciona só as notas ainda não ingeridas; recomeça se a lista da sessão foi reduzida"""
+        if len(self) > len(notas):
+            self.notas = _Tabela(DIMENSOES_NOTA, MEDIDAS_NOTA)
+            self.itens = _Tabela(DIMENSOES_ITEM, MEDIDAS_ITEM)
+        for posicao in range(len(self), len(notas)):
+            self.adicionar(notas[posicao], validacoes[posicao] if posicao < len(validacoes) else None)
+
+    @classmethod
+    def de_notas(cls, notas: Sequence[NotaFiscal], validacoes: Sequence[ResultadoValidacao] = ()) -> "CuboFiscal":
+        cubo = cls()
+        cubo.sincronizar(notas, validacoes)
+        return cubo
+
+    # --------- Consultas ---------
+
+    def valores(self, dimensao: str) -> List[str]:
+        """Valores distintos de uma dimensão (para os filtros da interface)"""
+        tabela = self.notas if dimensao in DIMENSOES_NOTA else self.itens
+        return sorted(tabela.dicionarios[dimensao])
+
+    @staticmethod
+    def em_reais(df: "pd.DataFrame") -> "pd.DataFrame":
+        """Cópia com as medidas de ponto fixo convertidas para float (R$, quantidade), para exibição"""
+        df = df.copy()
+        for coluna in df.columns:
+            if coluna in MEDIDAS_NOTA or coluna in MEDIDAS_ITEM:
+                df[coluna] = df[coluna] / 10 ** CASAS.get(coluna, CASAS_VALOR)
+        return df
+
+    @staticmethod
+    def _mascara(df: "pd.DataFrame", filtros: Dict[str, Sequence[str]]):
+        import numpy as np
+
+        mascara = np.ones(len(df), dtype=bool)
+        for dimensao, valores in filtros.items():
+            if valores and dimensao in df.columns:
+                mascara &= df[dimensao].isin(valores).to_numpy()
+        return mascara
+
+    def filtrar_itens(self, filtros: Optional[Dict[str, Sequence[str]]] = None) -> "pd.DataFrame":
+        """Itens que passam nos filtros, com as medidas em inteiros de ponto fixo (ver `em_reais`)"""
+        df = self.itens.frame()
+        return df[self._mascara(df, filtros)] if filtros else df
+
+    def filtrar_notas(self, filtros: Optional[Dict[str, Sequence[str]]] = None) -> "pd.DataFrame":
+        """Notas que passam nos filtros; filtros de item (NCM, CFOP...) mantêm as notas com algum item correspondente"""
+        df = self.notas.frame()
+        if not filtros:
+            return df
+        mascara = self._mascara(df, filtros)
+        if any(filtros.get(d) for d in SO_ITEM):
+            itens = self.filtrar_itens(filtros)
+            mascara &= df["nota"].isin(itens["nota"].unique()).to_numpy()
+        return df[mascara]
+
+    def agrupar(
+        self,
+        por: Sequence[str],
+        medidas: Sequence[str] = ("valor_total",) + IMPOSTOS,
+        filtros: Optional[Dict[str, Sequence[str]]] = None
+    ) -> "pd.DataFrame":
+        """Soma das medidas (em R$) por combinação das dimensões; usa itens se alguma dimensão ou filtro é de item"""
+        por = list(por)
+        usa_itens = any(d in SO_ITEM for d in por) or any((filtros or {}).get(d) for d in SO_ITEM)
+        df = self.filtrar_itens(filtros) if usa_itens else self.filtrar_notas(filtros)
+        resultado = df.groupby(por, observed=True)[list(medidas)].sum()
+        resultado["notas"] = df.groupby(por, observed=True)["nota"].nunique()
+        # Somas exatas em inteiros; a conversão para reais é feita uma vez por grupo
+        resultado = self.em_reais(resultado.reset_index())
+        return resultado.sort_values(list(medidas)[0], ascending=False)
+
+    def totais(
+        self,
+        medidas: Sequence[str] = ("valor_total",) + IMPOSTOS,
+        filtros: Optional[Dict[str, Sequence[str]]] = None
+    ) -> Dict[str, Decimal]:
+        """Totais exatos: dos totalizadores das notas, ou dos itens quando há filtro de item"""
+        if filtros and any(filtros.get(d) for d in SO_ITEM):
+            df = self.filtrar_itens(filtros)
+        else:
+            df = self.filtrar_notas(filtros)
+        return {m: para_decimal(_somar_int64(df[m].to_numpy()), CASAS.get(m, CASAS_VALOR)) for m in medidas}
+
+    def totais_impostos(self, filtros: Optional[Dict[str, Sequence[str]]] = None) -> Dict[str, float]:
+        """Total de cada imposto (R$): dos totalizadores das notas, ou dos itens quando há filtro de item"""
+        return {imposto: float(valor) for imposto, valor in self.totais(IMPOSTOS, filtros).items()}
@@ -0,0 +1,319 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from exportacao import registro_para_json
+from models import NotaFiscal, ResultadoValidacao
+
+
+# Etapas do pipeline, na ordem em que são concluídas
+ETAPAS = ("recebido", "extraido", "validado", "analisado_ia")
+
+
+def hash_conteudo(conteudo: bytes) -> str:
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def etapa_alcancada(etapa_atual: Optional[str], etapa: str) -> bool:
+    """True se `etapa_atual` já passou por `etapa`"""
+    if etapa_atual is None:
+        return False
+    return ETAPAS.index(etapa_atual) >= ETAPAS.index(etapa)
+
+
+def serializar(
+    notas: List[NotaFiscal],
+    validacoes: Optional[List[ResultadoValidacao]] = None
+) -> Dict[str, Any]:
+    """{"notas", "validacoes"} no formato do exportador NDJSON: decimais como strings exatas, não floats"""
+    pares = zip(notas, validacoes) if validacoes is not None else ((nota, None) for nota in notas)
+    registros = [json.loads(registro_para_json(nota, validacao)) for nota, validacao in pares]
+    dados: Dict[str, Any] = {"notas": [registro["nota"] for registro in registros]}
+    if validacoes is not None:
+        dados["validacoes"] = [registro["validacao"] for registro in registros]
+    return dados
+
+
+def notas_gravadas(resultado: Dict[str, Any]) -> Tuple[List[Dict], Optional[List[Dict]]]:
+    """(notas, validações) do resultado de um arquivo; aceita o formato antigo de uma nota por arquivo"""
+    if "notas" in resultado:
+        return resultado["notas"], resultado.get("validacoes")
+    if "nota" in resultado:
+        return [resultado["nota"]], [resultado["validacao"]] if "validacao" in resultado else None
+    return [], None
+
+
+class EntradaDiario(NamedTuple):
+    hash: str
+    nome: str
+    etapa: str
+    erro: Optional[str]
+    etapa_falha: Optional[str]
+    tentativas: int
+    resultado: Optional[str]
+
+
+class ArquivoProcessado(NamedTuple):
+    hash: str
+    notas: List[NotaFiscal]  # uma por NF-e do arquivo (enviNFe e lotes de nfeProc trazem várias)
+    validacoes: List[ResultadoValidacao]
+    retomado: bool  # nenhuma etapa precisou ser executada
+
+
+class DiarioProcessamento:
+    """Diário (write-ahead) do processamento: etapa alcançada e resultado de cada arquivo"""
+
+    def __init__(self, pasta: str = "diario_processamento"):
+        self.pasta = pasta
+        self.pasta_resultados = os.path.join(pasta, "resultados")
+        os.makedirs(self.pasta_resultados, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(os.path.join(pasta, "diario.sqlite"), timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS arquivos (
+                hash TEXT PRIMARY KEY,
+                nome TEXT NOT NULL,
+                etapa TEXT NOT NULL,
+                erro TEXT,
+                etapa_falha TEXT,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                resultado TEXT,
+                ordem INTEGER NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+        """)
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_etapa ON arquivos (etapa)")
+        colunas = {linha[1] for linha in self._con.execute("PRAGMA table_info(arquivos)")}
+        if "versao_extrator" not in colunas:
+            # Diários criados antes do controle de versão: as notas ficam marcadas como desatualizadas
+            self._con.execute("ALTER TABLE arquivos ADD COLUMN versao_extrator TEXT")
+        self._con.commit()
+
+    # --------- Registro das etapas ---------
+
+    def registrar(self, conteudo: bytes, nome: str) -> EntradaDiario:
+        """Registra o arquivo (se ainda não conhecido) e retorna sua entrada no diário"""
+        hash_arquivo = hash_conteudo(conteudo)
+        with self._lock:
+            self._con.execute(
+                "INSERT OR IGNORE INTO arquivos (hash, nome, etapa, ordem, atualizado_em) "
+                "VALUES (?, ?, 'recebido', (SELECT COALESCE(MAX(ordem), 0) + 1 FROM arquivos), ?)",
+                (hash_arquivo, nome, time.time())
+            )
+            self._con.commit()
+        return self.entrada(hash_arquivo)
+
+    def entrada(self, hash_arquivo: str) -> Optional[EntradaDiario]:
+        with self._lock:
+            linha = self._con.execute(
+                "SELECT hash, nome, etapa, erro, etapa_falha, tentativas, resultado FROM arquivos WHERE hash = ?",
+                (hash_arquivo,)
+            ).fetchone()
+        return EntradaDiario(*linha) if linha else None
+
+    def concluir_etapa(self, hash_arquivo: str, etapa: str, dados: Dict) -> None:
+        """Mescla `dados` ao resultado do arquivo, grava-o atomicamente e só então avança a etapa"""
+        caminho = os.path.join(self.pasta_resultados, f"{hash_arquivo}.json")
+        resultado = self._ler_json(caminho)
+        if "notas" in dados:
+            # Resultados gravados no formato antigo (uma nota por arquivo) são substituídos
+            resultado.pop("nota", None)
+            resultado.pop("validacao", None)
+        resultado.update(dados)
+
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+
+        with self._lock:
+            self._con.execute(
+                "UPDATE arquivos SET etapa = ?, erro = NULL, etapa_falha = NULL, resultado = ?, atualizado_em = ? "
+                "WHERE hash = ?",
+                (etapa, caminho, time.time(), hash_arquivo)
+            )
+            if dados.get("notas"):
+                self._con.execute(
+                    "UPDATE arquivos SET versao_extrator = ? WHERE hash = ?",
+                    (dados["notas"][0].get("versao_extrator"), hash_arquivo)
+                )
+            self._con.commit()
+
+    def marcar_versao(self, hashes: Iterable[str], versao: str) -> None:
+        """Marca notas cuja reextração não mudou nada como geradas pela versão atual (uma transação)"""
+        with self._lock:
+            self._con.executemany(
+                "UPDATE arquivos SET versao_extrator = ? WHERE hash = ?",
+                ((versao, hash_arquivo) for hash_arquivo in hashes)
+            )
+            self._con.commit()
+
+    def falhar(self, hash_arquivo: str, etapa: str, erro: str) -> None:
+        """Registra a falha de uma etapa; a etapa concluída anterior é preservada para a nova tentativa"""
+        with self._lock:
+            self._con.execute(
+                "UPDATE arquivos SET erro = ?, etapa_falha = ?, tentativas = tentativas + 1, atualizado_em = ? "
+                "WHERE hash = ?",
+                (erro, etapa, time.time(), hash_arquivo)
+            )
+            self._con.commit()
+
+    # --------- Leitura dos resultados ---------
+
+    @staticmethod
+    def _ler_json(caminho: Optional[str]) -> Dict:
+        if not caminho or not os.path.exists(caminho):
+            return {}
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+
+    def carregar(
+        self,
+        entrada: EntradaDiario
+    ) -> Tuple[Optional[List[NotaFiscal]], Optional[List[ResultadoValidacao]]]:
+        """Notas e validações já persistidas para o arquivo (None para etapas ainda não concluídas)"""
+        notas, validacoes = notas_gravadas(self._ler_json(entrada.resultado))
+        if not notas:
+            return None, None
+        return (
+            [NotaFiscal.de_dict(nota) for nota in notas],
+            [ResultadoValidacao.model_validate(v) for v in validacoes] if validacoes is not None else None,
+        )
+
+    def concluidos(self, etapa_final: str = "validado") -> Iterator[Tuple[EntradaDiario, NotaFiscal, ResultadoValidacao]]:
+        """Arquivos que alcançaram `etapa_final`, na ordem de chegada (para restaurar uma sessão)"""
+        etapas = ETAPAS[ETAPAS.index(etapa_final):]
+        marcadores = ", ".join("?" for _ in etapas)
+        with self._lock:
+            linhas = self._con.execute(
+                "SELECT hash, nome, etapa, erro, etapa_falha, tentativas, resultado FROM arquivos "
+                f"WHERE etapa IN ({marcadores}) ORDER BY ordem",
+                etapas
+            ).fetchall()
+        for linha in linhas:
+            entrada = EntradaDiario(*linha)
+            notas, validacoes = self.carregar(entrada)
+            if notas is not None and validacoes is not None:
+                for nota, validacao in zip(notas, validacoes):
+                    yield entrada, nota, validacao
+
+    def desatualizados(self, versao: str, forcar: bool = False) -> List[Tuple[str, str]]:
+        """(hash, arquivo de resultado) das notas extraídas por outra versão do extrator"""
+        etapas = ETAPAS[ETAPAS.index("extraido"):]
+        marcadores = ", ".join("?" for _ in etapas)
+        consulta = f"SELECT hash, resultado FROM arquivos WHERE etapa IN ({marcadores})"
+        parametros: Tuple = etapas
+        if not forcar:
+            consulta += " AND (versao_extrator IS NULL OR versao_extrator != ?)"
+            parametros += (versao,)
+        with self._lock:
+            return self._con.execute(consulta + " ORDER BY ordem", parametros).fetchall()
+
+    def resumo(self) -> Dict[str, int]:
+        """Quantidade de arquivos por etapa alcançada e com falha pendente"""
+        with self._lock:
+            por_etapa = dict(self._con.execute("SELECT etapa, COUNT(*) FROM arquivos GROUP BY etapa").fetchall())
+            falhas = self._con.execute("SELECT COUNT(*) FROM arquivos WHERE erro IS NOT NULL").fetchone()[0]
+        resumo = {etapa: por_etapa.get(etapa, 0) for etapa in ETAPAS}
+        resumo["com_falha"] = falhas
+        return resumo
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._con.execute("DELETE FROM arquivos")
+            self._con.commit()
+        for nome in os.listdir(self.pasta_resultados):
+            os.remove(os.path.join(self.pasta_resultados, nome))
+
+
+def _arquivar(acervo, hash_arquivo: str, conteudo: bytes, notas: List[NotaFiscal], nome: str) -> None:
+    # XML original guardado para auditoria e reextração
+    if acervo is not None and (hash_arquivo not in acervo or any(n.chave_acesso not in acervo for n in notas)):
+        acervo.guardar(conteudo, [nota.chave_acesso for nota in notas], nome)
+
+
+def _registrar_participantes(participantes, notas: List[NotaFiscal]) -> None:
+    # Perfis de emitente/destinatário; idempotente por chave de acesso (arquivos reenviados)
+    if participantes is not None:
+        for nota in notas:
+            participantes.registrar(nota)
+
+
+def _ia_pendente(validacao: ResultadoValidacao) -> bool:
+    from validator import PREFIXO_ERRO_IA
+    return validacao.analise_ia is None or validacao.analise_ia.startswith(PREFIXO_ERRO_IA)
+
+
+def processar_arquivo(
+    diario: DiarioProcessamento,
+    conteudo: bytes,
+    nome: str,
+    extrator,
+    validador,
+    usar_ia: bool = True,
+    detector=None,
+    acervo=None,
+    participantes=None
+) -> ArquivoProcessado:
+    """Executa só as etapas pendentes do arquivo, para cada NF-e que ele contém"""
+    # O resultado de cada etapa é gravado antes de a etapa ser marcada como concluída:
+    # uma execução interrompida não repete extrações, validações nem chamadas pagas ao Gemini.
+    # Falhas ficam registradas no diário; as de extração e validação são propagadas. A falha
+    # da IA não descarta as notas validadas: o erro vai para `analise_ia` e só essa etapa fica pendente.
+    from validator import PREFIXO_ERRO_IA
+
+    entrada = diario.registrar(conteudo, nome)
+    notas, validacoes = diario.carregar(entrada) if entrada.resultado else (None, None)
+    etapa_final = "analisado_ia" if usar_ia else "validado"
+    if etapa_alcancada(entrada.etapa, etapa_final) and notas is not None and validacoes is not None:
+        _arquivar(acervo, entrada.hash, conteudo, notas, nome)
+        _registrar_participantes(participantes, notas)
+        return ArquivoProcessado(entrada.hash, notas, validacoes, True)
+
+    etapa = "extraido"
+    try:
+        if notas is None:
+            notas = list(extrator.extrair_notas(conteudo))
+            if not notas:
+                raise ValueError("nenhuma NF-e encontrada no arquivo")
+            diario.concluir_etapa(entrada.hash, etapa, serializar(notas))
+        _arquivar(acervo, entrada.hash, conteudo, notas, nome)
+
+        etapa = "validado"
+        if validacoes is None:
+            validacoes = validador.validar_lote(notas, usar_ia=False)
+            if detector is not None:
+                for nota, validacao in zip(notas, validacoes):
+                    validacao.alertas.extend(detector.registrar(nota))
+            diario.concluir_etapa(entrada.hash, etapa, serializar(notas, validacoes))
+    except Exception as e:
+        diario.falhar(entrada.hash, etapa, str(e))
+        raise
+
+    etapa = "analisado_ia"
+    if usar_ia and not etapa_alcancada(entrada.etapa, etapa):
+        erros = []
+        for nota, validacao in zip(notas, validacoes):
+            if not _ia_pendente(validacao):
+                continue  # já analisada em uma tentativa anterior
+            try:
+                validacao.analise_ia = validador.validar_com_ia(nota)
+            except Exception as e:
+                validacao.analise_ia = f"{PREFIXO_ERRO_IA}: {e}"
+            if validacao.analise_ia.startswith(PREFIXO_ERRO_IA):
+                erros.append(validacao.analise_ia)
+        # Análises concluídas ficam gravadas mesmo se outra nota do arquivo falhou
+        diario.concluir_etapa(entrada.hash, "validado" if erros else etapa, serializar(notas, validacoes))
+        if erros:
+            diario.falhar(entrada.hash, etapa, erros[0])
+
+    # Só depois da validação: os sinais de risco comparam a nota com o histórico anterior a ela
+    _registrar_participantes(participantes, notas)
+    return ArquivoProcessado(entrada.hash, notas, validacoes, False)
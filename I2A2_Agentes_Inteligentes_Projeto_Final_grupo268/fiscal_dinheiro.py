@@ -0,0 +1,38 @@
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable
+
+
+# Casas decimais do leiaute da NF-e; valores são guardados como inteiros nessa escala
+CASAS_VALOR = 2        # vProd, vICMS, vNF... (13v2): centavos
+CASAS_QUANTIDADE = 4   # qCom/qTrib (11v0-4)
+CASAS_UNITARIO = 10    # vUnCom/vUnTrib (11v0-10); em int64 cabe até ~922 milhões por unidade
+
+_ESCALAS = {casas: 10 ** casas for casas in range(0, 11)}
+
+
+def para_inteiro(valor: Decimal, casas: int = CASAS_VALOR, exato: bool = False) -> int:
+    """Valor em unidades de 10^-casas (R$ 12,34 -> 1234 centavos), sem passar por float"""
+    # Fração irredutível: o denominador divide a escala exatamente quando o valor tem até `casas` casas
+    numerador, denominador = valor.as_integer_ratio()
+    escala = _ESCALAS[casas]
+    if escala % denominador == 0:
+        return numerador * (escala // denominador)
+    # Mais casas do que o leiaute permite: só acontece em notas malformadas (extração tolerante)
+    if exato:
+        raise ValueError(f"{valor} não cabe em {casas} casas decimais")
+    return int(valor.scaleb(casas).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def para_decimal(inteiro: int, casas: int = CASAS_VALOR) -> Decimal:
+    """Decimal exato do valor inteiro (1234 centavos -> Decimal('12.34'))"""
+    return Decimal(inteiro).scaleb(-casas)
+
+
+def para_float(inteiro: int, casas: int = CASAS_VALOR) -> float:
+    """Float mais próximo do valor (uma única divisão arredondada), para gráficos e planilhas"""
+    return inteiro / _ESCALAS[casas]
+
+
+def somar(valores: Iterable[Decimal], casas: int = CASAS_VALOR) -> int:
+    """Soma em inteiros de valores Decimal"""
+    return sum(para_inteiro(valor, casas) for valor in valores)
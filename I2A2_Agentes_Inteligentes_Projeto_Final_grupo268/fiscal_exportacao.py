@@ -0,0 +1,149 @@
+import gzip
+import io
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from pydantic_core import from_json, to_json
+
+from models import NotaFiscal, ResultadoValidacao
+
+
+# Formato: uma linha JSON por nota, {"nota": {...}, "validacao": {...} | null, ...campos extras}.
+# Decimais saem como strings exatas ("1234.50"), nunca como float; datas em ISO 8601.
+
+EXTENSOES_COMPRESSAO = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+Registro = Union[NotaFiscal, Tuple[NotaFiscal, Optional[ResultadoValidacao]]]
+
+
+def detectar_compressao(caminho: str) -> Optional[str]:
+    for extensao, compressao in EXTENSOES_COMPRESSAO.items():
+        if caminho.lower().endswith(extensao):
+            return compressao
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Compressão zstd requer o pacote zstandard (pip install zstandard)")
+    return zstandard
+
+
+def abrir_escrita(destino: Union[str, IO[bytes]], compressao: Optional[str] = None, anexar: bool = False) -> IO[bytes]:
+    """Arquivo binário para escrita, com compressão por nome de arquivo ou explícita"""
+    modo = "ab" if anexar else "wb"
+    if isinstance(destino, str):
+        compressao = compressao or detectar_compressao(destino)
+        if compressao == "gzip":
+            return gzip.open(destino, modo, compresslevel=6)
+        arquivo = open(destino, modo)
+    else:
+        arquivo = destino
+    if compressao == "gzip":
+        return gzip.GzipFile(fileobj=arquivo, mode=modo, compresslevel=6)
+    if compressao == "zstd":
+        return _zstandard().ZstdCompressor(level=3).stream_writer(arquivo, closefd=isinstance(destino, str))
+    if compressao:
+        raise ValueError(f"Compressão não suportada: {compressao} (use gzip ou zstd)")
+    return arquivo
+
+
+def abrir_leitura(origem: Union[str, IO[bytes]], compressao: Optional[str] = None) -> IO[bytes]:
+    """Arquivo binário para leitura linha a linha, descomprimindo sob demanda"""
+    if isinstance(origem, str):
+        compressao = compressao or detectar_compressao(origem)
+        if compressao == "gzip":
+            return gzip.open(origem, "rb")
+        arquivo = open(origem, "rb")
+    else:
+        arquivo = origem
+    if compressao == "gzip":
+        return gzip.GzipFile(fileobj=arquivo, mode="rb")
+    if compressao == "zstd":
+        # read_across_frames: arquivos anexados têm um frame por execução
+        leitor = _zstandard().ZstdDecompressor().stream_reader(
+            arquivo, read_across_frames=True, closefd=isinstance(origem, str)
+        )
+        return io.BufferedReader(leitor, buffer_size=1 << 20)
+    if compressao:
+        raise ValueError(f"Compressão não suportada: {compressao} (use gzip ou zstd)")
+    return arquivo
+
+
+# --------- Serialização de um registro ---------
+
+def nota_para_json(nota: NotaFiscal) -> bytes:
+    """JSON da nota com decimais exatos (o model_dump_json converte para float)"""
+    return to_json(nota.model_dump())
+
+
+def registro_para_json(
+    nota: NotaFiscal,
+    validacao: Optional[ResultadoValidacao] = None,
+    extras: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """Uma linha NDJSON (sem a quebra de linha)"""
+    registro = dict(extras) if extras else {}
+    registro["nota"] = nota.model_dump()
+    registro["validacao"] = validacao.model_dump() if validacao is not None else None
+    return to_json(registro)
+
+
+def registro_de_json(dados: Dict[str, Any]) -> Tuple[NotaFiscal, Optional[ResultadoValidacao]]:
+    validacao = dados.get("validacao")
+    return (
+        NotaFiscal.de_dict(dados["nota"]),
+        ResultadoValidacao.model_validate(validacao) if validacao is not None else None
+    )
+
+
+# --------- Exportação e importação em streaming ---------
+
+def exportar_ndjson(
+    registros: Iterable[Registro],
+    destino: Union[str, IO[bytes]],
+    compressao: Optional[str] = None,
+    anexar: bool = False
+) -> int:
+    """Grava notas (ou pares nota/validação) vindos de um iterador, uma linha por vez; retorna a quantidade"""
+    arquivo = abrir_escrita(destino, compressao, anexar)
+    quantidade = 0
+    try:
+        for registro in registros:
+            nota, validacao = registro if isinstance(registro, tuple) else (registro, None)
+            arquivo.write(registro_para_json(nota, validacao))
+            arquivo.write(b"\n")
+            quantidade += 1
+    finally:
+        if arquivo is not destino:
+            arquivo.close()
+    return quantidade
+
+
+def ler_linhas(origem: Union[str, IO[bytes]], compressao: Optional[str] = None) -> Iterator[bytes]:
+    """Linhas não vazias do arquivo, sem carregá-lo inteiro na memória"""
+    arquivo = abrir_leitura(origem, compressao)
+    try:
+        for linha in arquivo:
+            if linha.strip():
+                yield linha
+    finally:
+        if arquivo is not origem:
+            arquivo.close()
+
+
+def importar_ndjson(
+    origem: Union[str, IO[bytes]],
+    compressao: Optional[str] = None
+) -> Iterator[Tuple[NotaFiscal, Optional[ResultadoValidacao]]]:
+    """Reconstrói (nota, validação) linha a linha"""
+    for numero, linha in enumerate(ler_linhas(origem, compressao), start=1):
+        try:
+            dados = from_json(linha)
+            if dados.get("nota") is None:
+                continue  # arquivo que falhou no processamento em lote (só tem "erro")
+            registro = registro_de_json(dados)
+        except ValueError as e:
+            raise ValueError(f"Linha {numero} inválida: {e}")
+        yield registro
@@ -1,11 +1,18 @@
-from lxml import etree
+import io
 from decimal import Decimal
 from datetime import datetime
 from models import (
     NotaFiscal, Emitente, Destinatario, Endereco,
-    Produto, Imposto, Totalizadores
+    Produto, Totalizadores, Protocolo, ErroCampo, CONTEXTO_TOLERANTE
 )
-from typing import Optional
+from metricas import cronometrar, metricas
+from pydantic import BaseModel, ValidationError
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+
+# Incrementar a cada mudança no extrator ou nos modelos que altere o resultado da extração:
+# as notas gravadas com outra versão são refeitas a partir do XML original (ver fiscal_reextracao.py)
+VERSAO_EXTRATOR = "3"
 
 
 class NFeExtractor:
@@ -14,12 +21,19 @@ class NFeExtractor:
     # Namespace padrão da NF-e
     NS = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
     
-    def __init__(self):
+    def __init__(self, tolerante: bool = False):
         self.tree = None
         self.root = None
+        # No modo tolerante, campos inválidos não derrubam a nota: ficam em `erros_extracao`
+        self.tolerante = tolerante
+        self.erros: List[ErroCampo] = []
     
+    @cronometrar("extrator.parse_xml")
     def carregar_xml(self, xml_content: bytes) -> bool:
         """Carrega o XML da NF-e"""
+        from lxml import etree
+        
+        self.erros = []
         try:
             self.tree = etree.fromstring(xml_content)
             self.root = self.tree
@@ -27,25 +41,134 @@ class NFeExtractor:
         except Exception as e:
             raise ValueError(f"Erro ao carregar XML: {str(e)}")
     
+    def extrair_notas(self, origem: Union[bytes, BinaryIO]) -> Iterator[NotaFiscal]:
+        """Uma NotaFiscal por NFe de um arquivo com várias notas (enviNFe, lotes de nfeProc), lidas em streaming"""
+        from lxml import etree
+        
+        if isinstance(origem, (bytes, bytearray, memoryview)):
+            origem = io.BytesIO(origem)
+        ns = self.NS['nfe']
+        tag_nfe, tag_protocolo = f"{{{ns}}}NFe", f"{{{ns}}}protNFe"
+        
+        # No nfeProc o protNFe vem depois da NFe: a nota aguarda o próximo elemento antes de ser entregue.
+        # Protocolos que chegam antes da nota (ou de outra nota) ficam guardados pela chave.
+        pendente: Optional[NotaFiscal] = None
+        protocolos: Dict[str, Protocolo] = {}
+        try:
+            for _, elem in etree.iterparse(origem, events=("end",), tag=(tag_nfe, tag_protocolo), remove_blank_text=True):
+                if elem.tag == tag_protocolo:
+                    chave, dados = self._ler_protocolo(elem)
+                    protocolo = Protocolo(**dados)
+                    if pendente is not None and chave in ("", pendente.chave_acesso):
+                        pendente.protocolo = protocolo
+                        yield pendente
+                        pendente = None
+                    else:
+                        protocolos[chave] = protocolo
+                else:
+                    if pendente is not None:
+                        yield pendente
+                    # As XPaths relativas (.//nfe:...) ficam restritas à subárvore desta NFe
+                    self.root = self.tree = elem
+                    self.erros = []
+                    pendente = self.extrair_nota_fiscal()
+                    if pendente.chave_acesso in protocolos:
+                        pendente.protocolo = protocolos.pop(pendente.chave_acesso)
+                self._liberar(elem)
+        except etree.XMLSyntaxError as e:
+            raise ValueError(f"Erro ao carregar XML: {str(e)}")
+        if pendente is not None:
+            yield pendente
+    
+    @staticmethod
+    def _liberar(elem) -> None:
+        """Descarta a subárvore processada e os irmãos anteriores em todos os níveis (memória limitada)"""
+        elem.clear(keep_tail=False)
+        atual = elem
+        while atual is not None:
+            while atual.getprevious() is not None:
+                del atual.getparent()[0]
+            atual = atual.getparent()
+    
+    def _ler_protocolo(self, elem) -> Tuple[str, dict]:
+        """(chave, dados do protocolo) de um elemento protNFe"""
+        base = "nfe:infProt"
+        return self._get_text_from_elem(elem, f"{base}/nfe:chNFe"), dict(
+            numero=self._get_text_from_elem(elem, f"{base}/nfe:nProt"),
+            status=self._get_text_from_elem(elem, f"{base}/nfe:cStat"),
+            motivo=self._get_text_from_elem(elem, f"{base}/nfe:xMotivo") or None,
+            recebido_em=self._get_text_from_elem(elem, f"{base}/nfe:dhRecbto") or None
+        )
+    
     def _get_text(self, xpath: str, default: str = "") -> str:
         """Extrai texto de um elemento XML"""
         try:
             elem = self.root.xpath(xpath, namespaces=self.NS)
-            return elem[0].text if elem and elem[0].text else default
+            if not elem:
+                return default
+            # XPaths de atributo (ex.: infNFe/@Id) retornam a própria string
+            texto = elem[0] if isinstance(elem[0], str) else elem[0].text
+            return str(texto) if texto else default
         except:
             return default
     
-    def _get_decimal(self, xpath: str, default: float = 0.0) -> Decimal:
+    def _get_decimal(self, xpath: str, default: float = 0.0, campo: Optional[str] = None) -> Decimal:
         """Extrai valor decimal de um elemento XML"""
+        valor = self._get_text(xpath, str(default))
         try:
-            valor = self._get_text(xpath, str(default))
             return Decimal(valor)
         except:
+            self._registrar_erro(campo, valor, "valor numérico inválido")
             return Decimal(str(default))
     
+    def _registrar_erro(self, campo: Optional[str], valor, mensagem: str) -> None:
+        if self.tolerante and campo:
+            self.erros.append(ErroCampo(
+                campo=campo,
+                valor=None if valor is None else str(valor),
+                mensagem=mensagem
+            ))
+    
+    def _construir(self, modelo: Type[BaseModel], caminho: str, **campos):
+        """Valida o modelo; no modo tolerante registra os erros por campo e mantém os valores brutos"""
+        if not self.tolerante:
+            return modelo(**campos)
+        try:
+            return modelo(**campos)
+        except ValidationError as e:
+            for erro in e.errors():
+                local = ".".join(str(parte) for parte in erro["loc"])
+                self._registrar_erro(f"{caminho}.{local}" if caminho else local, erro.get("input"), erro["msg"])
+            return modelo.model_validate(campos, context=CONTEXTO_TOLERANTE)
+    
     def extrair_endereco(self, base_xpath: str) -> Endereco:
         """Extrai dados de endereço"""
-        return Endereco(
+        return Endereco(**self._dados_endereco(base_xpath))
+    
+    def extrair_emitente(self) -> Emitente:
+        """Extrai dados do emitente"""
+        return self._construir(Emitente, "emitente", **self._dados_emitente())
+    
+    def extrair_destinatario(self) -> Destinatario:
+        """Extrai dados do destinatário"""
+        return self._construir(Destinatario, "destinatario", **self._dados_destinatario())
+    
+    def extrair_produtos(self) -> list[Produto]:
+        """Extrai lista de produtos"""
+        return [
+            self._construir(Produto, f"produtos.{indice}", **dados)
+            for indice, dados in enumerate(self._dados_produtos())
+        ]
+    
+    def extrair_totalizadores(self) -> Totalizadores:
+        """Extrai totalizadores da nota"""
+        return self._construir(Totalizadores, "totalizadores", **self._dados_totalizadores())
+    
+    # --------- Leitura dos campos (dicionários já normalizados: str e Decimal) ---------
+    # A nota inteira é validada de uma vez pelo pydantic-core, sem um modelo Python por nível
+    
+    def _dados_endereco(self, base_xpath: str) -> dict:
+        return dict(
             logradouro=self._get_text(f"{base_xpath}/nfe:xLgr"),
             numero=self._get_text(f"{base_xpath}/nfe:nro"),
             bairro=self._get_text(f"{base_xpath}/nfe:xBairro"),
@@ -54,19 +177,19 @@ class NFeExtractor:
             cep=self._get_text(f"{base_xpath}/nfe:CEP")
         )
     
-    def extrair_emitente(self) -> Emitente:
-        """Extrai dados do emitente"""
+    @cronometrar("extrator.emitente")
+    def _dados_emitente(self) -> dict:
         base = ".//nfe:emit"
-        return Emitente(
+        return dict(
             cnpj=self._get_text(f"{base}/nfe:CNPJ"),
             razao_social=self._get_text(f"{base}/nfe:xNome"),
             nome_fantasia=self._get_text(f"{base}/nfe:xFant"),
-            endereco=self.extrair_endereco(f"{base}/nfe:enderEmit"),
+            endereco=self._dados_endereco(f"{base}/nfe:enderEmit"),
             inscricao_estadual=self._get_text(f"{base}/nfe:IE")
         )
     
-    def extrair_destinatario(self) -> Destinatario:
-        """Extrai dados do destinatário"""
+    @cronometrar("extrator.destinatario")
+    def _dados_destinatario(self) -> dict:
         base = ".//nfe:dest"
         
         # Tenta CNPJ primeiro, depois CPF
@@ -74,44 +197,43 @@ class NFeExtractor:
         if not cpf_cnpj:
             cpf_cnpj = self._get_text(f"{base}/nfe:CPF")
         
-        return Destinatario(
+        return dict(
             cpf_cnpj=cpf_cnpj,
             nome=self._get_text(f"{base}/nfe:xNome"),
-            endereco=self.extrair_endereco(f"{base}/nfe:enderDest"),
+            endereco=self._dados_endereco(f"{base}/nfe:enderDest"),
             inscricao_estadual=self._get_text(f"{base}/nfe:IE")
         )
     
-    def extrair_produtos(self) -> list[Produto]:
-        """Extrai lista de produtos"""
+    @cronometrar("extrator.produtos")
+    def _dados_produtos(self) -> list[dict]:
         produtos = []
         items = self.root.xpath(".//nfe:det", namespaces=self.NS)
         
-        for item in items:
+        for indice, item in enumerate(items):
             base = "nfe:prod"
             imposto_base = "nfe:imposto"
+            caminho = f"produtos.{indice}"
             
             # Extrai impostos
-            impostos = Imposto(
-                icms_base_calculo=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:ICMS//nfe:vBC"),
-                icms_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:ICMS//nfe:vICMS"),
-                ipi_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:IPI//nfe:vIPI"),
-                pis_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:PIS//nfe:vPIS"),
-                cofins_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:COFINS//nfe:vCOFINS")
+            impostos = dict(
+                icms_base_calculo=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:ICMS//nfe:vBC", f"{caminho}.impostos.icms_base_calculo"),
+                icms_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:ICMS//nfe:vICMS", f"{caminho}.impostos.icms_valor"),
+                ipi_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:IPI//nfe:vIPI", f"{caminho}.impostos.ipi_valor"),
+                pis_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:PIS//nfe:vPIS", f"{caminho}.impostos.pis_valor"),
+                cofins_valor=self._extrair_imposto_valor(item, f"{imposto_base}/nfe:COFINS//nfe:vCOFINS", f"{caminho}.impostos.cofins_valor")
             )
             
-            # Cria produto
-            produto = Produto(
+            produtos.append(dict(
                 codigo=self._get_text_from_elem(item, f"{base}/nfe:cProd"),
                 descricao=self._get_text_from_elem(item, f"{base}/nfe:xProd"),
                 ncm=self._get_text_from_elem(item, f"{base}/nfe:NCM"),
                 cfop=self._get_text_from_elem(item, f"{base}/nfe:CFOP"),
                 unidade=self._get_text_from_elem(item, f"{base}/nfe:uCom"),
-                quantidade=self._get_decimal_from_elem(item, f"{base}/nfe:qCom"),
-                valor_unitario=self._get_decimal_from_elem(item, f"{base}/nfe:vUnCom"),
-                valor_total=self._get_decimal_from_elem(item, f"{base}/nfe:vProd"),
+                quantidade=self._get_decimal_from_elem(item, f"{base}/nfe:qCom", f"{caminho}.quantidade"),
+                valor_unitario=self._get_decimal_from_elem(item, f"{base}/nfe:vUnCom", f"{caminho}.valor_unitario"),
+                valor_total=self._get_decimal_from_elem(item, f"{base}/nfe:vProd", f"{caminho}.valor_total"),
                 impostos=impostos
-            )
-            produtos.append(produto)
+            ))
         
         return produtos
     
@@ -123,38 +245,50 @@ class NFeExtractor:
         except:
             return ""
     
-    def _get_decimal_from_elem(self, elem, xpath: str) -> Decimal:
+    def _get_decimal_from_elem(self, elem, xpath: str, campo: Optional[str] = None) -> Decimal:
         """Extrai decimal de subelemento"""
+        valor = self._get_text_from_elem(elem, xpath)
         try:
-            valor = self._get_text_from_elem(elem, xpath)
             return Decimal(valor) if valor else Decimal('0.00')
         except:
+            self._registrar_erro(campo, valor, "valor numérico inválido")
             return Decimal('0.00')
     
-    def _extrair_imposto_valor(self, elem, xpath: str) -> Decimal:
+    def _extrair_imposto_valor(self, elem, xpath: str, campo: Optional[str] = None) -> Decimal:
         """Extrai valor de imposto"""
-        return self._get_decimal_from_elem(elem, xpath)
+        return self._get_decimal_from_elem(elem, xpath, campo)
     
-    def extrair_totalizadores(self) -> Totalizadores:
-        """Extrai totalizadores da nota"""
+    @cronometrar("extrator.totalizadores")
+    def _dados_totalizadores(self) -> dict:
         base = ".//nfe:total/nfe:ICMSTot"
         
-        return Totalizadores(
-            base_calculo_icms=self._get_decimal(f"{base}/nfe:vBC"),
-            valor_icms=self._get_decimal(f"{base}/nfe:vICMS"),
-            valor_ipi=self._get_decimal(f"{base}/nfe:vIPI"),
-            valor_pis=self._get_decimal(f"{base}/nfe:vPIS"),
-            valor_cofins=self._get_decimal(f"{base}/nfe:vCOFINS"),
-            valor_produtos=self._get_decimal(f"{base}/nfe:vProd"),
-            valor_frete=self._get_decimal(f"{base}/nfe:vFrete"),
-            valor_seguro=self._get_decimal(f"{base}/nfe:vSeg"),
-            valor_desconto=self._get_decimal(f"{base}/nfe:vDesc"),
-            valor_total_nota=self._get_decimal(f"{base}/nfe:vNF")
+        return dict(
+            base_calculo_icms=self._get_decimal(f"{base}/nfe:vBC", campo="totalizadores.base_calculo_icms"),
+            valor_icms=self._get_decimal(f"{base}/nfe:vICMS", campo="totalizadores.valor_icms"),
+            valor_ipi=self._get_decimal(f"{base}/nfe:vIPI", campo="totalizadores.valor_ipi"),
+            valor_pis=self._get_decimal(f"{base}/nfe:vPIS", campo="totalizadores.valor_pis"),
+            valor_cofins=self._get_decimal(f"{base}/nfe:vCOFINS", campo="totalizadores.valor_cofins"),
+            valor_produtos=self._get_decimal(f"{base}/nfe:vProd", campo="totalizadores.valor_produtos"),
+            valor_frete=self._get_decimal(f"{base}/nfe:vFrete", campo="totalizadores.valor_frete"),
+            valor_seguro=self._get_decimal(f"{base}/nfe:vSeg", campo="totalizadores.valor_seguro"),
+            valor_desconto=self._get_decimal(f"{base}/nfe:vDesc", campo="totalizadores.valor_desconto"),
+            valor_total_nota=self._get_decimal(f"{base}/nfe:vNF", campo="totalizadores.valor_total_nota")
         )
     
+    def _dados_protocolo(self) -> Optional[dict]:
+        """Protocolo do nfeProc, quando o XML é o documento autorizado (NFe + protNFe)"""
+        protocolo = self.root.xpath(".//nfe:protNFe", namespaces=self.NS)
+        return self._ler_protocolo(protocolo[0])[1] if protocolo else None
+    
+    @cronometrar("extrator.nota_fiscal")
     def extrair_nota_fiscal(self) -> NotaFiscal:
         """Extrai todos os dados da NF-e"""
         try:
+            # XPaths buscam a árvore inteira: um arquivo com várias notas seria mesclado
+            quantidade = int(self.root.xpath("count(.//nfe:infNFe)", namespaces=self.NS))
+            if quantidade > 1:
+                raise ValueError(f"arquivo com {quantidade} NF-e; use extrair_notas para lotes")
+            
             # Extrai chave de acesso
             chave = self._get_text(".//nfe:infNFe/@Id")
             chave = chave.replace("NFe", "") if chave else ""
@@ -168,20 +302,31 @@ class NFeExtractor:
             try:
                 data_emissao = datetime.fromisoformat(data_str.replace('Z', '+00:00'))
             except:
+                self._registrar_erro("data_emissao", data_str, "data de emissão inválida")
                 data_emissao = datetime.now()
             
-            # Cria objeto NotaFiscal
-            nota = NotaFiscal(
-                chave_acesso=chave,
-                numero=self._get_text(".//nfe:ide/nfe:nNF"),
-                serie=self._get_text(".//nfe:ide/nfe:serie"),
-                data_emissao=data_emissao,
-                emitente=self.extrair_emitente(),
-                destinatario=self.extrair_destinatario(),
-                produtos=self.extrair_produtos(),
-                totalizadores=self.extrair_totalizadores(),
-                informacoes_adicionais=self._get_text(".//nfe:infAdic/nfe:infCpl")
-            )
+            emitente = self._dados_emitente()
+            destinatario = self._dados_destinatario()
+            produtos = self._dados_produtos()
+            totalizadores = self._dados_totalizadores()
+            
+            # Cria objeto NotaFiscal (uma única validação para a árvore inteira)
+            with metricas.medir("extrator.modelo_nota"):
+                nota = self._construir(
+                    NotaFiscal, "",
+                    chave_acesso=chave,
+                    numero=self._get_text(".//nfe:ide/nfe:nNF"),
+                    serie=self._get_text(".//nfe:ide/nfe:serie"),
+                    data_emissao=data_emissao,
+                    emitente=emitente,
+                    destinatario=destinatario,
+                    produtos=produtos,
+                    totalizadores=totalizadores,
+                    informacoes_adicionais=self._get_text(".//nfe:infAdic/nfe:infCpl"),
+                    protocolo=self._dados_protocolo(),
+                    versao_extrator=VERSAO_EXTRATOR
+                )
+            nota.erros_extracao = list(self.erros)
             
             return nota
         except Exception as e:
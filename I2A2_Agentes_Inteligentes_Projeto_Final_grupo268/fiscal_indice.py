@@ -0,0 +1,115 @@
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from models import NotaFiscal, ResultadoValidacao
+
+
+class EntradaIndice(NamedTuple):
+    posicao: int  # posição da nota em notas_processadas / validacoes
+    numero: str
+    emitente: str
+    cnpj: str
+    data_emissao: datetime  # sem fuso, para ordenar notas com e sem fuso juntas
+    valor_total: Decimal
+    valido: bool
+    score: float
+
+
+def _chave_numero(entrada: EntradaIndice):
+    # Números de NF-e são strings: "10" deve vir depois de "9"
+    return (len(entrada.numero.lstrip("0")), entrada.numero.lstrip("0"))
+
+
+ORDENACOES: Dict[str, Callable[[EntradaIndice], object]] = {
+    "Ordem de processamento": lambda e: e.posicao,
+    "Data de emissão": lambda e: e.data_emissao,
+    "Valor total": lambda e: e.valor_total,
+    "Emitente": lambda e: e.emitente.casefold(),
+    "Número": _chave_numero,
+    "Confiança": lambda e: e.score,
+}
+
+
+class IndiceNotas:
+    """Índice leve das notas da sessão para filtrar, ordenar e paginar sem tocar nos modelos completos"""
+
+    def __init__(self):
+        self.entradas: List[EntradaIndice] = []
+        self._ordens: Dict[str, List[EntradaIndice]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entradas)
+
+    def sincronizar(self, notas: Sequence[NotaFiscal], validacoes: Sequence[ResultadoValidacao]) -> None:
+        """Indexa só as notas novas; reconstrói se a lista da sessão foi reduzida"""
+        if len(self.entradas) > len(notas):
+            self.entradas = []
+        if len(self.entradas) == len(notas):
+            return
+        for posicao in range(len(self.entradas), len(notas)):
+            nota, validacao = notas[posicao], validacoes[posicao]
+            self.entradas.append(EntradaIndice(
+                posicao=posicao,
+                numero=nota.numero,
+                emitente=nota.emitente.razao_social,
+                cnpj=nota.emitente.cnpj,
+                data_emissao=nota.data_emissao.replace(tzinfo=None),
+                valor_total=nota.totalizadores.valor_total_nota,
+                valido=validacao.valido,
+                score=validacao.score_confianca,
+            ))
+        self._ordens = {}
+
+    def _ordenadas(self, ordenar_por: str) -> List[EntradaIndice]:
+        # Cada ordenação é calculada uma vez e reaproveitada até chegarem notas novas
+        if ordenar_por not in self._ordens:
+            self._ordens[ordenar_por] = sorted(self.entradas, key=ORDENACOES[ordenar_por])
+        return self._ordens[ordenar_por]
+
+    def intervalo_datas(self) -> Tuple[Optional[date], Optional[date]]:
+        if not self.entradas:
+            return None, None
+        ordenadas = self._ordenadas("Data de emissão")
+        return ordenadas[0].data_emissao.date(), ordenadas[-1].data_emissao.date()
+
+    def consultar(
+        self,
+        emitente: str = "",
+        status: Optional[bool] = None,
+        data_inicio: Optional[date] = None,
+        data_fim: Optional[date] = None,
+        valor_min: Optional[Decimal] = None,
+        valor_max: Optional[Decimal] = None,
+        ordenar_por: str = "Ordem de processamento",
+        decrescente: bool = False
+    ) -> List[EntradaIndice]:
+        """Entradas que passam nos filtros, na ordem pedida; `emitente` busca na razão social e no CNPJ"""
+        busca = emitente.strip().casefold()
+        busca_cnpj = "".join(filter(str.isdigit, busca))
+        ordenadas = self._ordenadas(ordenar_por)
+        resultado = []
+        for entrada in (reversed(ordenadas) if decrescente else ordenadas):
+            if busca and busca not in entrada.emitente.casefold() and not (busca_cnpj and busca_cnpj in entrada.cnpj):
+                continue
+            if status is not None and entrada.valido != status:
+                continue
+            if data_inicio and entrada.data_emissao.date() < data_inicio:
+                continue
+            if data_fim and entrada.data_emissao.date() > data_fim:
+                continue
+            if valor_min is not None and entrada.valor_total < valor_min:
+                continue
+            if valor_max is not None and entrada.valor_total > valor_max:
+                continue
+            resultado.append(entrada)
+        return resultado
+
+
+def paginar(itens: Sequence, pagina: int, tamanho: int) -> Tuple[Sequence, int]:
+    """Fatia da página (1-based) e total de páginas"""
+    total_paginas = max(1, math.ceil(len(itens) / tamanho))
+    pagina = min(max(pagina, 1), total_paginas)
+    inicio = (pagina - 1) * tamanho
+    return itens[inicio:inicio + tamanho], total_paginas
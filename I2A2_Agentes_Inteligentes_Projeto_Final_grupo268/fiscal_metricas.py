@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Dict, List, Optional
+
+
+# Limites (em segundos) dos buckets exportados no formato Prometheus
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Amostras recentes mantidas por etapa para o cálculo de percentis
+TAMANHO_JANELA = 4096
+
+_NULO = nullcontext()
+
+
+class HistogramaEtapa:
+    """Contagem, erros, buckets e amostras recentes de duração de uma etapa"""
+
+    def __init__(self):
+        self.contagem = 0
+        self.erros = 0
+        self.soma = 0.0
+        self.buckets = [0] * (len(BUCKETS_SEGUNDOS) + 1)
+        self.amostras = deque(maxlen=TAMANHO_JANELA)
+
+    def observar(self, segundos: float, erro: bool) -> None:
+        self.contagem += 1
+        self.soma += segundos
+        if erro:
+            self.erros += 1
+        self.buckets[bisect_left(BUCKETS_SEGUNDOS, segundos)] += 1
+        self.amostras.append(segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        if not self.amostras:
+            return None
+        ordenadas = sorted(self.amostras)
+        return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))]
+
+
+class Metricas:
+    """Registro de tempos por etapa do pipeline (desligado por padrão)"""
+
+    def __init__(self, habilitado: bool = False):
+        self.habilitado = habilitado
+        self.perfilador = None  # Perfilador (módulo perfilador) notificado na entrada e saída de cada etapa
+        self._etapas: Dict[str, HistogramaEtapa] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, etapa: str, segundos: float, erro: bool = False) -> None:
+        with self._lock:
+            histograma = self._etapas.get(etapa)
+            if histograma is None:
+                histograma = self._etapas[etapa] = HistogramaEtapa()
+            histograma.observar(segundos, erro)
+
+    @property
+    def ativo(self) -> bool:
+        return self.habilitado or self.perfilador is not None
+
+    @contextmanager
+    def _medir(self, etapa: str):
+        perfilador = self.perfilador
+        if perfilador is not None:
+            perfilador.entrar(etapa, sys._getframe(2))  # frame de quem abriu a etapa
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            yield
+        except BaseException:
+            erro = True
+            raise
+        finally:
+            if self.habilitado:
+                self.registrar(etapa, time.perf_counter() - inicio, erro)
+            if perfilador is not None:
+                perfilador.sair()
+
+    def medir(self, etapa: str):
+        """Context manager que cronometra um bloco; sem custo quando desabilitado"""
+        if not self.ativo:
+            return _NULO
+        return self._medir(etapa)
+
+    def cronometrar(self, etapa: str):
+        """Decorador que cronometra cada chamada da função"""
+        def decorador(func):
+            @wraps(func)
+            def envoltorio(*args, **kwargs):
+                if not self.ativo:
+                    return func(*args, **kwargs)
+                with self._medir(etapa):
+                    return func(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._etapas.clear()
+
+    def resumo(self) -> List[dict]:
+        """Contagem, erros e percentis (ms) por etapa"""
+        with self._lock:
+            etapas = list(self._etapas.items())
+
+        linhas = []
+        for etapa, h in sorted(etapas):
+            linhas.append({
+                "etapa": etapa,
+                "contagem": h.contagem,
+                "erros": h.erros,
+                "total_ms": h.soma * 1000,
+                "media_ms": h.soma / h.contagem * 1000 if h.contagem else 0.0,
+                "p50_ms": (h.percentil(50) or 0.0) * 1000,
+                "p95_ms": (h.percentil(95) or 0.0) * 1000,
+                "p99_ms": (h.percentil(99) or 0.0) * 1000,
+            })
+        return linhas
+
+    def exportar_json(self) -> str:
+        return json.dumps({"etapas": self.resumo()}, ensure_ascii=False, indent=2)
+
+    def exportar_prometheus(self, prefixo: str = "fiscal_etapa") -> str:
+        """Exporta no formato texto do Prometheus (histograma + contador de erros)"""
+        with self._lock:
+            etapas = sorted(self._etapas.items())
+
+        linhas = [
+            f"# HELP {prefixo}_duracao_segundos Duração das etapas do pipeline fiscal",
+            f"# TYPE {prefixo}_duracao_segundos histogram",
+        ]
+        for etapa, h in etapas:
+            acumulado = 0
+            for limite, quantidade in zip(BUCKETS_SEGUNDOS, h.buckets):
+                acumulado += quantidade
+                linhas.append(f'{prefixo}_duracao_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+            linhas.append(f'{prefixo}_duracao_segundos_bucket{{etapa="{etapa}",le="+Inf"}} {h.contagem}')
+            linhas.append(f'{prefixo}_duracao_segundos_sum{{etapa="{etapa}"}} {h.soma}')
+            linhas.append(f'{prefixo}_duracao_segundos_count{{etapa="{etapa}"}} {h.contagem}')
+
+        linhas.append(f"# HELP {prefixo}_erros_total Chamadas que terminaram com exceção")
+        linhas.append(f"# TYPE {prefixo}_erros_total counter")
+        for etapa, h in etapas:
+            linhas.append(f'{prefixo}_erros_total{{etapa="{etapa}"}} {h.erros}')
+        return "\n".join(linhas) + "\n"
+
+
+# Instância global do processo; habilitada com FISCAL_METRICAS=1 ou pela interface
+metricas = Metricas(habilitado=os.getenv("FISCAL_METRICAS") == "1")
+cronometrar = metricas.cronometrar
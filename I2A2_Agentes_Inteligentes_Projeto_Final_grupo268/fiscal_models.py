@@ -1,9 +1,24 @@
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationInfo, field_serializer, field_validator
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from decimal import Decimal
 
 
+# Contexto de validação que aceita valores inválidos já registrados em `erros_extracao`
+CONTEXTO_TOLERANTE = {"tolerante": True}
+
+
+def _tolerante(info: ValidationInfo) -> bool:
+    return bool(info.context and info.context.get("tolerante"))
+
+
+class ErroCampo(BaseModel):
+    """Campo que não pôde ser extraído ou validado (modo tolerante)"""
+    campo: str  # caminho no modelo, ex.: "emitente.cnpj" ou "produtos.2.valor_total"
+    valor: Optional[str] = None
+    mensagem: str
+
+
 class Endereco(BaseModel):
     """Modelo de endereço"""
     logradouro: str
@@ -22,11 +37,14 @@ class Emitente(BaseModel):
     endereco: Endereco
     inscricao_estadual: Optional[str] = None
     
-    @validator('cnpj')
-    def validar_cnpj(cls, v):
+    @field_validator('cnpj')
+    @classmethod
+    def validar_cnpj(cls, v, info: ValidationInfo):
         # Remove caracteres não numéricos
         cnpj = ''.join(filter(str.isdigit, v))
         if len(cnpj) != 14:
+            if _tolerante(info):
+                return v
             raise ValueError('CNPJ deve ter 14 dígitos')
         return cnpj
 
@@ -38,10 +56,13 @@ class Destinatario(BaseModel):
     endereco: Endereco
     inscricao_estadual: Optional[str] = None
     
-    @validator('cpf_cnpj')
-    def validar_cpf_cnpj(cls, v):
+    @field_validator('cpf_cnpj')
+    @classmethod
+    def validar_cpf_cnpj(cls, v, info: ValidationInfo):
         doc = ''.join(filter(str.isdigit, v))
         if len(doc) not in [11, 14]:
+            if _tolerante(info):
+                return v
             raise ValueError('CPF deve ter 11 dígitos ou CNPJ 14 dígitos')
         return doc
 
@@ -54,10 +75,10 @@ class Imposto(BaseModel):
     pis_valor: Decimal = Field(default=Decimal('0.00'))
     cofins_valor: Decimal = Field(default=Decimal('0.00'))
     
-    class Config:
-        json_encoders = {
-            Decimal: lambda v: float(v)
-        }
+    # Valores saem como número no JSON (model_dump(mode="json") / model_dump_json)
+    @field_serializer('icms_base_calculo', 'icms_valor', 'ipi_valor', 'pis_valor', 'cofins_valor', when_used='json')
+    def serializar_valores(self, v: Decimal) -> float:
+        return float(v)
 
 
 class Produto(BaseModel):
@@ -72,10 +93,9 @@ class Produto(BaseModel):
     valor_total: Decimal
     impostos: Imposto
     
-    class Config:
-        json_encoders = {
-            Decimal: lambda v: float(v)
-        }
+    @field_serializer('quantidade', 'valor_unitario', 'valor_total', when_used='json')
+    def serializar_valores(self, v: Decimal) -> float:
+        return float(v)
 
 
 class Totalizadores(BaseModel):
@@ -91,10 +111,20 @@ class Totalizadores(BaseModel):
     valor_desconto: Decimal = Field(default=Decimal('0.00'))
     valor_total_nota: Decimal
     
-    class Config:
-        json_encoders = {
-            Decimal: lambda v: float(v)
-        }
+    @field_serializer(
+        'base_calculo_icms', 'valor_icms', 'valor_ipi', 'valor_pis', 'valor_cofins', 'valor_produtos',
+        'valor_frete', 'valor_seguro', 'valor_desconto', 'valor_total_nota', when_used='json'
+    )
+    def serializar_valores(self, v: Decimal) -> float:
+        return float(v)
+
+
+class Protocolo(BaseModel):
+    """Protocolo de autorização da SEFAZ (protNFe/infProt do nfeProc)"""
+    numero: str  # nProt
+    status: str  # cStat (100 = autorizado o uso)
+    motivo: Optional[str] = None
+    recebido_em: Optional[str] = None
 
 
 class NotaFiscal(BaseModel):
@@ -108,19 +138,45 @@ class NotaFiscal(BaseModel):
     produtos: List[Produto]
     totalizadores: Totalizadores
     informacoes_adicionais: Optional[str] = None
+    protocolo: Optional[Protocolo] = None
+    erros_extracao: List[ErroCampo] = Field(default_factory=list)
+    versao_extrator: Optional[str] = None  # versão do NFeExtractor que gerou a nota (None: anterior ao controle)
     
-    @validator('chave_acesso')
-    def validar_chave(cls, v):
+    @field_validator('chave_acesso')
+    @classmethod
+    def validar_chave(cls, v, info: ValidationInfo):
         chave = ''.join(filter(str.isdigit, v))
         if len(chave) != 44:
+            if _tolerante(info):
+                return v
             raise ValueError('Chave de acesso deve ter 44 dígitos')
         return chave
     
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat(),
-            Decimal: lambda v: float(v)
-        }
+    @classmethod
+    def de_dict(cls, dados: Dict[str, Any]) -> "NotaFiscal":
+        """Reconstrói uma nota serializada, aceitando os campos com erro de extração registrados"""
+        contexto = CONTEXTO_TOLERANTE if dados.get("erros_extracao") else None
+        return cls.model_validate(dados, context=contexto)
+    
+    def corrigir_campo(self, campo: str, valor: Any) -> "NotaFiscal":
+        """Corrige (e valida) um campo da nota, removendo-o de `erros_extracao`"""
+        partes = campo.split(".")
+        pai = self
+        for parte in partes[:-1]:
+            filho = pai[int(parte)] if isinstance(pai, list) else getattr(pai, parte)
+            if isinstance(filho, BaseModel):
+                # Emitente/destinatário podem ser compartilhados entre notas (RegistroParticipantes): copia antes de alterar
+                filho = filho.model_copy()
+                if isinstance(pai, list):
+                    pai[int(parte)] = filho
+                else:
+                    setattr(pai, parte, filho)
+            pai = filho
+        
+        # Valida apenas o campo atribuído, com os validadores do modelo que o contém
+        type(pai).__pydantic_validator__.validate_assignment(pai, partes[-1], valor)
+        self.erros_extracao = [e for e in self.erros_extracao if e.campo != campo]
+        return self
 
 
 class ResultadoValidacao(BaseModel):
@@ -0,0 +1,183 @@
+import os
+import pickle
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Set
+
+from dinheiro import para_decimal, para_inteiro
+from models import Destinatario, Emitente, NotaFiscal
+
+
+IMPOSTOS = ("icms", "ipi", "pis", "cofins")
+
+
+class PerfilParticipante:
+    """Perfil incremental de um emitente ou destinatário, atualizado a cada nota"""
+
+    def __init__(self, documento: str, nome: str):
+        self.documento = documento
+        self.nome = nome
+        self.notas = 0
+        # Acumulados em centavos: somas inteiras exatas, Decimal só na leitura
+        self.centavos_total = 0
+        self.centavos_impostos = {imposto: 0 for imposto in IMPOSTOS}
+        self.primeira_emissao: Optional[datetime] = None
+        self.ultima_emissao: Optional[datetime] = None
+        self.cfops: Counter = Counter()  # itens por CFOP
+
+    def registrar(self, nota: NotaFiscal) -> None:
+        t = nota.totalizadores
+        data = nota.data_emissao.replace(tzinfo=None)
+        self.notas += 1
+        self.centavos_total += para_inteiro(t.valor_total_nota)
+        impostos = self.centavos_impostos
+        impostos["icms"] += para_inteiro(t.valor_icms)
+        impostos["ipi"] += para_inteiro(t.valor_ipi)
+        impostos["pis"] += para_inteiro(t.valor_pis)
+        impostos["cofins"] += para_inteiro(t.valor_cofins)
+        if self.primeira_emissao is None or data < self.primeira_emissao:
+            self.primeira_emissao = data
+        if self.ultima_emissao is None or data > self.ultima_emissao:
+            self.ultima_emissao = data
+        self.cfops.update(produto.cfop for produto in nota.produtos)
+
+    def __setstate__(self, estado: dict) -> None:
+        # Perfis gravados antes dos acumulados em centavos guardavam Decimal
+        if "valor_total" in estado:
+            estado["centavos_total"] = para_inteiro(estado.pop("valor_total"))
+            estado["centavos_impostos"] = {i: para_inteiro(v) for i, v in estado.pop("impostos").items()}
+        self.__dict__.update(estado)
+
+    @property
+    def valor_total(self) -> Decimal:
+        return para_decimal(self.centavos_total)
+
+    @property
+    def impostos(self) -> Dict[str, Decimal]:
+        return {imposto: para_decimal(valor) for imposto, valor in self.centavos_impostos.items()}
+
+    @property
+    def ticket_medio(self) -> Decimal:
+        return self.valor_total / self.notas if self.notas else Decimal("0")
+
+    def mix_impostos(self) -> Dict[str, float]:
+        """Participação de cada imposto no total de impostos do participante"""
+        total = sum(self.centavos_impostos.values())
+        return {imposto: valor / total if total else 0.0 for imposto, valor in self.centavos_impostos.items()}
+
+    def cfops_tipicos(self, quantidade: int = 3) -> List[str]:
+        return [cfop for cfop, _ in self.cfops.most_common(quantidade)]
+
+
+class RegistroParticipantes:
+    """Emitentes e destinatários internados por CNPJ/CPF, com perfis consultados em O(1)"""
+
+    def __init__(self, limite_valor_novo: Decimal = Decimal("10000"), min_notas_cfop: int = 5):
+        self.limite_valor_novo = limite_valor_novo
+        self.min_notas_cfop = min_notas_cfop
+        self.emitentes: Dict[str, PerfilParticipante] = {}
+        self.destinatarios: Dict[str, PerfilParticipante] = {}
+        # Um objeto por participante, compartilhado por todas as notas com os mesmos dados cadastrais
+        self._emitentes: Dict[str, Emitente] = {}
+        self._destinatarios: Dict[str, Destinatario] = {}
+        self._chaves: Set[str] = set()  # notas já contabilizadas nos perfis
+
+    def __len__(self) -> int:
+        return len(self.emitentes) + len(self.destinatarios)
+
+    # --------- Ingestão ---------
+
+    @staticmethod
+    def _internar(objetos: Dict, documento: str, objeto):
+        atual = objetos.get(documento)
+        if atual is not None and (atual is objeto or atual == objeto):
+            return atual
+        # Primeiro registro ou cadastro alterado: os dados mais recentes passam a ser os compartilhados
+        objetos[documento] = objeto
+        return objeto
+
+    def internar(self, nota: NotaFiscal) -> NotaFiscal:
+        """Troca emitente e destinatário da nota pelos objetos compartilhados equivalentes"""
+        nota.emitente = self._internar(self._emitentes, nota.emitente.cnpj, nota.emitente)
+        nota.destinatario = self._internar(self._destinatarios, nota.destinatario.cpf_cnpj, nota.destinatario)
+        return nota
+
+    def registrar(self, nota: NotaFiscal) -> bool:
+        """Interna a nota e a incorpora aos perfis (uma vez por chave de acesso); retorna False se já registrada"""
+        self.internar(nota)
+        if nota.chave_acesso:
+            if nota.chave_acesso in self._chaves:
+                return False
+            self._chaves.add(nota.chave_acesso)
+
+        for perfis, documento, nome in (
+            (self.emitentes, nota.emitente.cnpj, nota.emitente.razao_social),
+            (self.destinatarios, nota.destinatario.cpf_cnpj, nota.destinatario.nome),
+        ):
+            perfil = perfis.get(documento)
+            if perfil is None:
+                perfil = perfis[documento] = PerfilParticipante(documento, nome)
+            perfil.registrar(nota)
+        return True
+
+    # --------- Consultas ---------
+
+    def emitente(self, cnpj: str) -> Optional[PerfilParticipante]:
+        return self.emitentes.get(cnpj)
+
+    def destinatario(self, documento: str) -> Optional[PerfilParticipante]:
+        return self.destinatarios.get(documento)
+
+    def sinais_risco(self, nota: NotaFiscal) -> List[str]:
+        """Alertas da nota em relação ao histórico do emitente (consultar antes de registrar a nota)"""
+        perfil = self.emitentes.get(nota.emitente.cnpj)
+        valor = nota.totalizadores.valor_total_nota
+        if perfil is None:
+            alerta = f"Fornecedor novo: primeira nota de {nota.emitente.razao_social} (CNPJ {nota.emitente.cnpj})"
+            if valor >= self.limite_valor_novo:
+                alerta += f" com valor elevado (R$ {valor:,.2f})"
+            return [alerta]
+
+        alertas = []
+        if perfil.nome != nota.emitente.razao_social:
+            alertas.append(
+                f"Razão social do emitente ({nota.emitente.razao_social}) difere da registrada "
+                f"para o CNPJ ({perfil.nome})"
+            )
+        if perfil.notas >= self.min_notas_cfop:
+            novos = sorted({p.cfop for p in nota.produtos if p.cfop not in perfil.cfops})
+            if novos:
+                alertas.append(
+                    f"CFOP {', '.join(novos)} nunca usado pelo emitente em {perfil.notas} notas "
+                    f"(habituais: {', '.join(perfil.cfops_tipicos())})"
+                )
+        return alertas
+
+    def ranking(self, papel: str = "emitente", quantidade: Optional[int] = None) -> List[PerfilParticipante]:
+        """Perfis por valor total decrescente"""
+        perfis = self.emitentes if papel == "emitente" else self.destinatarios
+        return sorted(perfis.values(), key=lambda p: p.centavos_total, reverse=True)[:quantidade]
+
+    def novos_desde(self, data: datetime, papel: str = "emitente") -> List[PerfilParticipante]:
+        """Participantes cuja primeira nota é posterior a `data`"""
+        perfis = self.emitentes if papel == "emitente" else self.destinatarios
+        data = data.replace(tzinfo=None)
+        return [p for p in perfis.values() if p.primeira_emissao and p.primeira_emissao >= data]
+
+    # --------- Persistência ---------
+
+    def salvar(self, caminho: str) -> None:
+        """Persiste os perfis (gravação atômica)"""
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: str, **kwargs) -> "RegistroParticipantes":
+        """Carrega os perfis salvos ou cria um registro vazio"""
+        if os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                return pickle.load(f)
+        return cls(**kwargs)
@@ -0,0 +1,256 @@
+import cProfile
+import glob
+import json
+import os
+import pstats
+import sys
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import metricas as _modulo_metricas
+
+
+DIR_APLICACAO = os.path.dirname(os.path.abspath(__file__))
+
+# Frames de infraestrutura omitidos das pilhas (cronômetros e context managers)
+ARQUIVOS_OMITIDOS = {os.path.abspath(_modulo_metricas.__file__), os.path.abspath(threading.__file__)}
+ARQUIVOS_OMITIDOS.add(os.path.join(os.path.dirname(os.path.abspath(os.__file__)), "contextlib.py"))
+
+# Trecho do arquivo/função -> biblioteca. Extensões em C (lxml, pydantic-core, _decimal) aparecem no
+# cProfile como métodos embutidos; operadores do Decimal não são chamadas e ficam na função que os usa.
+BIBLIOTECAS = (
+    ("lxml", "lxml"), ("pydantic", "pydantic"), ("decimal", "decimal"), ("reportlab", "reportlab"),
+    ("openpyxl", "openpyxl"), ("pandas", "pandas"), ("numpy", "numpy"), ("duckdb", "duckdb"),
+    ("sqlite3", "sqlite"), ("google", "gemini"), ("json", "json"),
+)
+
+
+def biblioteca(arquivo: str, funcao: str) -> str:
+    if arquivo.startswith(DIR_APLICACAO):
+        return "aplicacao"
+    texto = f"{arquivo} {funcao}".lower()
+    for trecho, nome in BIBLIOTECAS:
+        if trecho in texto:
+            return nome
+    return "python"
+
+
+def rotulo_funcao(arquivo: str, linha: int, funcao: str) -> str:
+    if arquivo == "~":
+        return funcao  # função embutida, ex.: <method 'xpath' of 'lxml.etree._Element' objects>
+    return f"{funcao} ({os.path.basename(arquivo)}:{linha})"
+
+
+class Perfilador:
+    """Perfilamento opcional do pipeline: cProfile por etapa e amostragem das pilhas para flame graphs"""
+
+    def __init__(self, intervalo: float = 0.005, amostrar: bool = True):
+        self.intervalo = intervalo
+        self.amostrar = amostrar
+        self.perfis: Dict[str, cProfile.Profile] = {}
+        self.pilhas: Counter = Counter()  # pilha colapsada ("etapa;f1;f2") -> amostras
+        self._importadas: Dict[str, pstats.Stats] = {}
+        self._ativas: Dict[int, list] = {}  # thread -> [(etapa, frame que abriu a etapa)]
+        self._perfil_ativo: Optional[cProfile.Profile] = None
+        self._thread_perfil: Optional[int] = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._amostrador: Optional[threading.Thread] = None
+
+    # --------- Coleta ---------
+
+    def iniciar(self) -> "Perfilador":
+        """Liga a amostragem periódica das pilhas (thread daemon)"""
+        if self.amostrar and self._amostrador is None:
+            self._parar.clear()
+            self._amostrador = threading.Thread(target=self._amostrar, name="perfilador", daemon=True)
+            self._amostrador.start()
+        return self
+
+    def parar(self) -> None:
+        if self._amostrador is not None:
+            self._parar.set()
+            self._amostrador.join()
+            self._amostrador = None
+
+    def __enter__(self) -> "Perfilador":
+        return self.iniciar()
+
+    def __exit__(self, *exc) -> None:
+        self.parar()
+
+    def entrar(self, etapa: str, frame) -> None:
+        """Chamado pelos cronômetros de `metricas`: a etapa mais externa recebe o tempo do cProfile"""
+        thread = threading.get_ident()
+        with self._lock:
+            pilha = self._ativas.setdefault(thread, [])
+            pilha.append((etapa, frame))
+            if len(pilha) > 1 or self._perfil_ativo is not None:
+                return
+            perfil = self.perfis.get(etapa)
+            if perfil is None:
+                perfil = self.perfis[etapa] = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:
+                return  # outro profiler já ativo no processo: fica só a amostragem
+            self._perfil_ativo, self._thread_perfil = perfil, thread
+
+    def sair(self) -> None:
+        thread = threading.get_ident()
+        with self._lock:
+            pilha = self._ativas.get(thread)
+            if not pilha:
+                return
+            pilha.pop()
+            if pilha:
+                return
+            del self._ativas[thread]
+            if self._perfil_ativo is not None and self._thread_perfil == thread:
+                self._perfil_ativo.disable()
+                self._perfil_ativo = self._thread_perfil = None
+
+    def _amostrar(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            frames = sys._current_frames()
+            with self._lock:
+                ativas = [(thread, pilha[0]) for thread, pilha in self._ativas.items() if pilha]
+            for thread, (etapa, entrada) in ativas:
+                frame = frames.get(thread)
+                nomes = []
+                # Da função em execução até o ponto em que a etapa foi aberta. Na folha vai a linha
+                # em execução: chamadas a extensões em C (xpath do lxml, validação do pydantic-core)
+                # não têm frame próprio e aparecem como a linha que as chamou.
+                while frame is not None:
+                    codigo = frame.f_code
+                    if os.path.abspath(codigo.co_filename) not in ARQUIVOS_OMITIDOS:
+                        linha = codigo.co_firstlineno if nomes else frame.f_lineno
+                        nomes.append(rotulo_funcao(codigo.co_filename, linha, codigo.co_name))
+                    if frame is entrada:
+                        break
+                    frame = frame.f_back
+                else:
+                    continue  # a etapa terminou entre a cópia da lista e a leitura dos frames
+                nomes.append(etapa)
+                self.pilhas[";".join(reversed(nomes))] += 1
+            del frames
+
+    # --------- Resultados ---------
+
+    def estatisticas(self) -> Dict[str, pstats.Stats]:
+        """pstats por etapa (perfis locais somados aos importados de outros processos)"""
+        resultado = {}
+        with self._lock:
+            perfis = [(etapa, perfil) for etapa, perfil in self.perfis.items() if perfil is not self._perfil_ativo]
+        for etapa, perfil in perfis:
+            perfil.create_stats()
+            if perfil.stats:
+                resultado[etapa] = pstats.Stats(perfil)
+        for etapa, stats in self._importadas.items():
+            if etapa in resultado:
+                resultado[etapa].add(stats)
+            else:
+                resultado[etapa] = stats
+        return resultado
+
+    def hotspots(self, quantidade: int = 25) -> List[dict]:
+        """Funções com maior tempo próprio, com a etapa e a biblioteca a que pertencem"""
+        linhas = []
+        for etapa, stats in self.estatisticas().items():
+            for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, _) in stats.stats.items():
+                linhas.append({
+                    "etapa": etapa,
+                    "funcao": rotulo_funcao(arquivo, linha, funcao),
+                    "biblioteca": biblioteca(arquivo, funcao),
+                    "chamadas": chamadas,
+                    "proprio_ms": proprio * 1000,
+                    "acumulado_ms": acumulado * 1000,
+                })
+        linhas.sort(key=lambda l: l["proprio_ms"], reverse=True)
+        return linhas[:quantidade]
+
+    def por_biblioteca(self) -> Dict[str, Dict[str, float]]:
+        """Tempo próprio (ms) por etapa e biblioteca: lxml, pydantic, reportlab, aplicação..."""
+        resultado: Dict[str, Dict[str, float]] = {}
+        for etapa, stats in self.estatisticas().items():
+            tempos = defaultdict(float)
+            for (arquivo, _, funcao), (_, _, proprio, _, _) in stats.stats.items():
+                tempos[biblioteca(arquivo, funcao)] += proprio * 1000
+            resultado[etapa] = dict(sorted(tempos.items(), key=lambda item: item[1], reverse=True))
+        return resultado
+
+    def tabela(self, quantidade: int = 25) -> str:
+        """Tabela de hotspots em texto fixo"""
+        linhas = [f"{'próprio ms':>11} {'acum. ms':>11} {'chamadas':>9}  {'biblioteca':<10} {'etapa':<22} função"]
+        for h in self.hotspots(quantidade):
+            linhas.append(
+                f"{h['proprio_ms']:>11.1f} {h['acumulado_ms']:>11.1f} {h['chamadas']:>9}  "
+                f"{h['biblioteca']:<10} {h['etapa']:<22} {h['funcao']}"
+            )
+        return "\n".join(linhas) + "\n"
+
+    def pilhas_colapsadas(self) -> str:
+        """Formato de flamegraph.pl / speedscope / inferno: "etapa;f1;f2 amostras" por linha"""
+        return "".join(f"{pilha} {amostras}\n" for pilha, amostras in sorted(self.pilhas.items()))
+
+    # --------- Persistência ---------
+
+    def exportar(self, pasta: str, sufixo: str) -> None:
+        """Dados brutos deste processo, para `importar` consolidar (workers do processamento em lote)"""
+        os.makedirs(pasta, exist_ok=True)
+        for etapa, stats in self.estatisticas().items():
+            stats.dump_stats(os.path.join(pasta, f"{etapa}.{sufixo}.pstats"))
+        temporario = os.path.join(pasta, f"pilhas.{sufixo}.json.tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(dict(self.pilhas), f)
+        os.replace(temporario, temporario[:-4])
+
+    def importar(self, pasta: str) -> "Perfilador":
+        """Soma os dados exportados por outros processos"""
+        for caminho in glob.glob(os.path.join(pasta, "*.pstats")):
+            etapa = os.path.basename(caminho).rsplit(".", 2)[0]
+            if etapa in self._importadas:
+                self._importadas[etapa].add(caminho)
+            else:
+                self._importadas[etapa] = pstats.Stats(caminho)
+        for caminho in glob.glob(os.path.join(pasta, "pilhas.*.json")):
+            with open(caminho, encoding="utf-8") as f:
+                self.pilhas.update(json.load(f))
+        return self
+
+    def salvar(self, pasta: str, quantidade: int = 40) -> Dict[str, str]:
+        """Grava pilhas colapsadas, tabela de hotspots e resumo por biblioteca; retorna os caminhos"""
+        os.makedirs(pasta, exist_ok=True)
+        arquivos = {
+            "pilhas": os.path.join(pasta, "pilhas.collapsed"),
+            "hotspots": os.path.join(pasta, "hotspots.txt"),
+            "resumo": os.path.join(pasta, "resumo.json"),
+        }
+        with open(arquivos["pilhas"], "w", encoding="utf-8") as f:
+            f.write(self.pilhas_colapsadas())
+        with open(arquivos["hotspots"], "w", encoding="utf-8") as f:
+            f.write(self.tabela(quantidade))
+        with open(arquivos["resumo"], "w", encoding="utf-8") as f:
+            json.dump({
+                "amostras": sum(self.pilhas.values()),
+                "intervalo_s": self.intervalo,
+                "por_biblioteca_ms": self.por_biblioteca(),
+                "hotspots": self.hotspots(quantidade),
+            }, f, ensure_ascii=False, indent=2)
+        return arquivos
+
+
+def ativar(intervalo: float = 0.005, amostrar: bool = True) -> Perfilador:
+    """Cria um perfilador, conecta-o aos cronômetros de `metricas` e inicia a amostragem"""
+    perfilador = Perfilador(intervalo, amostrar).iniciar()
+    _modulo_metricas.metricas.perfilador = perfilador
+    return perfilador
+
+
+def desativar() -> Optional[Perfilador]:
+    perfilador = _modulo_metricas.metricas.perfilador
+    _modulo_metricas.metricas.perfilador = None
+    if perfilador is not None:
+        perfilador.parar()
+    return perfilador
@@ -0,0 +1,236 @@
+import os
+import pickle
+import re
+import unicodedata
+import zlib
+from decimal import Decimal
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+# --------- Normalização das descrições ---------
+
+# Abreviações frequentes nas descrições de NF-e (já sem acentos e em maiúsculas)
+ABREVIACOES = {
+    "CX": "CAIXA", "CXA": "CAIXA", "PCT": "PACOTE", "PCTE": "PACOTE", "PC": "PECA", "PCS": "PECA",
+    "UN": "UNIDADE", "UND": "UNIDADE", "UNID": "UNIDADE", "LT": "LATA", "LTA": "LATA", "GRF": "GARRAFA", "GFA": "GARRAFA",
+    "REFRIG": "REFRIGERANTE", "REFRI": "REFRIGERANTE", "CERV": "CERVEJA", "TORR": "TORRADO", "MOID": "MOIDO",
+    "PARB": "PARBOILIZADO", "INTEG": "INTEGRAL", "TP": "TIPO", "SHAMPOO": "XAMPU", "ESCRIT": "ESCRITORIO",
+    "SEXT": "SEXTAVADO", "PARAF": "PARAFUSO", "PLAST": "PLASTICO", "FL": "FOLHA", "FLS": "FOLHA",
+    "FOLHAS": "FOLHA", "OPT": "OPTICO", "OTICO": "OPTICO",
+}
+
+PALAVRAS_VAZIAS = {"DE", "DA", "DO", "DAS", "DOS", "E", "EM", "PARA", "P"}
+
+# Unidade -> (unidade canônica, fator); quantidades são convertidas para a unidade canônica
+UNIDADES = {
+    "KG": ("G", 1000), "KGS": ("G", 1000), "G": ("G", 1), "GR": ("G", 1), "GRS": ("G", 1), "MG": ("G", Decimal("0.001")),
+    "L": ("ML", 1000), "LT": ("ML", 1000), "LTS": ("ML", 1000), "LITRO": ("ML", 1000), "LITROS": ("ML", 1000),
+    "ML": ("ML", 1), "M": ("MM", 1000), "MT": ("MM", 1000), "MTS": ("MM", 1000), "CM": ("MM", 10), "MM": ("MM", 1),
+    "GB": ("GB", 1), "TB": ("TB", 1), "POL": ("POL", 1), "POLEG": ("POL", 1), "POLEGADA": ("POL", 1),
+    "POLEGADAS": ("POL", 1),
+}
+
+_RE_MEDIDA = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(UNIDADES, key=len, reverse=True)) + r")(?![A-Z])"
+)
+_RE_MULTIPLO = re.compile(r"(\d+)\s*X\s*(?=\d)")
+_RE_POLEGADAS = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:\"|'')")
+_RE_TOKEN_MEDIDA = re.compile(r"^\d+(?:\.\d+)?(?:G|ML|MM|GB|TB|POL)$|^\d+X$")
+_RE_TOKEN_ROMANO = re.compile(r"^(?:I{2,3}|IV|V|VI{0,3}|IX|X)$")
+
+
+def _medida(m: "re.Match") -> str:
+    unidade, fator = UNIDADES[m.group(2)]
+    valor = (Decimal(m.group(1).replace(",", ".")) * fator).normalize()
+    return f" {valor:f}{unidade} "
+
+
+def normalizar_descricao(descricao: str) -> str:
+    """Descrição comparável: sem acentos, medidas em unidade canônica (1,5L -> 1500ML) e abreviações expandidas"""
+    texto = unicodedata.normalize("NFKD", descricao or "").encode("ascii", "ignore").decode("ascii").upper()
+    texto = re.sub(r"\bC/", " COM ", texto)
+    texto = re.sub(r"\bS/", " SEM ", texto)
+    texto = _RE_MULTIPLO.sub(r" \1X ", texto)
+    texto = _RE_POLEGADAS.sub(r"\1POL", texto)
+    texto = _RE_MEDIDA.sub(_medida, texto)
+    texto = re.sub(r"[^A-Z0-9.]+", " ", texto)
+    texto = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", texto)
+    tokens = (ABREVIACOES.get(t, t) for t in texto.split())
+    return " ".join(t for t in tokens if t not in PALAVRAS_VAZIAS)
+
+
+def medidas(normalizada: str) -> FrozenSet[str]:
+    """Medidas da descrição (500G, 2000ML, 12X...): itens com medidas diferentes nunca são agrupados"""
+    return frozenset(t for t in normalizada.split() if _RE_TOKEN_MEDIDA.match(t))
+
+
+def modelos(normalizada: str) -> FrozenSet[str]:
+    """Números e códigos de modelo (85A, 13, A4, CP II): itens com modelos diferentes nunca são agrupados"""
+    return frozenset(
+        t for t in normalizada.split()
+        if not _RE_TOKEN_MEDIDA.match(t) and (any(c.isdigit() for c in t) or _RE_TOKEN_ROMANO.match(t))
+    )
+
+
+def _tokens_ordenados(normalizada: str) -> str:
+    # A ordem das palavras varia entre emitentes ("CERVEJA LATA 350ML" / "CERVEJA 350ML LATA")
+    return " ".join(sorted(normalizada.split()))
+
+
+def _shingles(ordenada: str) -> Set[str]:
+    texto = f" {ordenada} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+# --------- Agrupamento por MinHash-LSH ---------
+
+PRIMO = (1 << 31) - 1  # a·x + b cabe em 64 bits com a, x < 2^31
+MAX_VARIANTES = 16     # assinaturas indexadas por cluster (limita o tamanho dos baldes)
+
+
+class ClusterProduto:
+    """Produto canônico: descrições equivalentes de emitentes diferentes"""
+
+    def __init__(self, id: int, descricao: str, normalizada: str, ncm: str):
+        self.id = id
+        self.descricao = descricao  # primeira descrição vista, como veio na nota
+        self.normalizada = normalizada
+        self.ncm = ncm
+        self.medidas = medidas(normalizada)
+        self.modelos = modelos(normalizada)
+        self.itens = 0
+        self.variantes = 0
+
+    def __setstate__(self, estado: dict) -> None:
+        # Catálogos gravados antes da comparação de modelos
+        self.__dict__.update(estado)
+        if "modelos" not in estado:
+            self.modelos = modelos(self.normalizada)
+
+    def __repr__(self) -> str:
+        return f"ClusterProduto({self.id}, {self.descricao!r}, itens={self.itens}, variantes={self.variantes})"
+
+
+class CatalogoProdutos:
+    """Atribui cada item a um produto canônico com MinHash-LSH sobre trigramas da descrição normalizada"""
+
+    def __init__(self, permutacoes: int = 64, bandas: int = 16, limiar: float = 0.5, seed: int = 1):
+        if permutacoes % bandas:
+            raise ValueError("permutacoes deve ser múltiplo de bandas")
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, PRIMO, size=(permutacoes, 1), dtype=np.uint64)
+        self._b = rng.integers(0, PRIMO, size=(permutacoes, 1), dtype=np.uint64)
+        self.bandas = bandas
+        self.linhas = permutacoes // bandas
+        self.limiar = limiar
+
+        self.clusters: List[ClusterProduto] = []
+        self._exatos: Dict[Tuple[str, str], int] = {}     # (tokens ordenados, NCM[:4]) -> cluster
+        self._por_descricao: Dict[Tuple[str, str], int] = {}  # (descrição original, NCM[:4]) -> cluster
+        self._assinaturas: List[np.ndarray] = []       # assinatura de cada variante indexada
+        self._cluster_da_variante: List[int] = []
+        self._baldes: List[Dict[bytes, List[int]]] = [{} for _ in range(bandas)]
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    def assinatura(self, normalizada: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode()) % PRIMO for s in _shingles(_tokens_ordenados(normalizada))), dtype=np.uint64
+        )
+        return ((self._a * hashes + self._b) % PRIMO).min(axis=1)
+
+    def _chaves_bandas(self, assinatura: np.ndarray):
+        for banda in range(self.bandas):
+            yield banda, assinatura[banda * self.linhas:(banda + 1) * self.linhas].tobytes()
+
+    def _indexar(self, cluster: ClusterProduto, assinatura: np.ndarray) -> None:
+        variante = len(self._assinaturas)
+        self._assinaturas.append(assinatura)
+        self._cluster_da_variante.append(cluster.id)
+        for banda, chave in self._chaves_bandas(assinatura):
+            self._baldes[banda].setdefault(chave, []).append(variante)
+        cluster.variantes += 1
+
+    def _compativel(self, cluster: ClusterProduto, ncm: str, medidas_item: FrozenSet[str],
+                    modelos_item: FrozenSet[str]) -> bool:
+        if ncm and cluster.ncm and ncm[:4] != cluster.ncm[:4]:
+            return False
+        if modelos_item and cluster.modelos and modelos_item != cluster.modelos:
+            return False
+        return not medidas_item or not cluster.medidas or medidas_item == cluster.medidas
+
+    def _melhor_candidato(self, assinatura: np.ndarray, ncm: str, medidas_item: FrozenSet[str],
+                          modelos_item: FrozenSet[str]) -> Optional[ClusterProduto]:
+        candidatas = set()
+        for banda, chave in self._chaves_bandas(assinatura):
+            candidatas.update(self._baldes[banda].get(chave, ()))
+        melhor, melhor_similaridade = None, self.limiar
+        for variante in candidatas:
+            cluster = self.clusters[self._cluster_da_variante[variante]]
+            if not self._compativel(cluster, ncm, medidas_item, modelos_item):
+                continue
+            # Fração de permutações com o mesmo mínimo: estimativa da similaridade de Jaccard
+            similaridade = float(np.count_nonzero(self._assinaturas[variante] == assinatura)) / len(assinatura)
+            if similaridade >= melhor_similaridade:
+                melhor, melhor_similaridade = cluster, similaridade
+        return melhor
+
+    def classificar(self, descricao: str, ncm: str = "", criar: bool = True) -> Optional[ClusterProduto]:
+        """Cluster do item; cria um novo quando nenhuma descrição conhecida é parecida o bastante"""
+        grupo_ncm = (ncm or "")[:4]
+        indice = self._por_descricao.get((descricao, grupo_ncm))
+        if indice is not None:
+            cluster = self.clusters[indice]
+            if criar:
+                cluster.itens += 1
+            return cluster
+
+        normalizada = normalizar_descricao(descricao)
+        chave = (_tokens_ordenados(normalizada), grupo_ncm)
+        indice = self._exatos.get(chave)
+        if indice is not None:
+            cluster = self.clusters[indice]
+        else:
+            assinatura = self.assinatura(normalizada)
+            cluster = self._melhor_candidato(assinatura, ncm, medidas(normalizada), modelos(normalizada))
+            if cluster is None:
+                if not criar:
+                    return None
+                cluster = ClusterProduto(len(self.clusters), descricao, normalizada, ncm)
+                self.clusters.append(cluster)
+                self._indexar(cluster, assinatura)
+            elif cluster.variantes < MAX_VARIANTES:
+                self._indexar(cluster, assinatura)
+            self._exatos[chave] = cluster.id
+        self._por_descricao[(descricao, grupo_ncm)] = cluster.id
+        if criar:
+            cluster.itens += 1
+        return cluster
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "clusters": len(self.clusters),
+            "descricoes": len(self._exatos),
+            "variantes_indexadas": len(self._assinaturas),
+            "itens": sum(c.itens for c in self.clusters),
+        }
+
+    # --------- Persistência ---------
+
+    def salvar(self, caminho: str) -> None:
+        """Persiste o catálogo (gravação atômica)"""
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: str, **kwargs) -> "CatalogoProdutos":
+        """Carrega o catálogo salvo ou cria um vazio"""
+        if os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                return pickle.load(f)
+        return cls(**kwargs)
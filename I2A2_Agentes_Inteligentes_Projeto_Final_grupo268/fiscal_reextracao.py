@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from diario import DiarioProcessamento, notas_gravadas, serializar
+from extractor import VERSAO_EXTRATOR
+from models import NotaFiscal, ResultadoValidacao
+
+
+# Campos que não contam como mudança de conteúdo
+IGNORAR = {"versao_extrator"}
+
+
+# --------- Comparação entre a nota gravada e a reextraída ---------
+
+def comparar(antigo: Any, novo: Any, caminho: str = "") -> List[str]:
+    """Caminhos (ex.: produtos.3.impostos.icms_valor) cujos valores diferem entre as duas versões"""
+    if isinstance(antigo, dict) and isinstance(novo, dict):
+        diferencas = []
+        for campo in sorted(set(antigo) | set(novo)):
+            if not caminho and campo in IGNORAR:
+                continue
+            local = f"{caminho}.{campo}" if caminho else campo
+            if campo not in antigo or campo not in novo:
+                diferencas.append(local)
+            else:
+                diferencas.extend(comparar(antigo[campo], novo[campo], local))
+        return diferencas
+    if isinstance(antigo, list) and isinstance(novo, list):
+        if len(antigo) != len(novo):
+            return [caminho]
+        diferencas = []
+        for indice, (a, n) in enumerate(zip(antigo, novo)):
+            diferencas.extend(comparar(a, n, f"{caminho}.{indice}"))
+        return diferencas
+    if isinstance(antigo, float) and isinstance(novo, str):
+        # Diários anteriores gravavam decimais como float: só conta se o valor mudou de fato
+        try:
+            return [] if Decimal(repr(antigo)) == Decimal(novo) else [caminho]
+        except InvalidOperation:
+            return [caminho]
+    return [] if antigo == novo else [caminho]
+
+
+def padrao(caminho: str) -> str:
+    """Agrupa caminhos de itens diferentes: produtos.3.ncm -> produtos.*.ncm"""
+    return re.sub(r"(?<=\.)\d+(?=\.|$)", "*", caminho)
+
+
+# --------- Validação da nota reextraída ---------
+
+NIVEIS = ("inconsistencias", "alertas", "recomendacoes")
+
+
+def mesclar_validacao(gravada: Dict[str, Any], refeita: ResultadoValidacao, nova: ResultadoValidacao) -> ResultadoValidacao:
+    """Validação da nota nova mantendo o que o validador não refaz: alertas de anomalia e do histórico
+    do emitente (mensagens gravadas que a nota antiga não gera ao ser revalidada) e a análise de IA"""
+    from validator import score_confianca
+
+    niveis = {}
+    for nivel in NIVEIS:
+        mensagens = list(getattr(nova, nivel))
+        derivadas = set(getattr(refeita, nivel))
+        for mensagem in gravada.get(nivel, []):
+            if mensagem not in derivadas and mensagem not in mensagens:
+                mensagens.append(mensagem)
+        niveis[nivel] = mensagens
+    return ResultadoValidacao(
+        valido=not niveis["inconsistencias"],
+        score_confianca=score_confianca(niveis["inconsistencias"]),
+        analise_ia=gravada.get("analise_ia"),
+        **niveis,
+    )
+
+
+def _ia_concluida(validacoes: List[Dict[str, Any]]) -> bool:
+    from validator import PREFIXO_ERRO_IA
+    return bool(validacoes) and all(
+        v.get("analise_ia") and not v["analise_ia"].startswith(PREFIXO_ERRO_IA) for v in validacoes
+    )
+
+
+# --------- Reextração em paralelo (um bloco de notas por tarefa) ---------
+
+_WORKER: Dict[str, object] = {}
+
+
+def _inicializar_worker(pasta_acervo: str, tolerante: bool, revalidar: bool) -> None:
+    from acervo import AcervoXML
+    from extractor import NFeExtractor
+
+    _WORKER["acervo"] = AcervoXML(pasta_acervo, somente_leitura=True)
+    _WORKER["extrator"] = NFeExtractor(tolerante=tolerante)
+    _WORKER["validador"] = None
+    if revalidar:
+        from validator import ModeloDesligado, ValidadorInteligente
+        _WORKER["validador"] = ValidadorInteligente("", modelo=ModeloDesligado())
+
+
+def _reextrair_bloco(bloco: List[Tuple[str, str]]) -> Dict[str, list]:
+    """Reextrai cada XML do bloco; só as notas alteradas voltam inteiras ao processo principal"""
+    acervo = _WORKER["acervo"]
+    extrator = _WORKER["extrator"]
+    resultado = {"inalterados": [], "alterados": [], "sem_xml": [], "erros": []}
+
+    alteradas = []
+    for hash_arquivo, caminho_resultado in bloco:
+        conteudo = acervo.obter(hash_arquivo)
+        if conteudo is None:
+            resultado["sem_xml"].append(hash_arquivo)
+            continue
+        try:
+            with open(caminho_resultado, encoding="utf-8") as f:
+                gravadas, validacoes_gravadas = notas_gravadas(json.load(f))
+            notas = list(extrator.extrair_notas(conteudo))
+        except Exception as e:
+            resultado["erros"].append((hash_arquivo, str(e)))
+            continue
+        novas = serializar(notas)["notas"]
+        if len(gravadas) != len(novas):
+            diferencas = ["notas"]
+        elif len(novas) == 1:
+            diferencas = comparar(gravadas[0], novas[0])
+        else:
+            # Arquivos com várias notas: caminhos prefixados pelo índice da nota (1.produtos.3.ncm)
+            diferencas = [
+                f"{indice}.{caminho}"
+                for indice, (gravada, nova) in enumerate(zip(gravadas, novas))
+                for caminho in comparar(gravada, nova)
+            ]
+        if diferencas:
+            # A validação gravada só é aproveitada se casar nota a nota com a reextração
+            if validacoes_gravadas is None or not (len(validacoes_gravadas) == len(gravadas) == len(notas)):
+                gravadas, validacoes_gravadas = [], None
+            alteradas.append((hash_arquivo, notas, novas, gravadas, validacoes_gravadas, diferencas))
+        else:
+            resultado["inalterados"].append(hash_arquivo)
+
+    validador = _WORKER["validador"]
+    for hash_arquivo, notas, novas, gravadas, validacoes_gravadas, diferencas in alteradas:
+        if validador is None:
+            # Sem revalidação a validação gravada (da nota antiga) é descartada e a nota volta a "extraido"
+            resultado["alterados"].append((hash_arquivo, "extraido", {"notas": novas, "validacoes": None}, diferencas))
+            continue
+        # Em um único lote: as notas novas e as antigas, revalidadas para separar o que veio do validador
+        # do que foi acrescentado depois (anomalias, histórico do emitente)
+        antigas = [NotaFiscal.de_dict(gravada) for gravada in gravadas]
+        validacoes = validador.validar_lote(notas + antigas)
+        novas_validacoes, refeitas = validacoes[:len(notas)], validacoes[len(notas):]
+        etapa = "validado"
+        if validacoes_gravadas is not None:
+            novas_validacoes = [
+                mesclar_validacao(gravada, refeita, nova)
+                for gravada, refeita, nova in zip(validacoes_gravadas, refeitas, novas_validacoes)
+            ]
+            if _ia_concluida(validacoes_gravadas):
+                etapa = "analisado_ia"
+        dados = {"notas": novas, "validacoes": serializar(notas, novas_validacoes)["validacoes"]}
+        resultado["alterados"].append((hash_arquivo, etapa, dados, diferencas))
+    return resultado
+
+
+def _blocos(pendentes: List[Tuple[str, str]], tamanho_bloco: int) -> Iterator[List[Tuple[str, str]]]:
+    for inicio in range(0, len(pendentes), tamanho_bloco):
+        yield pendentes[inicio:inicio + tamanho_bloco]
+
+
+def _anotar(exemplos: Dict[str, List[str]], chave: str, valor: str, limite: int = 3) -> None:
+    lista = exemplos.setdefault(chave, [])
+    if len(lista) < limite:
+        lista.append(valor)
+
+
+def reextrair(
+    pasta_diario: str = "diario_processamento",
+    pasta_acervo: str = "acervo_xml",
+    workers: int = os.cpu_count() or 1,
+    tamanho_bloco: int = 64,
+    forcar: bool = False,
+    tolerante: bool = False,
+    revalidar: bool = True,
+    simular: bool = False,
+    silencioso: bool = False
+) -> Dict[str, Any]:
+    """Refaz com o extrator atual as notas do diário gravadas por outra versão e grava só as que mudaram"""
+    diario = DiarioProcessamento(pasta_diario)
+    pendentes = diario.desatualizados(VERSAO_EXTRATOR, forcar=forcar)
+    contadores = Counter(pendentes=len(pendentes))
+    campos = Counter()
+    exemplos: Dict[str, List[str]] = {}
+    inicio = time.perf_counter()
+
+    def registrar(resultado: Dict[str, list]) -> None:
+        for hash_arquivo, etapa, dados, diferencas in resultado["alterados"]:
+            if not simular:
+                diario.concluir_etapa(hash_arquivo, etapa, dados)
+            for caminho in {padrao(c) for c in diferencas}:
+                campos[caminho] += 1
+                _anotar(exemplos, caminho, hash_arquivo)
+        if not simular:
+            diario.marcar_versao(resultado["inalterados"], VERSAO_EXTRATOR)
+        contadores["alterados"] += len(resultado["alterados"])
+        contadores["inalterados"] += len(resultado["inalterados"])
+        contadores["sem_xml"] += len(resultado["sem_xml"])
+        contadores["erros"] += len(resultado["erros"])
+        for hash_arquivo, erro in resultado["erros"]:
+            _anotar(exemplos, "erros", f"{hash_arquivo}: {erro}")
+        if not silencioso:
+            total = sum(contadores[c] for c in ("alterados", "inalterados", "sem_xml", "erros"))
+            taxa = total / (time.perf_counter() - inicio)
+            print(f"\r{total}/{len(pendentes)} nota(s), {contadores['alterados']} alterada(s), {taxa:.1f} notas/s",
+                  end="", flush=True)
+
+    blocos = _blocos(pendentes, tamanho_bloco)
+    try:
+        if workers <= 1 or len(pendentes) <= tamanho_bloco:
+            _inicializar_worker(pasta_acervo, tolerante, revalidar)
+            for bloco in blocos:
+                registrar(_reextrair_bloco(bloco))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_inicializar_worker,
+                initargs=(pasta_acervo, tolerante, revalidar),
+            ) as executor:
+                pendentes_futuros = set()
+                for bloco in blocos:
+                    pendentes_futuros.add(executor.submit(_reextrair_bloco, bloco))
+                    if len(pendentes_futuros) >= workers * 2:
+                        prontos, pendentes_futuros = wait(pendentes_futuros, return_when=FIRST_COMPLETED)
+                        for futuro in prontos:
+                            registrar(futuro.result())
+                for futuro in pendentes_futuros:
+                    registrar(futuro.result())
+    finally:
+        if not silencioso and pendentes:
+            print()
+
+    return {
+        "versao_extrator": VERSAO_EXTRATOR,
+        **{c: contadores[c] for c in ("pendentes", "alterados", "inalterados", "sem_xml", "erros")},
+        "campos_alterados": dict(campos.most_common()),
+        "exemplos": exemplos,
+        "simulacao": simular,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reextrai as notas do diário a partir dos XMLs originais do acervo")
+    parser.add_argument("--diario", default="diario_processamento", help="Pasta do diário de processamento")
+    parser.add_argument("--acervo", default="acervo_xml", help="Pasta do acervo de XMLs originais")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bloco", type=int, default=64, help="Notas por tarefa enviada a um worker")
+    parser.add_argument("--forcar", action="store_true", help="Reextrai também as notas já na versão atual")
+    parser.add_argument("--tolerante", action="store_true", help="Campos inválidos viram inconsistências em vez de erro")
+    parser.add_argument("--sem-validacao", action="store_true", help="Não revalida as notas alteradas (voltam a 'extraido')")
+    parser.add_argument("--simular", action="store_true", help="Só relata as diferenças, sem gravar")
+    parser.add_argument("--silencioso", action="store_true")
+    args = parser.parse_args(argv)
+
+    resumo = reextrair(
+        args.diario,
+        args.acervo,
+        workers=args.workers,
+        tamanho_bloco=args.bloco,
+        forcar=args.forcar,
+        tolerante=args.tolerante,
+        revalidar=not args.sem_validacao,
+        simular=args.simular,
+        silencioso=args.silencioso,
+    )
+    print(json.dumps(resumo, ensure_ascii=False, indent=2))
+    return 1 if resumo["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import threading
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+
+# Tabelas distribuídas junto com o módulo (TSV "codigo<TAB>descricao", ordenado por código).
+# O cfop.tsv traz a tabela CFOP do Ajuste SINIEF 07/01. O ncm.tsv traz todos os capítulos e um
+# recorte de posições/itens; a tabela NCM completa é gerada com `importar_ncm` a partir do JSON
+# publicado pelo Portal Único Siscomex (python referencias.py ncm.json).
+DIRETORIO_REFERENCIAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados_referencia")
+
+# Níveis da hierarquia NCM pelo tamanho do código
+NIVEIS_NCM = ((2, "Capítulo"), (4, "Posição"), (6, "Subposição"), (8, "Item"))
+
+# A NCM vigente tem mais de 10 mil itens; com menos, o ncm.tsv é o recorte distribuído
+MIN_ITENS_NCM_COMPLETA = 10000
+AVISO_NCM_PARCIAL = (
+    "Tabela NCM parcial (recorte distribuído): só o capítulo do NCM é conferido. "
+    "Gere a tabela completa com `python referencias.py ncm.json` a partir do JSON do Siscomex."
+)
+
+
+class TabelaMapeada:
+    """Tabela de códigos ordenada, lida via mmap e consultada por busca binária"""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._arquivo = None
+        self._mmap = None
+        self._offsets = None
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        """Mapeia o arquivo e indexa o início de cada linha (apenas na 1ª consulta)"""
+        if self._offsets is not None:
+            return
+        with self._lock:
+            if self._offsets is not None:
+                return
+            self._arquivo = open(self.caminho, "rb")
+            self._mmap = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+            offsets = array("I")
+            pos = 0
+            tamanho = len(self._mmap)
+            while pos < tamanho:
+                offsets.append(pos)
+                fim = self._mmap.find(b"\n", pos)
+                if fim == -1:
+                    break
+                pos = fim + 1
+            self._offsets = offsets
+
+    def __len__(self) -> int:
+        self._abrir()
+        return len(self._offsets)
+
+    def _codigo(self, i: int) -> bytes:
+        inicio = self._offsets[i]
+        return self._mmap[inicio:self._mmap.find(b"\t", inicio)]
+
+    def _descricao(self, i: int) -> str:
+        inicio = self._mmap.find(b"\t", self._offsets[i]) + 1
+        fim = self._mmap.find(b"\n", inicio)
+        if fim == -1:
+            fim = len(self._mmap)
+        return self._mmap[inicio:fim].decode("utf-8").rstrip("\r")
+
+    def _buscar(self, codigo: str) -> Optional[int]:
+        """Busca binária pelo código exato; O(log n)"""
+        self._abrir()
+        alvo = codigo.encode("ascii", "ignore")
+        baixo, alto = 0, len(self._offsets)
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._codigo(meio) < alvo:
+                baixo = meio + 1
+            else:
+                alto = meio
+        if baixo < len(self._offsets) and self._codigo(baixo) == alvo:
+            return baixo
+        return None
+
+    def contar(self, tamanho: int) -> int:
+        """Número de códigos com o tamanho informado (ex.: 8 para itens NCM)"""
+        self._abrir()
+        return sum(1 for i in range(len(self._offsets)) if len(self._codigo(i)) == tamanho)
+
+    def contem(self, codigo: str) -> bool:
+        return self._buscar(codigo) is not None
+
+    def descricao(self, codigo: str) -> Optional[str]:
+        i = self._buscar(codigo)
+        return self._descricao(i) if i is not None else None
+
+    def fechar(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._arquivo.close()
+            self._mmap = self._arquivo = self._offsets = None
+
+
+def _somente_digitos(codigo: str) -> str:
+    return ''.join(filter(str.isdigit, codigo or ""))
+
+
+class ReferenciasFiscais:
+    """Consulta às tabelas de referência NCM e CFOP"""
+
+    def __init__(self, diretorio: str = DIRETORIO_REFERENCIAS):
+        self.ncm = TabelaMapeada(os.path.join(diretorio, "ncm.tsv"))
+        self.cfop = TabelaMapeada(os.path.join(diretorio, "cfop.tsv"))
+        self._ncm_completa: Optional[bool] = None
+
+    @property
+    def ncm_completa(self) -> bool:
+        """A tabela NCM traz todos os itens? No recorte, item ausente não indica NCM inexistente"""
+        if self._ncm_completa is None:
+            self._ncm_completa = self.ncm.contar(8) >= MIN_ITENS_NCM_COMPLETA
+        return self._ncm_completa
+
+    def ncm_valido(self, ncm: str) -> bool:
+        """Verifica se o NCM (8 dígitos) consta na tabela"""
+        ncm = _somente_digitos(ncm)
+        return len(ncm) == 8 and self.ncm.contem(ncm)
+
+    def descricao_ncm(self, ncm: str) -> Optional[str]:
+        return self.ncm.descricao(_somente_digitos(ncm))
+
+    def hierarquia_ncm(self, ncm: str) -> List[Tuple[str, str, str]]:
+        """Retorna (nível, código, descrição) de capítulo até item existentes na tabela"""
+        ncm = _somente_digitos(ncm)
+        niveis = []
+        for tamanho, nome in NIVEIS_NCM:
+            if len(ncm) < tamanho:
+                break
+            descricao = self.ncm.descricao(ncm[:tamanho])
+            if descricao is not None:
+                niveis.append((nome, ncm[:tamanho], descricao))
+        return niveis
+
+    def cfop_valido(self, cfop: str) -> bool:
+        cfop = _somente_digitos(cfop)
+        return len(cfop) == 4 and self.cfop.contem(cfop)
+
+    def descricao_cfop(self, cfop: str) -> Optional[str]:
+        return self.cfop.descricao(_somente_digitos(cfop))
+
+
+@lru_cache(maxsize=1)
+def obter_referencias() -> ReferenciasFiscais:
+    """Instância compartilhada; os arquivos só são abertos na primeira consulta"""
+    return ReferenciasFiscais()
+
+
+# --------- Atualização da tabela NCM ---------
+
+def importar_ncm(origem: str, destino: str = os.path.join(DIRETORIO_REFERENCIAS, "ncm.tsv")) -> int:
+    """Converte o JSON de nomenclaturas do Siscomex no TSV ordenado; retorna o número de códigos"""
+    with open(origem, encoding="utf-8-sig") as f:
+        dados = json.load(f)
+    codigos: Dict[str, str] = {}
+    for item in dados["Nomenclaturas"]:
+        codigo = _somente_digitos(item["Codigo"])
+        # "-- Reprodutores de raça pura" -> "Reprodutores de raça pura"; sem marcação HTML nem tabs
+        descricao = re.sub(r"<[^>]+>", "", item["Descricao"])
+        descricao = re.sub(r"\s+", " ", descricao).lstrip("- ").strip()
+        if codigo and descricao:
+            codigos[codigo] = descricao
+    temporario = destino + ".tmp"
+    with open(temporario, "w", encoding="utf-8", newline="\n") as f:
+        for codigo in sorted(codigos):
+            f.write(f"{codigo}\t{codigos[codigo]}\n")
+    os.replace(temporario, destino)
+    obter_referencias.cache_clear()
+    return len(codigos)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gera o ncm.tsv a partir da tabela NCM do Portal Único Siscomex")
+    parser.add_argument("json", help="Arquivo JSON de nomenclaturas baixado do Siscomex")
+    parser.add_argument("--destino", default=os.path.join(DIRETORIO_REFERENCIAS, "ncm.tsv"))
+    args = parser.parse_args(argv)
+    print(f"{importar_ncm(args.json, args.destino)} códigos NCM gravados em {args.destino}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
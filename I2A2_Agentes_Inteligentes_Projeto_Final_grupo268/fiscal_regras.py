@@ -0,0 +1,445 @@
+import json
+import operator
+import os
+import re
+import string
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from models import NotaFiscal
+
+
+# Arquivo de regras distribuído junto com o módulo
+ARQUIVO_REGRAS_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regras_fiscais.json")
+
+# Nível da regra -> campo correspondente em ResultadoValidacao
+NIVEIS = {
+    "inconsistencia": "inconsistencias",
+    "alerta": "alertas",
+    "recomendacao": "recomendacoes",
+}
+
+ESCOPOS = ("nota", "item")
+
+
+def _normalizar_lista(valor):
+    return tuple(valor) if isinstance(valor, (list, tuple, set)) else (valor,)
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    return serie.fillna("").astype(str)
+
+
+# Operadores vetorizados: recebem a coluna (Series) e o valor já resolvido
+OPERADORES: Dict[str, Callable[[pd.Series, Any], pd.Series]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "em": lambda s, v: s.isin(_normalizar_lista(v)),
+    "fora_de": lambda s, v: ~s.isin(_normalizar_lista(v)),
+    "comeca_com": lambda s, v: _texto(s).str.startswith(_normalizar_lista(v)),
+    "regex": lambda s, v: _texto(s).str.fullmatch(v),
+    "vazio": lambda s, v: _texto(s).str.strip() == "" if v in (None, True) else _texto(s).str.strip() != "",
+}
+
+
+def _texto_escalar(valor: Any) -> str:
+    return "" if valor is None or valor != valor else str(valor)
+
+
+def _comparar_escalar(funcao: Callable[[Any, Any], Any]) -> Callable[[Any, Any], bool]:
+    # Tipos incomparáveis (texto x número) não disparam a regra
+    def comparar(x, v):
+        try:
+            return bool(funcao(x, v))
+        except TypeError:
+            return False
+    return comparar
+
+
+# Mesmos operadores sobre um único valor: usados quando o lote tem poucas notas
+OPERADORES_ESCALARES: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": _comparar_escalar(operator.eq),
+    "!=": _comparar_escalar(operator.ne),
+    ">": _comparar_escalar(operator.gt),
+    ">=": _comparar_escalar(operator.ge),
+    "<": _comparar_escalar(operator.lt),
+    "<=": _comparar_escalar(operator.le),
+    "em": lambda x, v: x in _normalizar_lista(v),
+    "fora_de": lambda x, v: x not in _normalizar_lista(v),
+    "comeca_com": lambda x, v: _texto_escalar(x).startswith(_normalizar_lista(v)),
+    "regex": lambda x, v: re.fullmatch(v, _texto_escalar(x)) is not None,
+    "vazio": lambda x, v: (_texto_escalar(x).strip() == "") == (v in (None, True)),
+}
+
+# Lotes até este tamanho são avaliados linha a linha: montar DataFrames custa mais que as regras
+# (uma nota: ~0,15 ms contra ~14 ms; as duas formas empatam perto de 500 notas)
+LIMITE_ESCALAR = 256
+
+
+class DefinicaoRegra(BaseModel):
+    """Definição declarativa de uma regra fiscal"""
+    id: str
+    descricao: Optional[str] = None
+    escopo: str = "nota"
+    nivel: str = "alerta"
+    condicao: Dict[str, Any]
+    mensagem: str
+    ativa: bool = True
+
+
+class EstatisticaRegra(BaseModel):
+    """Ocorrências e tempo de execução de uma regra"""
+    regra_id: str
+    nivel: str
+    escopo: str
+    ocorrencias: int = 0
+    tempo_ms: float = 0.0
+
+
+class ResultadoRegras(BaseModel):
+    """Achados do motor de regras para um lote de notas"""
+    achados: Dict[int, Dict[str, List[str]]] = Field(default_factory=dict)
+    estatisticas: List[EstatisticaRegra] = Field(default_factory=list)
+
+    def mensagens(self, idx_nota: int, nivel: str) -> List[str]:
+        """Retorna as mensagens de um nível para a nota do lote"""
+        return self.achados.get(idx_nota, {}).get(nivel, [])
+
+    def aplicar(
+        self,
+        idx_nota: int,
+        inconsistencias: List[str],
+        alertas: List[str],
+        recomendacoes: List[str]
+    ) -> None:
+        """Acrescenta os achados da nota às listas de ResultadoValidacao"""
+        inconsistencias.extend(self.mensagens(idx_nota, "inconsistencia"))
+        alertas.extend(self.mensagens(idx_nota, "alerta"))
+        recomendacoes.extend(self.mensagens(idx_nota, "recomendacao"))
+
+    @property
+    def tempo_total_ms(self) -> float:
+        return sum(e.tempo_ms for e in self.estatisticas)
+
+
+def linha_nota(idx: int, nota: NotaFiscal) -> Dict[str, Any]:
+    """Linha da tabela de notas (escopo "nota")"""
+    t = nota.totalizadores
+    return {
+        "idx_nota": idx,
+        "chave_acesso": nota.chave_acesso,
+        "numero": nota.numero,
+        "serie": nota.serie,
+        "data_emissao": nota.data_emissao,
+        "emitente_cnpj": nota.emitente.cnpj,
+        "emitente_uf": nota.emitente.endereco.uf,
+        "destinatario_doc": nota.destinatario.cpf_cnpj,
+        "destinatario_uf": nota.destinatario.endereco.uf,
+        "qtd_itens": len(nota.produtos),
+        "base_calculo_icms": float(t.base_calculo_icms),
+        "valor_icms": float(t.valor_icms),
+        "valor_ipi": float(t.valor_ipi),
+        "valor_pis": float(t.valor_pis),
+        "valor_cofins": float(t.valor_cofins),
+        "valor_produtos": float(t.valor_produtos),
+        "valor_frete": float(t.valor_frete),
+        "valor_seguro": float(t.valor_seguro),
+        "valor_desconto": float(t.valor_desconto),
+        "valor_total_nota": float(t.valor_total_nota),
+    }
+
+
+def linhas_itens(idx: int, nota: NotaFiscal) -> List[Dict[str, Any]]:
+    """Linhas da tabela de itens (escopo "item") de uma nota"""
+    return [
+        {
+            "idx_nota": idx,
+            "numero_item": num_item,
+            "emitente_cnpj": nota.emitente.cnpj,
+            "emitente_uf": nota.emitente.endereco.uf,
+            "destinatario_uf": nota.destinatario.endereco.uf,
+            "codigo": p.codigo,
+            "descricao": p.descricao,
+            "ncm": p.ncm,
+            "cfop": p.cfop,
+            "unidade": p.unidade,
+            "quantidade": float(p.quantidade),
+            "valor_unitario": float(p.valor_unitario),
+            "valor_total": float(p.valor_total),
+            "icms_base_calculo": float(p.impostos.icms_base_calculo),
+            "icms_valor": float(p.impostos.icms_valor),
+            "ipi_valor": float(p.impostos.ipi_valor),
+            "pis_valor": float(p.impostos.pis_valor),
+            "cofins_valor": float(p.impostos.cofins_valor),
+        }
+        for num_item, p in enumerate(nota.produtos, start=1)
+    ]
+
+
+# Colunas disponíveis em cada escopo: regras que citam outra coluna são rejeitadas ao compilar
+COLUNAS = {
+    "nota": (
+        "idx_nota", "chave_acesso", "numero", "serie", "data_emissao", "emitente_cnpj", "emitente_uf",
+        "destinatario_doc", "destinatario_uf", "qtd_itens", "base_calculo_icms", "valor_icms", "valor_ipi",
+        "valor_pis", "valor_cofins", "valor_produtos", "valor_frete", "valor_seguro", "valor_desconto",
+        "valor_total_nota",
+    ),
+    "item": (
+        "idx_nota", "numero_item", "emitente_cnpj", "emitente_uf", "destinatario_uf", "codigo", "descricao",
+        "ncm", "cfop", "unidade", "quantidade", "valor_unitario", "valor_total", "icms_base_calculo",
+        "icms_valor", "ipi_valor", "pis_valor", "cofins_valor",
+    ),
+}
+
+
+def montar_linhas(notas: List[NotaFiscal]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Converte um lote de notas em listas de linhas de notas e itens"""
+    linhas_notas = []
+    linhas_de_itens = []
+    for idx, nota in enumerate(notas):
+        linhas_notas.append(linha_nota(idx, nota))
+        linhas_de_itens.extend(linhas_itens(idx, nota))
+    return linhas_notas, linhas_de_itens
+
+
+def montar_dataframes(notas: List[NotaFiscal]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Converte um lote de notas em tabelas colunares de notas e itens"""
+    linhas_notas, linhas_de_itens = montar_linhas(notas)
+    return pd.DataFrame(linhas_notas), pd.DataFrame(linhas_de_itens)
+
+
+class RegraCompilada:
+    """Regra convertida em predicado vetorizado sobre um DataFrame"""
+
+    def __init__(self, definicao: DefinicaoRegra):
+        if definicao.escopo not in ESCOPOS:
+            raise ValueError(f"Regra {definicao.id}: escopo inválido '{definicao.escopo}'")
+        if definicao.nivel not in NIVEIS:
+            raise ValueError(f"Regra {definicao.id}: nível inválido '{definicao.nivel}'")
+
+        self.definicao = definicao
+        self.id = definicao.id
+        self.escopo = definicao.escopo
+        self.nivel = definicao.nivel
+        self.colunas = frozenset(COLUNAS[self.escopo])
+        self.predicado = self._compilar(definicao.condicao)
+        self.predicado_linha = self._compilar_linha(definicao.condicao)
+        self.campos_mensagem = [
+            campo.split(".")[0].split("[")[0]
+            for _, campo, _, _ in string.Formatter().parse(definicao.mensagem)
+            if campo
+        ]
+        for campo in self.campos_mensagem:
+            self._checar_coluna(campo)
+
+    def _checar_coluna(self, coluna: str) -> None:
+        if coluna not in self.colunas:
+            raise ValueError(f"Regra {self.id}: coluna '{coluna}' não existe no escopo '{self.escopo}'")
+
+    def _compilar(self, condicao: Dict[str, Any]) -> Callable[[pd.DataFrame], pd.Series]:
+        """Compila recursivamente uma condição em função DataFrame -> máscara"""
+        if "todos" in condicao:
+            partes = [self._compilar(c) for c in condicao["todos"]]
+
+            def todos(df):
+                mascara = pd.Series(True, index=df.index)
+                for parte in partes:
+                    mascara &= parte(df)
+                return mascara
+            return todos
+
+        if "algum" in condicao:
+            partes = [self._compilar(c) for c in condicao["algum"]]
+
+            def algum(df):
+                mascara = pd.Series(False, index=df.index)
+                for parte in partes:
+                    mascara |= parte(df)
+                return mascara
+            return algum
+
+        if "nao" in condicao:
+            parte = self._compilar(condicao["nao"])
+            return lambda df: ~parte(df)
+
+        campo = condicao.get("campo")
+        op = condicao.get("op", "==")
+        if not campo:
+            raise ValueError(f"Regra {self.id}: condição sem 'campo': {condicao}")
+        if op not in OPERADORES:
+            raise ValueError(f"Regra {self.id}: operador desconhecido '{op}'")
+        self._checar_coluna(campo)
+
+        funcao = OPERADORES[op]
+        resolver = self._compilar_valor(condicao.get("valor"))
+
+        def comparar(df):
+            resultado = funcao(df[campo], resolver(df))
+            return resultado.fillna(False).astype(bool)
+        return comparar
+
+    def _compilar_valor(self, valor: Any) -> Callable[[pd.DataFrame], Any]:
+        """Resolve o lado direito: literal, outra coluna ou limite por chave"""
+        if isinstance(valor, dict) and "campo" in valor:
+            coluna = valor["campo"]
+            self._checar_coluna(coluna)
+            return lambda df: df[coluna]
+
+        if isinstance(valor, dict) and "por" in valor:
+            # Limite específico por chave (ex.: por CNPJ do emitente) com valor padrão
+            chave = valor["por"]
+            self._checar_coluna(chave)
+            mapa = valor.get("mapa", {})
+            padrao = valor.get("padrao")
+            return lambda df: df[chave].map(mapa).fillna(padrao)
+
+        return lambda df: valor
+
+    def _compilar_linha(self, condicao: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+        """Mesma condição compilada para uma linha (dict); _compilar já validou a estrutura"""
+        if "todos" in condicao:
+            partes = [self._compilar_linha(c) for c in condicao["todos"]]
+            return lambda linha: all(parte(linha) for parte in partes)
+
+        if "algum" in condicao:
+            partes = [self._compilar_linha(c) for c in condicao["algum"]]
+            return lambda linha: any(parte(linha) for parte in partes)
+
+        if "nao" in condicao:
+            parte = self._compilar_linha(condicao["nao"])
+            return lambda linha: not parte(linha)
+
+        campo = condicao["campo"]
+        funcao = OPERADORES_ESCALARES[condicao.get("op", "==")]
+        valor = condicao.get("valor")
+
+        if isinstance(valor, dict) and "campo" in valor:
+            coluna = valor["campo"]
+            return lambda linha: funcao(linha[campo], linha[coluna])
+
+        if isinstance(valor, dict) and "por" in valor:
+            chave = valor["por"]
+            mapa = valor.get("mapa", {})
+            padrao = valor.get("padrao")
+
+            def por_chave(linha):
+                limite = mapa.get(linha[chave])
+                return funcao(linha[campo], padrao if limite is None else limite)
+            return por_chave
+
+        return lambda linha: funcao(linha[campo], valor)
+
+    def avaliar(self, df: pd.DataFrame) -> pd.Series:
+        """Retorna a máscara booleana das linhas que disparam a regra"""
+        if df.empty:
+            return pd.Series(False, index=df.index)
+        return self.predicado(df)
+
+    def formatar(self, linhas: pd.DataFrame) -> List[str]:
+        """Monta as mensagens apenas para as linhas que dispararam"""
+        if not self.campos_mensagem:
+            return [self.definicao.mensagem] * len(linhas)
+        registros = linhas[self.campos_mensagem].to_dict("records")
+        return [self.definicao.mensagem.format(**r) for r in registros]
+
+    def formatar_linha(self, linha: Dict[str, Any]) -> str:
+        """Mensagem de uma linha (dict) que disparou"""
+        return self.definicao.mensagem.format(**{campo: linha[campo] for campo in self.campos_mensagem})
+
+
+class MotorRegras:
+    """Motor determinístico de regras fiscais vetorizadas"""
+
+    def __init__(self, definicoes: List[DefinicaoRegra]):
+        self.regras = [RegraCompilada(d) for d in definicoes if d.ativa]
+
+    @classmethod
+    def de_dict(cls, dados: Dict[str, Any]) -> "MotorRegras":
+        """Cria o motor a partir do dicionário {'regras': [...]}"""
+        return cls([DefinicaoRegra(**r) for r in dados.get("regras", [])])
+
+    @classmethod
+    def de_arquivo(cls, caminho: str) -> "MotorRegras":
+        """Carrega regras de um arquivo JSON ou YAML"""
+        with open(caminho, "r", encoding="utf-8") as f:
+            if caminho.endswith((".yaml", ".yml")):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("PyYAML é necessário para carregar regras em YAML (pip install pyyaml)")
+                dados = yaml.safe_load(f)
+            else:
+                dados = json.load(f)
+        return cls.de_dict(dados or {})
+
+    def avaliar(self, notas: List[NotaFiscal]) -> ResultadoRegras:
+        """Executa todas as regras sobre um lote de notas"""
+        if len(notas) <= LIMITE_ESCALAR:
+            return self.avaliar_linhas(*montar_linhas(notas))
+        df_notas, df_itens = montar_dataframes(notas)
+        return self.avaliar_dataframes(df_notas, df_itens)
+
+    def avaliar_linhas(self, linhas_notas: List[Dict[str, Any]], linhas_de_itens: List[Dict[str, Any]]) -> ResultadoRegras:
+        """Executa as regras linha a linha (ver montar_linhas), sem montar DataFrames"""
+        resultado = ResultadoRegras()
+        tabelas = {"nota": linhas_notas, "item": linhas_de_itens}
+
+        for regra in self.regras:
+            inicio = time.perf_counter()
+            ocorrencias = 0
+            for linha in tabelas[regra.escopo]:
+                if regra.predicado_linha(linha):
+                    ocorrencias += 1
+                    por_nivel = resultado.achados.setdefault(linha["idx_nota"], {})
+                    por_nivel.setdefault(regra.nivel, []).append(regra.formatar_linha(linha))
+
+            resultado.estatisticas.append(EstatisticaRegra(
+                regra_id=regra.id,
+                nivel=regra.nivel,
+                escopo=regra.escopo,
+                ocorrencias=ocorrencias,
+                tempo_ms=(time.perf_counter() - inicio) * 1000
+            ))
+
+        return resultado
+
+    def avaliar_dataframes(self, df_notas: pd.DataFrame, df_itens: pd.DataFrame) -> ResultadoRegras:
+        """Executa as regras sobre tabelas já montadas (ver montar_dataframes)"""
+        resultado = ResultadoRegras()
+        tabelas = {"nota": df_notas, "item": df_itens}
+
+        for regra in self.regras:
+            inicio = time.perf_counter()
+            df = tabelas[regra.escopo]
+            mascara = regra.avaliar(df)
+            disparos = df[mascara]
+
+            if not disparos.empty:
+                mensagens = regra.formatar(disparos)
+                for idx_nota, msg in zip(disparos["idx_nota"], mensagens):
+                    por_nivel = resultado.achados.setdefault(int(idx_nota), {})
+                    por_nivel.setdefault(regra.nivel, []).append(msg)
+
+            resultado.estatisticas.append(EstatisticaRegra(
+                regra_id=regra.id,
+                nivel=regra.nivel,
+                escopo=regra.escopo,
+                ocorrencias=len(disparos),
+                tempo_ms=(time.perf_counter() - inicio) * 1000
+            ))
+
+        return resultado
+
+
+@lru_cache(maxsize=1)
+def carregar_motor_padrao() -> MotorRegras:
+    """Motor com as regras distribuídas em regras_fiscais.json (carregado uma vez)"""
+    return MotorRegras.de_arquivo(ARQUIVO_REGRAS_PADRAO)
@@ -1,42 +1,56 @@
-import pandas as pd
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.units import cm
 from datetime import datetime
 from models import NotaFiscal, ResultadoValidacao
-from typing import List
+from metricas import cronometrar
+from typing import TYPE_CHECKING, List, Optional
 import io
 
+# pandas e reportlab são importados no primeiro uso: a maior parte das
+# execuções não gera relatórios
+if TYPE_CHECKING:
+    import pandas as pd
+    from cubo import CuboFiscal
+
 
 class GeradorRelatorios:
     """Gerador de relatórios gerenciais e fiscais"""
     
     def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self._criar_estilos_customizados()
+        self._styles = None
+    
+    @property
+    def styles(self):
+        """Folha de estilos do PDF, criada no primeiro uso"""
+        if self._styles is None:
+            from reportlab.lib.styles import getSampleStyleSheet
+            self._styles = getSampleStyleSheet()
+            self._criar_estilos_customizados()
+        return self._styles
     
     def _criar_estilos_customizados(self):
         """Cria estilos customizados para o PDF"""
-        self.styles.add(ParagraphStyle(
+        from reportlab.lib import colors
+        from reportlab.lib.styles import ParagraphStyle
+        
+        self._styles.add(ParagraphStyle(
             name='TituloCustom',
-            parent=self.styles['Heading1'],
+            parent=self._styles['Heading1'],
             fontSize=16,
             textColor=colors.HexColor('#1a237e'),
             spaceAfter=12
         ))
         
-        self.styles.add(ParagraphStyle(
+        self._styles.add(ParagraphStyle(
             name='SubtituloCustom',
-            parent=self.styles['Heading2'],
+            parent=self._styles['Heading2'],
             fontSize=12,
             textColor=colors.HexColor('#303f9f'),
             spaceAfter=8
         ))
     
-    def gerar_dataframe_produtos(self, nota: NotaFiscal) -> pd.DataFrame:
+    def gerar_dataframe_produtos(self, nota: NotaFiscal) -> "pd.DataFrame":
         """Gera DataFrame com produtos da nota"""
+        import pandas as pd
+        
         dados = []
         for p in nota.produtos:
             dados.append({
@@ -52,8 +66,16 @@ class GeradorRelatorios:
             })
         return pd.DataFrame(dados)
     
-    def gerar_excel(self, notas: List[NotaFiscal]) -> bytes:
+    @cronometrar("relatorio.excel")
+    def gerar_excel(self, notas: List[NotaFiscal], cubo: Optional["CuboFiscal"] = None) -> bytes:
         """Gera arquivo Excel com múltiplas notas"""
+        import pandas as pd
+        from cubo import CuboFiscal
+        
+        # O cubo da sessão já tem os itens de todas as notas; sem ele, é montado aqui
+        if cubo is None or len(cubo) != len(notas):
+            cubo = CuboFiscal.de_notas(notas)
+        
         output = io.BytesIO()
         
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -75,10 +97,31 @@ class GeradorRelatorios:
             df_resumo = pd.DataFrame(resumo_data)
             df_resumo.to_excel(writer, sheet_name='Resumo', index=False)
             
-            # Aba: Detalhamento (primeira nota como exemplo)
-            if notas:
-                df_produtos = self.gerar_dataframe_produtos(notas[0])
-                df_produtos.to_excel(writer, sheet_name='Produtos', index=False)
+            # Aba: Detalhamento dos produtos de todas as notas
+            itens = cubo.em_reais(cubo.filtrar_itens())
+            df_produtos = pd.DataFrame({
+                'Nota': itens['numero'],
+                'Emitente': itens['emitente'],
+                'Código': itens['codigo'],
+                'Descrição': itens['descricao'],
+                'NCM': itens['ncm'],
+                'CFOP': itens['cfop'],
+                'Qtd': itens['quantidade'],
+                'Valor Unit.': itens['valor_unitario'],
+                'Valor Total': itens['valor_total'],
+                'ICMS': itens['icms'],
+                'IPI': itens['ipi'],
+                'PIS': itens['pis'],
+                'COFINS': itens['cofins']
+            })
+            df_produtos.to_excel(writer, sheet_name='Produtos', index=False)
+            
+            # Aba: Impostos por NCM e CFOP
+            df_ncm = cubo.agrupar(['ncm', 'cfop']).rename(columns={
+                'ncm': 'NCM', 'cfop': 'CFOP', 'valor_total': 'Valor Total',
+                'icms': 'ICMS', 'ipi': 'IPI', 'pis': 'PIS', 'cofins': 'COFINS', 'notas': 'Notas'
+            })
+            df_ncm.to_excel(writer, sheet_name='Por NCM e CFOP', index=False)
             
             # Aba: Totalizadores
             totais_data = []
@@ -101,12 +144,18 @@ class GeradorRelatorios:
         output.seek(0)
         return output.read()
     
+    @cronometrar("relatorio.pdf")
     def gerar_pdf_relatorio(
         self, 
         nota: NotaFiscal, 
         validacao: ResultadoValidacao
     ) -> bytes:
         """Gera relatório PDF completo"""
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import cm
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+        
         output = io.BytesIO()
         doc = SimpleDocTemplate(output, pagesize=A4)
         elementos = []
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from metricas import metricas
+
+
+# Limite do corpo da requisição (um zip com muitas notas cabe com folga)
+TAMANHO_MAXIMO_CORPO = 50 * 2**20
+
+
+class Job:
+    """Lote de arquivos enviados em uma requisição"""
+
+    def __init__(self, nomes: List[str]):
+        self.id = uuid.uuid4().hex
+        self.criado_em = time.time()
+        self.resultados: List[Optional[List[Dict]]] = [None] * len(nomes)  # por arquivo, um por nota
+        self.nomes = nomes
+        self.pendentes = len(nomes)
+        self.concluido = asyncio.Event()
+
+    def registrar(self, posicao: int, resultados: List[Dict]) -> None:
+        self.resultados[posicao] = resultados
+        self.pendentes -= 1
+        if self.pendentes == 0:
+            self.concluido.set()
+
+    def como_dict(self) -> Dict:
+        return {
+            "job": self.id,
+            "status": "concluido" if self.pendentes == 0 else "processando",
+            "total": len(self.nomes),
+            "pendentes": self.pendentes,
+            "resultados": [r for resultados in self.resultados if resultados is not None for r in resultados],
+        }
+
+
+class ServicoIngestao:
+    """Aplicação ASGI que extrai e valida NF-e em um pool limitado de workers"""
+
+    def __init__(
+        self,
+        workers: int = os.cpu_count() or 1,
+        tamanho_fila: int = 256,
+        usar_ia: bool = False,
+        api_key: str = "",
+        modelo=None,
+        max_jobs: int = 1000,
+        tolerante: bool = False
+    ):
+        self.workers = workers
+        self.tamanho_fila = tamanho_fila
+        self.usar_ia = usar_ia
+        self.api_key = api_key
+        self.modelo = modelo
+        self.max_jobs = max_jobs
+        self.tolerante = tolerante
+
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.rejeitadas = 0
+        self.processadas = 0
+        self.em_execucao = 0
+        self._fila: Optional[asyncio.Queue] = None
+        self._tarefas: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+
+    # --------- Ciclo de vida ---------
+
+    async def iniciar(self) -> None:
+        if self._fila is not None:
+            return
+        self._fila = asyncio.Queue(maxsize=self.tamanho_fila)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="nfe")
+        self._tarefas = [asyncio.create_task(self._trabalhador()) for _ in range(self.workers)]
+
+    async def encerrar(self) -> None:
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._fila = None
+        self._tarefas = []
+
+    # --------- Processamento ---------
+
+    def _componentes(self):
+        """Extrator e validador próprios de cada thread (mantêm estado entre chamadas)"""
+        if not hasattr(self._local, "extrator"):
+            from extractor import NFeExtractor
+            from validator import ModeloDesligado, ValidadorInteligente
+
+            modelo = self.modelo
+            if modelo is None and not self.usar_ia:
+                modelo = ModeloDesligado()
+            self._local.extrator = NFeExtractor(tolerante=self.tolerante)
+            self._local.validador = ValidadorInteligente(self.api_key, modelo=modelo)
+        return self._local.extrator, self._local.validador
+
+    def _processar(self, nome: str, conteudo: bytes) -> List[Dict]:
+        """Um resultado por NF-e do arquivo (enviNFe e lotes de nfeProc trazem várias)"""
+        from pydantic_core import from_json
+        from exportacao import registro_para_json
+
+        extrator, validador = self._componentes()
+        notas = []
+        erro = None
+        with metricas.medir("servico.nota"):
+            try:
+                # Notas lidas antes de um erro no meio do arquivo são mantidas
+                for nota in extrator.extrair_notas(conteudo):
+                    notas.append(nota)
+            except Exception as e:
+                erro = str(e)
+            if not notas and erro is None:
+                erro = "nenhuma NF-e encontrada no arquivo"
+            try:
+                validacoes = validador.validar_lote(notas, usar_ia=self.usar_ia) if notas else []
+            except Exception as e:
+                return [{"arquivo": nome, "status": "erro", "erro": str(e)}]
+        # Mesmo formato das linhas NDJSON do exportador: decimais como strings exatas, não floats
+        resultados = [
+            from_json(registro_para_json(nota, validacao, {"arquivo": nome, "indice": indice, "status": "ok"}))
+            for indice, (nota, validacao) in enumerate(zip(notas, validacoes))
+        ]
+        if erro is not None:
+            resultados.append({"arquivo": nome, "indice": len(notas), "status": "erro", "erro": erro})
+        return resultados
+
+    async def _trabalhador(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job, posicao, nome, conteudo = await self._fila.get()
+            self.em_execucao += 1
+            try:
+                resultados = await loop.run_in_executor(self._executor, self._processar, nome, conteudo)
+            except Exception as e:
+                resultados = [{"arquivo": nome, "status": "erro", "erro": str(e)}]
+            finally:
+                self.em_execucao -= 1
+                self._fila.task_done()
+            self.processadas += sum(r["status"] == "ok" for r in resultados)
+            job.registrar(posicao, resultados)
+
+    def enfileirar(self, arquivos: List[Tuple[str, bytes]]) -> Optional[Job]:
+        """Enfileira todos os arquivos ou nenhum; None quando a fila não comporta o lote"""
+        if not arquivos or self._fila.qsize() + len(arquivos) > self.tamanho_fila:
+            return None
+        job = Job([nome for nome, _ in arquivos])
+        for posicao, (nome, conteudo) in enumerate(arquivos):
+            self._fila.put_nowait((job, posicao, nome, conteudo))
+
+        self.jobs[job.id] = job
+        # Descarta os jobs concluídos mais antigos; jobs em andamento nunca são descartados
+        excedente = len(self.jobs) - self.max_jobs
+        for job_id in [i for i, j in self.jobs.items() if j.pendentes == 0][:max(0, excedente)]:
+            del self.jobs[job_id]
+        return job
+
+    # --------- Protocolo ASGI ---------
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        await self.iniciar()  # servidores sem lifespan
+        metodo, caminho = scope["method"], scope["path"].rstrip("/") or "/"
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            if metodo == "POST" and caminho == "/notas":
+                status = await self._post_notas(scope, receive, send)
+            elif metodo == "GET" and caminho.startswith("/jobs/"):
+                status = await self._get_job(caminho[len("/jobs/"):], send)
+            elif metodo == "GET" and caminho == "/saude":
+                status = await _responder(send, 200, self.saude())
+            elif metodo == "GET" and caminho == "/metricas":
+                status = await _responder(send, 200, self.exportar_metricas().encode("utf-8"), "text/plain; version=0.0.4")
+            else:
+                status = await _responder(send, 404, {"erro": "rota não encontrada"})
+        finally:
+            if metricas.habilitado:
+                metricas.registrar(f"servico.http_{status // 100}xx", time.perf_counter() - inicio, erro=status >= 500)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "lifespan.startup":
+                await self.iniciar()
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                await self.encerrar()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _post_notas(self, scope, receive, send) -> int:
+        corpo = await _ler_corpo(receive, TAMANHO_MAXIMO_CORPO)
+        if corpo is None:
+            return await _responder(send, 413, {"erro": f"corpo excede {TAMANHO_MAXIMO_CORPO} bytes"})
+
+        cabecalhos = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        parametros = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        aguardar = parametros.get("aguardar", ["0"])[0] in ("1", "true", "sim")
+
+        try:
+            arquivos = _arquivos_do_corpo(corpo, cabecalhos.get("content-type", ""))
+        except ValueError as e:
+            return await _responder(send, 400, {"erro": str(e)})
+        if not arquivos:
+            return await _responder(send, 400, {"erro": "nenhum XML encontrado no corpo"})
+
+        if len(arquivos) > self.tamanho_fila:
+            # Nunca caberia na fila, nem vazia: repetir a requisição não adianta
+            return await _responder(
+                send, 413,
+                {"erro": f"lote com {len(arquivos)} arquivos excede a capacidade da fila ({self.tamanho_fila});"
+                         " divida-o em requisições menores", "capacidade": self.tamanho_fila}
+            )
+        job = self.enfileirar(arquivos)
+        if job is None:
+            # Backpressure: o cliente deve tentar novamente mais tarde
+            self.rejeitadas += 1
+            return await _responder(
+                send, 429,
+                {"erro": "fila cheia", "fila": self._fila.qsize(), "capacidade": self.tamanho_fila},
+                cabecalhos_extra=[(b"retry-after", b"1")]
+            )
+
+        if aguardar:
+            await job.concluido.wait()
+            return await _responder(send, 200, job.como_dict())
+        return await _responder(
+            send, 202, {"job": job.id, "total": len(arquivos)},
+            cabecalhos_extra=[(b"location", f"/jobs/{job.id}".encode("latin-1"))]
+        )
+
+    async def _get_job(self, job_id: str, send) -> int:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return await _responder(send, 404, {"erro": "job não encontrado"})
+        return await _responder(send, 200, job.como_dict())
+
+    # --------- Saúde e métricas ---------
+
+    def saude(self) -> Dict:
+        return {
+            "status": "ok" if self._fila is not None else "parado",
+            "workers": self.workers,
+            "fila": self._fila.qsize() if self._fila is not None else 0,
+            "capacidade": self.tamanho_fila,
+            "em_execucao": self.em_execucao,
+            "processadas": self.processadas,
+            "rejeitadas": self.rejeitadas,
+            "jobs": len(self.jobs),
+        }
+
+    def exportar_metricas(self) -> str:
+        saude = self.saude()
+        linhas = []
+        for nome, valor in (
+            ("fila", saude["fila"]), ("capacidade_fila", saude["capacidade"]),
+            ("em_execucao", saude["em_execucao"]), ("workers", saude["workers"]),
+        ):
+            linhas += [f"# TYPE fiscal_servico_{nome} gauge", f"fiscal_servico_{nome} {valor}"]
+        for nome, valor in (("notas_processadas", saude["processadas"]), ("requisicoes_rejeitadas", saude["rejeitadas"])):
+            linhas += [f"# TYPE fiscal_servico_{nome}_total counter", f"fiscal_servico_{nome}_total {valor}"]
+        return "\n".join(linhas) + "\n" + metricas.exportar_prometheus()
+
+
+# --------- Utilidades HTTP ---------
+
+async def _ler_corpo(receive, limite: int) -> Optional[bytes]:
+    partes, tamanho = [], 0
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            break
+        parte = mensagem.get("body", b"")
+        tamanho += len(parte)
+        if tamanho > limite:
+            return None
+        partes.append(parte)
+        if not mensagem.get("more_body", False):
+            break
+    return b"".join(partes)
+
+
+def _arquivos_do_corpo(corpo: bytes, tipo: str) -> List[Tuple[str, bytes]]:
+    """Aceita um XML, um zip de XMLs ou JSON {"arquivos": [{"nome", "xml" | "xml_base64"}]}"""
+    tipo = tipo.split(";")[0].strip().lower()
+    if tipo in ("application/zip", "application/x-zip-compressed") or corpo[:4] == b"PK\x03\x04":
+        try:
+            with zipfile.ZipFile(io.BytesIO(corpo)) as arquivo_zip:
+                return [
+                    (nome, arquivo_zip.read(nome))
+                    for nome in sorted(arquivo_zip.namelist())
+                    if nome.lower().endswith(".xml")
+                ]
+        except zipfile.BadZipFile:
+            raise ValueError("zip inválido")
+
+    if tipo == "application/json":
+        try:
+            dados = json.loads(corpo)
+            return [
+                (
+                    item.get("nome", f"arquivo_{i}.xml"),
+                    base64.b64decode(item["xml_base64"]) if "xml_base64" in item else item["xml"].encode("utf-8"),
+                )
+                for i, item in enumerate(dados["arquivos"])
+            ]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"JSON inválido: esperado {{\"arquivos\": [{{\"nome\", \"xml\"}}]}} ({e})")
+
+    return [("arquivo.xml", corpo)] if corpo.strip() else []
+
+
+async def _responder(send, status: int, corpo, tipo: str = "application/json", cabecalhos_extra=()) -> int:
+    if not isinstance(corpo, bytes):
+        corpo = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        tipo = "application/json; charset=utf-8"
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", tipo.encode("latin-1")), (b"content-length", str(len(corpo)).encode())]
+                   + list(cabecalhos_extra),
+    })
+    await send({"type": "http.response.body", "body": corpo})
+    return status
+
+
+def criar_app() -> ServicoIngestao:
+    """Configuração pelas variáveis FISCAL_WORKERS, FISCAL_FILA, FISCAL_IA e FISCAL_TOLERANTE (para `uvicorn servico:app`)"""
+    return ServicoIngestao(
+        workers=int(os.getenv("FISCAL_WORKERS", os.cpu_count() or 1)),
+        tamanho_fila=int(os.getenv("FISCAL_FILA", 256)),
+        usar_ia=os.getenv("FISCAL_IA") == "1",
+        api_key=os.getenv("GOOGLE_API_KEY", ""),
+        tolerante=os.getenv("FISCAL_TOLERANTE") == "1",
+    )
+
+
+app = criar_app()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de ingestão de NF-e")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--fila", type=int, default=256, help="Capacidade da fila; acima disso responde 429 (413 para um lote maior que a fila)")
+    parser.add_argument("--ia", action="store_true", help="Inclui a análise com o Gemini")
+    parser.add_argument("--modelo-falso", action="store_true", help="Usa um LLM falso local (testes sem rede)")
+    parser.add_argument("--metricas", action="store_true", help="Habilita as métricas por etapa em /metricas")
+    parser.add_argument("--tolerante", action="store_true", help="Extração tolerante: campos inválidos viram inconsistências")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.metricas:
+        metricas.habilitado = True
+    modelo = None
+    if args.modelo_falso:
+        from benchmark import ModeloFalso
+        modelo = ModeloFalso()
+
+    servico = ServicoIngestao(
+        workers=args.workers,
+        tamanho_fila=args.fila,
+        usar_ia=args.ia or args.modelo_falso,
+        api_key=os.getenv("GOOGLE_API_KEY", ""),
+        modelo=modelo,
+        tolerante=args.tolerante,
+    )
+    uvicorn.run(servico, host=args.host, port=args.porta, lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
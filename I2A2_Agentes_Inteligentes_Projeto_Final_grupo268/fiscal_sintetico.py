@@ -0,0 +1,365 @@
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+
+# Código IBGE das UFs usadas na geração (compõe a chave de acesso)
+CODIGOS_UF = {
+    "SP": "35", "RJ": "33", "MG": "31", "PR": "41", "RS": "43",
+    "SC": "42", "BA": "29", "GO": "52", "PE": "26", "CE": "23",
+}
+
+MUNICIPIOS = {
+    "SP": "São Paulo", "RJ": "Rio de Janeiro", "MG": "Belo Horizonte", "PR": "Curitiba",
+    "RS": "Porto Alegre", "SC": "Florianópolis", "BA": "Salvador", "GO": "Goiânia",
+    "PE": "Recife", "CE": "Fortaleza",
+}
+
+# (NCM, descrição, unidade, faixa de preço unitário, alíquota de IPI)
+CATALOGO = [
+    ("84713012", "NOTEBOOK 14 POL 8GB RAM", "UN", (2500, 6000), Decimal("0.00")),
+    ("84716053", "MOUSE OPTICO USB", "UN", (20, 120), Decimal("0.00")),
+    ("85171300", "SMARTPHONE 128GB", "UN", (900, 5000), Decimal("0.00")),
+    ("85285200", "MONITOR LED 24 POL", "UN", (600, 1500), Decimal("0.00")),
+    ("22030000", "CERVEJA LATA 350ML", "CX", (40, 90), Decimal("0.06")),
+    ("22021000", "REFRIGERANTE PET 2L", "UN", (5, 12), Decimal("0.04")),
+    ("09012100", "CAFE TORRADO E MOIDO 500G", "PCT", (12, 35), Decimal("0.00")),
+    ("10063021", "ARROZ PARBOILIZADO TIPO 1 5KG", "PCT", (18, 35), Decimal("0.00")),
+    ("33051000", "XAMPU 400ML", "UN", (8, 40), Decimal("0.07")),
+    ("39232190", "SACO PLASTICO 60L C/100", "PCT", (15, 45), Decimal("0.00")),
+    ("48025610", "PAPEL A4 75G RESMA 500FL", "RS", (20, 40), Decimal("0.00")),
+    ("73181500", "PARAFUSO SEXTAVADO M8 C/100", "CX", (25, 80), Decimal("0.05")),
+    ("94033000", "MESA ESCRITORIO 120CM", "UN", (300, 1200), Decimal("0.00")),
+    ("40111000", "PNEU 175/70 R13", "UN", (250, 450), Decimal("0.02")),
+]
+
+# Cenários de tributação: (CST/grupo ICMS, alíquota ICMS, redução de base, alíquota PIS, alíquota COFINS)
+CENARIOS_TRIBUTACAO = [
+    ("ICMS00", Decimal("0.18"), Decimal("0"), Decimal("0.0165"), Decimal("0.076")),
+    ("ICMS00", Decimal("0.12"), Decimal("0"), Decimal("0.0065"), Decimal("0.03")),
+    ("ICMS20", Decimal("0.18"), Decimal("0.3333"), Decimal("0.0165"), Decimal("0.076")),
+    ("ICMS40", Decimal("0"), Decimal("0"), Decimal("0.0065"), Decimal("0.03")),
+]
+
+# Tipos de erro que podem ser injetados em uma nota
+ERROS = (
+    "cnpj_emitente",
+    "dv_chave",
+    "total_item",
+    "total_nota",
+    "ncm_inexistente",
+    "cfop_uf",
+)
+
+CENTAVO = Decimal("0.01")
+
+
+def _q(valor: Decimal, casas: Decimal = CENTAVO) -> Decimal:
+    return valor.quantize(casas, rounding=ROUND_HALF_UP)
+
+
+# --------- Documentos com dígitos verificadores válidos ---------
+
+def _dv_mod11(base: str, pesos: List[int]) -> str:
+    resto = sum(int(d) * p for d, p in zip(base, pesos)) % 11
+    return "0" if resto < 2 else str(11 - resto)
+
+
+def gerar_cnpj(rng: random.Random) -> str:
+    base = "".join(str(rng.randint(0, 9)) for _ in range(8)) + "0001"
+    base += _dv_mod11(base, [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    return base + _dv_mod11(base, [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+
+def gerar_cpf(rng: random.Random) -> str:
+    while True:
+        base = "".join(str(rng.randint(0, 9)) for _ in range(9))
+        if base != base[0] * 9:
+            break
+    base += _dv_mod11(base, list(range(10, 1, -1)))
+    return base + _dv_mod11(base, list(range(11, 1, -1)))
+
+
+def dv_chave(chave43: str) -> str:
+    """Dígito verificador da chave de acesso (módulo 11, pesos 2 a 9 da direita para a esquerda)"""
+    soma = 0
+    peso = 2
+    for digito in reversed(chave43):
+        soma += int(digito) * peso
+        peso = 2 if peso == 9 else peso + 1
+    resto = soma % 11
+    return "0" if resto in (0, 1) else str(11 - resto)
+
+
+def gerar_chave(uf: str, data: datetime, cnpj: str, serie: int, numero: int, codigo: int) -> str:
+    chave43 = (
+        f"{CODIGOS_UF[uf]}{data:%y%m}{cnpj}55{serie:03d}{numero:09d}1{codigo:08d}"
+    )
+    return chave43 + dv_chave(chave43)
+
+
+# --------- Gerador de NF-e ---------
+
+class GeradorNFe:
+    """Gera NF-e sintéticas no layout lido por NFeExtractor"""
+
+    def __init__(
+        self,
+        seed: int = 42,
+        itens_por_nota: Tuple[int, int] = (1, 10),
+        taxa_erros: float = 0.0,
+        num_emitentes: int = 50,
+        num_destinatarios: int = 200,
+        data_inicial: datetime = datetime(2024, 1, 1, 8, 0, 0)
+    ):
+        self.rng = random.Random(seed)
+        self.itens_por_nota = itens_por_nota
+        self.taxa_erros = taxa_erros
+        self.data_inicial = data_inicial
+
+        ufs = list(CODIGOS_UF)
+        self.emitentes = [
+            {"cnpj": gerar_cnpj(self.rng), "nome": f"EMPRESA SINTETICA {i:04d} LTDA", "uf": self.rng.choice(ufs),
+             "ie": str(self.rng.randint(10**8, 10**9 - 1))}
+            for i in range(num_emitentes)
+        ]
+        self.destinatarios = [
+            {"doc": gerar_cnpj(self.rng) if self.rng.random() < 0.7 else gerar_cpf(self.rng),
+             "nome": f"CLIENTE SINTETICO {i:05d}", "uf": self.rng.choice(ufs)}
+            for i in range(num_destinatarios)
+        ]
+
+    def _endereco(self, tag: str, uf: str) -> str:
+        return (
+            f"<{tag}><xLgr>RUA SINTETICA</xLgr><nro>{self.rng.randint(1, 9999)}</nro>"
+            f"<xBairro>CENTRO</xBairro><xMun>{escape(MUNICIPIOS[uf])}</xMun><UF>{uf}</UF>"
+            f"<CEP>{self.rng.randint(10**7, 10**8 - 1)}</CEP></{tag}>"
+        )
+
+    def gerar_nota(self, numero: int) -> Tuple[bytes, Dict]:
+        """Gera uma NF-e; retorna (xml, metadados com itens e erros injetados)"""
+        rng = self.rng
+        emitente = rng.choice(self.emitentes)
+        destinatario = rng.choice(self.destinatarios)
+        data = self.data_inicial + timedelta(minutes=numero * 7 + rng.randint(0, 6))
+        serie = 1
+
+        erros = []
+        if self.taxa_erros and rng.random() < self.taxa_erros:
+            erros.append(rng.choice(ERROS))
+
+        cnpj_emit = emitente["cnpj"]
+        if "cnpj_emitente" in erros:
+            cnpj_emit = cnpj_emit[:-1] + str((int(cnpj_emit[-1]) + 1) % 10)
+
+        chave = gerar_chave(emitente["uf"], data, emitente["cnpj"], serie, numero, rng.randint(0, 10**8 - 1))
+        if "dv_chave" in erros:
+            chave = chave[:-1] + str((int(chave[-1]) + 1) % 10)
+
+        mesma_uf = emitente["uf"] == destinatario["uf"]
+        cfop = ("5102" if mesma_uf else "6102")
+        if "cfop_uf" in erros:
+            cfop = "6102" if mesma_uf else "5102"
+
+        ncm_cst, aliq_icms, reducao, aliq_pis, aliq_cofins = rng.choice(CENARIOS_TRIBUTACAO)
+        itens_xml = []
+        itens = []
+        tot = {k: Decimal("0") for k in ("vBC", "vICMS", "vIPI", "vPIS", "vCOFINS", "vProd")}
+
+        for n_item in range(1, rng.randint(*self.itens_por_nota) + 1):
+            indice = rng.randrange(len(CATALOGO))
+            ncm, descricao, unidade, (pmin, pmax), aliq_ipi = CATALOGO[indice]
+            codigo = f"{indice + 1:05d}"
+            if "ncm_inexistente" in erros and n_item == 1:
+                ncm = "77019999"
+            quantidade = _q(Decimal(rng.randint(1, 50)), Decimal("0.0001"))
+            unitario = _q(Decimal(str(rng.uniform(pmin, pmax))), Decimal("0.0001"))
+            v_prod = _q(quantidade * unitario)
+            if "total_item" in erros and n_item == 1:
+                v_prod += Decimal("1.00")
+
+            v_bc = _q(v_prod * (1 - reducao)) if aliq_icms else Decimal("0.00")
+            v_icms = _q(v_bc * aliq_icms)
+            v_ipi = _q(v_prod * aliq_ipi)
+            v_pis = _q(v_prod * aliq_pis)
+            v_cofins = _q(v_prod * aliq_cofins)
+
+            for k, v in (("vBC", v_bc), ("vICMS", v_icms), ("vIPI", v_ipi), ("vPIS", v_pis),
+                         ("vCOFINS", v_cofins), ("vProd", v_prod)):
+                tot[k] += v
+
+            ipi_xml = (
+                f"<IPI><cEnq>999</cEnq><IPITrib><CST>50</CST><vBC>{v_prod}</vBC>"
+                f"<pIPI>{_q(aliq_ipi * 100)}</pIPI><vIPI>{v_ipi}</vIPI></IPITrib></IPI>"
+                if aliq_ipi else ""
+            )
+            icms_xml = (
+                f"<ICMS><{ncm_cst}><orig>0</orig><CST>{ncm_cst[-2:]}</CST><modBC>3</modBC>"
+                f"<vBC>{v_bc}</vBC><pICMS>{_q(aliq_icms * 100)}</pICMS><vICMS>{v_icms}</vICMS></{ncm_cst}></ICMS>"
+                if aliq_icms else
+                f"<ICMS><{ncm_cst}><orig>0</orig><CST>{ncm_cst[-2:]}</CST></{ncm_cst}></ICMS>"
+            )
+            itens_xml.append(
+                f'<det nItem="{n_item}"><prod><cProd>{codigo}</cProd><cEAN>SEM GTIN</cEAN>'
+                f"<xProd>{escape(descricao)}</xProd><NCM>{ncm}</NCM><CFOP>{cfop}</CFOP>"
+                f"<uCom>{unidade}</uCom><qCom>{quantidade}</qCom><vUnCom>{unitario}</vUnCom>"
+                f"<vProd>{v_prod}</vProd><indTot>1</indTot></prod>"
+                f"<imposto>{icms_xml}{ipi_xml}"
+                f"<PIS><PISAliq><CST>01</CST><vBC>{v_prod}</vBC><pPIS>{_q(aliq_pis * 100, Decimal('0.0001'))}</pPIS><vPIS>{v_pis}</vPIS></PISAliq></PIS>"
+                f"<COFINS><COFINSAliq><CST>01</CST><vBC>{v_prod}</vBC><pCOFINS>{_q(aliq_cofins * 100, Decimal('0.0001'))}</pCOFINS><vCOFINS>{v_cofins}</vCOFINS></COFINSAliq></COFINS>"
+                f"</imposto></det>"
+            )
+            itens.append({
+                "numero_item": n_item, "codigo": codigo, "descricao": descricao, "ncm": ncm, "cfop": cfop,
+                "unidade": unidade, "quantidade": quantidade, "valor_unitario": unitario, "valor_total": v_prod,
+            })
+
+        v_frete = _q(Decimal(str(rng.choice([0, 0, 0, rng.uniform(10, 200)]))))
+        v_desc = _q(tot["vProd"] * Decimal(str(rng.choice([0, 0, 0, 0.02, 0.05]))))
+        v_nf = tot["vProd"] + v_frete + tot["vIPI"] - v_desc
+        if "total_nota" in erros:
+            v_nf += Decimal("10.00")
+
+        tag_doc = "CNPJ" if len(destinatario["doc"]) == 14 else "CPF"
+        xml = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+            '<NFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+            f'<infNFe Id="NFe{chave}" versao="4.00">'
+            f"<ide><cUF>{CODIGOS_UF[emitente['uf']]}</cUF><natOp>VENDA DE MERCADORIA</natOp><mod>55</mod>"
+            f"<serie>{serie}</serie><nNF>{numero}</nNF><dhEmi>{data:%Y-%m-%dT%H:%M:%S}-03:00</dhEmi>"
+            f"<tpNF>1</tpNF><idDest>{1 if mesma_uf else 2}</idDest><tpAmb>2</tpAmb></ide>"
+            f"<emit><CNPJ>{cnpj_emit}</CNPJ><xNome>{escape(emitente['nome'])}</xNome>"
+            f"<xFant>SINTETICA {numero % 100:02d}</xFant>{self._endereco('enderEmit', emitente['uf'])}"
+            f"<IE>{emitente['ie']}</IE><CRT>3</CRT></emit>"
+            f"<dest><{tag_doc}>{destinatario['doc']}</{tag_doc}><xNome>{escape(destinatario['nome'])}</xNome>"
+            f"{self._endereco('enderDest', destinatario['uf'])}<indIEDest>9</indIEDest></dest>"
+            + "".join(itens_xml) +
+            f"<total><ICMSTot><vBC>{tot['vBC']}</vBC><vICMS>{tot['vICMS']}</vICMS><vICMSDeson>0.00</vICMSDeson>"
+            f"<vBCST>0.00</vBCST><vST>0.00</vST><vProd>{tot['vProd']}</vProd><vFrete>{v_frete}</vFrete>"
+            f"<vSeg>0.00</vSeg><vDesc>{v_desc}</vDesc><vII>0.00</vII><vIPI>{tot['vIPI']}</vIPI>"
+            f"<vPIS>{tot['vPIS']}</vPIS><vCOFINS>{tot['vCOFINS']}</vCOFINS><vOutro>0.00</vOutro>"
+            f"<vNF>{v_nf}</vNF></ICMSTot></total>"
+            f"<infAdic><infCpl>NOTA FISCAL SINTETICA GERADA PARA TESTES</infCpl></infAdic>"
+            "</infNFe></NFe>"
+            f'<protNFe versao="4.00"><infProt><tpAmb>2</tpAmb><chNFe>{chave}</chNFe>'
+            f"<dhRecbto>{data:%Y-%m-%dT%H:%M:%S}-03:00</dhRecbto><nProt>1{CODIGOS_UF[emitente['uf']]}{numero:012d}</nProt>"
+            f"<cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>"
+            "</nfeProc>"
+        )
+
+        metadados = {
+            "chave": chave, "numero": numero, "serie": serie, "data": data, "erros": erros,
+            "emitente": {**emitente, "cnpj": cnpj_emit}, "destinatario": destinatario,
+            "itens": itens, "valor_total": v_nf, "natureza": "VENDA DE MERCADORIA",
+        }
+        return xml.encode("utf-8"), metadados
+
+    def gerar_lote(self, quantidade: int, numero_inicial: int = 1) -> Iterator[Tuple[bytes, Dict]]:
+        for numero in range(numero_inicial, numero_inicial + quantidade):
+            yield self.gerar_nota(numero)
+
+    def salvar_xmls(self, pasta: str, quantidade: int) -> List[str]:
+        """Grava cada nota em <chave>-nfe.xml"""
+        os.makedirs(pasta, exist_ok=True)
+        caminhos = []
+        for xml, meta in self.gerar_lote(quantidade):
+            caminho = os.path.join(pasta, f"{meta['chave']}-nfe.xml")
+            with open(caminho, "wb") as f:
+                f.write(xml)
+            caminhos.append(caminho)
+        return caminhos
+
+
+# --------- CSVs no layout de duas planilhas do agente de notas ---------
+
+COLUNAS_CABECALHO = [
+    "CHAVE DE ACESSO", "MODELO", "SÉRIE", "NÚMERO", "NATUREZA DA OPERAÇÃO", "DATA EMISSÃO",
+    "EVENTO MAIS RECENTE", "DATA/HORA EVENTO MAIS RECENTE", "CPF/CNPJ Emitente", "RAZÃO SOCIAL EMITENTE",
+    "INSCRIÇÃO ESTADUAL EMITENTE", "UF EMITENTE", "MUNICÍPIO EMITENTE", "CNPJ DESTINATÁRIO",
+    "NOME DESTINATÁRIO", "UF DESTINATÁRIO", "INDICADOR IE DESTINATÁRIO", "DESTINO DA OPERAÇÃO",
+    "CONSUMIDOR FINAL", "PRESENÇA DO COMPRADOR", "VALOR NOTA FISCAL",
+]
+
+COLUNAS_ITENS = COLUNAS_CABECALHO[:6] + COLUNAS_CABECALHO[8:20] + [
+    "NÚMERO PRODUTO", "DESCRIÇÃO DO PRODUTO/SERVIÇO", "CÓDIGO NCM/SH", "NCM/SH (TIPO DE PRODUTO)",
+    "CFOP", "QUANTIDADE", "UNIDADE", "VALOR UNITÁRIO", "VALOR TOTAL",
+]
+
+
+def gerar_csvs(
+    pasta: str,
+    quantidade: int,
+    prefixo: str = "202401",
+    gerador: Optional[GeradorNFe] = None
+) -> Tuple[str, str]:
+    """Gera <prefixo>_NFs_Cabecalho.csv e <prefixo>_NFs_Itens.csv com os mesmos dados das NF-e sintéticas"""
+    gerador = gerador or GeradorNFe()
+    os.makedirs(pasta, exist_ok=True)
+    caminho_cab = os.path.join(pasta, f"{prefixo}_NFs_Cabecalho.csv")
+    caminho_itens = os.path.join(pasta, f"{prefixo}_NFs_Itens.csv")
+
+    with open(caminho_cab, "w", newline="", encoding="utf-8") as f_cab, \
+            open(caminho_itens, "w", newline="", encoding="utf-8") as f_itens:
+        w_cab = csv.writer(f_cab)
+        w_itens = csv.writer(f_itens)
+        w_cab.writerow(COLUNAS_CABECALHO)
+        w_itens.writerow(COLUNAS_ITENS)
+
+        for _, meta in gerador.gerar_lote(quantidade):
+            emit, dest = meta["emitente"], meta["destinatario"]
+            interna = emit["uf"] == dest["uf"]
+            comum = [
+                meta["chave"], "55 - NF-E EMITIDA EM SUBSTITUIÇÃO AO MODELO 1 OU 1A", meta["serie"], meta["numero"],
+                meta["natureza"], meta["data"].strftime("%Y-%m-%d %H:%M:%S"),
+            ]
+            partes = [
+                emit["cnpj"], emit["nome"], emit["ie"], emit["uf"], MUNICIPIOS[emit["uf"]].upper(),
+                dest["doc"], dest["nome"], dest["uf"], "9 - NÃO CONTRIBUINTE",
+                "1 - OPERAÇÃO INTERNA" if interna else "2 - OPERAÇÃO INTERESTADUAL",
+                "1 - CONSUMIDOR FINAL", "1 - OPERAÇÃO PRESENCIAL",
+            ]
+            w_cab.writerow(comum + ["AUTORIZAÇÃO DE USO", meta["data"].strftime("%Y-%m-%d %H:%M:%S")]
+                           + partes + [f"{meta['valor_total']}"])
+            for item in meta["itens"]:
+                w_itens.writerow(comum + partes + [
+                    item["numero_item"], item["descricao"], item["ncm"], item["descricao"].split()[0],
+                    item["cfop"], f"{item['quantidade']}", item["unidade"],
+                    f"{item['valor_unitario']}", f"{item['valor_total']}",
+                ])
+
+    return caminho_cab, caminho_itens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de NF-e sintéticas para testes e benchmarks")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_xml = sub.add_parser("xml", help="Gera arquivos XML de NF-e")
+    p_csv = sub.add_parser("csv", help="Gera o par de CSVs (cabeçalho e itens) do agente de notas")
+    for p in (p_xml, p_csv):
+        p.add_argument("--quantidade", type=int, default=100)
+        p.add_argument("--saida", required=True, help="Pasta de saída")
+        p.add_argument("--seed", type=int, default=42)
+        p.add_argument("--itens-min", type=int, default=1)
+        p.add_argument("--itens-max", type=int, default=10)
+        p.add_argument("--taxa-erros", type=float, default=0.0, help="Fração de notas com um erro injetado (0 a 1)")
+
+    args = parser.parse_args()
+    gerador = GeradorNFe(seed=args.seed, itens_por_nota=(args.itens_min, args.itens_max), taxa_erros=args.taxa_erros)
+
+    if args.comando == "xml":
+        caminhos = gerador.salvar_xmls(args.saida, args.quantidade)
+        print(f"{len(caminhos)} XML(s) gerado(s) em {args.saida}")
+    else:
+        cab, itens = gerar_csvs(args.saida, args.quantidade, gerador=gerador)
+        print(f"CSVs gerados: {cab}, {itens}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+PASTA_FISCAL = os.path.dirname(os.path.abspath(__file__))
+PASTA_AGENTE = os.path.join(PASTA_FISCAL, "..", "Agente de Notas Fiscais")
+
+# Bibliotecas que só devem ser carregadas no primeiro uso
+PESADAS = ("google.generativeai", "reportlab", "plotly", "langchain", "langchain_experimental", "langchain_google_genai")
+
+
+class Orcamento(NamedTuple):
+    pasta: str
+    modulo: str
+    limite_ms: float
+    proibidos: Tuple[str, ...] = PESADAS
+
+
+# Limites generosos para máquinas de CI; pydantic (via models) e pandas (motor de regras) são carregados de fato
+ORCAMENTOS = [
+    Orcamento(PASTA_FISCAL, "metricas", 50),
+    Orcamento(PASTA_FISCAL, "referencias", 50),
+    Orcamento(PASTA_FISCAL, "models", 400),
+    Orcamento(PASTA_FISCAL, "indice", 400),
+    Orcamento(PASTA_FISCAL, "cubo", 400, PESADAS + ("pandas", "numpy")),
+    Orcamento(PASTA_FISCAL, "anomalias", 450),
+    Orcamento(PASTA_FISCAL, "extractor", 450, PESADAS + ("lxml",)),
+    Orcamento(PASTA_FISCAL, "reporter", 450, PESADAS + ("pandas",)),
+    Orcamento(PASTA_FISCAL, "regras", 900),
+    Orcamento(PASTA_FISCAL, "validator", 1000),
+    Orcamento(PASTA_AGENTE, "agent", 900),
+    Orcamento(PASTA_AGENTE, "consultas", 900),
+    Orcamento(PASTA_AGENTE, "agente_sql", 1500),
+]
+
+_LINHA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+class Medicao(NamedTuple):
+    total_ms: float
+    modulos: Dict[str, float]  # módulo -> tempo próprio (ms)
+    erro: Optional[str] = None
+
+
+def medir_importacao(pasta: str, modulo: str) -> Medicao:
+    """Importa `modulo` em um interpretador novo com -X importtime"""
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=pasta,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    modulos: Dict[str, float] = {}
+    total_ms = 0.0
+    for linha in processo.stderr.splitlines():
+        casamento = _LINHA.match(linha)
+        if not casamento:
+            continue
+        proprio, acumulado, recuo, nome = casamento.groups()
+        modulos[nome] = int(proprio) / 1000
+        if nome == modulo and not recuo:
+            total_ms = int(acumulado) / 1000
+
+    if processo.returncode != 0:
+        ultima = processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "erro desconhecido"
+        return Medicao(0.0, modulos, ultima)
+    return Medicao(total_ms, modulos)
+
+
+def verificar(orcamento: Orcamento, repeticoes: int = 3, fator: float = 1.0) -> Tuple[str, List[str]]:
+    """Retorna (status, mensagens); status é 'ok', 'falha' ou 'ignorado'"""
+    medicoes = [medir_importacao(orcamento.pasta, orcamento.modulo) for _ in range(repeticoes)]
+    erro = next((m.erro for m in medicoes if m.erro), None)
+    if erro:
+        # Dependência ausente no ambiente não é regressão de tempo de importação
+        if "ModuleNotFoundError" in erro and f"'{orcamento.modulo}'" not in erro:
+            return "ignorado", [erro]
+        return "falha", [erro]
+
+    # O mínimo das repetições reduz o ruído do cache de disco
+    melhor = min(medicoes, key=lambda m: m.total_ms)
+    limite = orcamento.limite_ms * fator
+    mensagens = [f"{melhor.total_ms:.0f} ms (limite {limite:.0f} ms)"]
+    status = "ok"
+
+    if melhor.total_ms > limite:
+        status = "falha"
+        mais_lentos = sorted(melhor.modulos.items(), key=lambda item: item[1], reverse=True)[:5]
+        mensagens.append("mais lentos: " + ", ".join(f"{nome} {ms:.0f} ms" for nome, ms in mais_lentos))
+
+    carregados = [
+        p for p in orcamento.proibidos
+        if any(nome == p or nome.startswith(p + ".") for nome in melhor.modulos)
+    ]
+    if carregados:
+        status = "falha"
+        mensagens.append("importados cedo demais: " + ", ".join(carregados))
+
+    return status, mensagens
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Verifica o tempo de importação dos módulos contra um orçamento")
+    parser.add_argument("modulos", nargs="*", help="Restringe a verificação a estes módulos")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--fator", type=float, default=1.0, help="Multiplica todos os limites (máquinas lentas)")
+    args = parser.parse_args(argv)
+
+    falhas = 0
+    for orcamento in ORCAMENTOS:
+        if args.modulos and orcamento.modulo not in args.modulos:
+            continue
+        status, mensagens = verificar(orcamento, args.repeticoes, args.fator)
+        falhas += status == "falha"
+        print(f"[{status:^8}] {orcamento.modulo:<12} " + " | ".join(mensagens))
+
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,51 @@
-import google.generativeai as genai
 from decimal import Decimal
 from models import NotaFiscal, ResultadoValidacao
-from typing import List
+from regras import MotorRegras, ResultadoRegras, carregar_motor_padrao
+from referencias import ReferenciasFiscais, obter_referencias
+from metricas import cronometrar, metricas
+from typing import List, Optional, Tuple
 import json
 
 
+# Prefixo do texto devolvido por validar_com_ia quando a chamada ao modelo falha
+PREFIXO_ERRO_IA = "Erro na análise de IA"
+
+
+def score_confianca(inconsistencias: List[str]) -> float:
+    """Confiança da validação: cada inconsistência desconta 0,2"""
+    return max(0.0, 1.0 - (len(inconsistencias) * 0.2))
+
+
+class ModeloDesligado:
+    """Substituto do Gemini quando a análise com IA está desligada (evita carregar o SDK)"""
+    
+    def generate_content(self, prompt: str):
+        raise RuntimeError("Análise com IA desabilitada")
+
+
 class ValidadorInteligente:
     """Validador de NF-e com IA (Gemini)"""
     
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+    def __init__(
+        self,
+        api_key: str,
+        motor_regras: Optional[MotorRegras] = None,
+        referencias: Optional[ReferenciasFiscais] = None,
+        modelo=None,
+        participantes=None
+    ):
+        # `modelo` permite injetar um substituto do Gemini (benchmarks, testes locais)
+        if modelo is None:
+            # Importado só aqui: o SDK do Gemini é a dependência mais lenta de carregar
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            modelo = genai.GenerativeModel('gemini-1.5-flash')
+        self.model = modelo
+        self.motor_regras = motor_regras or carregar_motor_padrao()
+        self.referencias = referencias or obter_referencias()
+        self.ultimo_resultado_regras: Optional[ResultadoRegras] = None
+        # RegistroParticipantes opcional: sinais de risco do emitente (fornecedor novo, CFOP incomum)
+        self.participantes = participantes
     
     def validar_cnpj(self, cnpj: str) -> bool:
         """Valida dígitos verificadores do CNPJ"""
@@ -65,15 +100,17 @@ class ValidadorInteligente:
         soma = 0
         multiplicador = 2
         
+        # Pesos de 2 a 9 aplicados da direita para a esquerda (Manual de Orientação do Contribuinte)
         for i in range(len(chave_base) - 1, -1, -1):
             soma += int(chave_base[i]) * multiplicador
-            multiplicador = 9 if multiplicador == 2 else multiplicador - 1
+            multiplicador = 2 if multiplicador == 9 else multiplicador + 1
         
         resto = soma % 11
         dv_calculado = 0 if resto in [0, 1] else 11 - resto
         
         return int(chave[-1]) == dv_calculado
     
+    @cronometrar("validador.calculos")
     def validar_calculos(self, nota: NotaFiscal) -> List[str]:
         """Valida cálculos matemáticos da nota"""
         inconsistencias = []
@@ -112,6 +149,49 @@ class ValidadorInteligente:
         
         return inconsistencias
     
+    @cronometrar("validador.codigos")
+    def validar_codigos(self, nota: NotaFiscal) -> Tuple[List[str], List[str]]:
+        """Confere NCM e CFOP dos produtos nas tabelas de referência"""
+        inconsistencias = []
+        alertas = []
+        sentidos_cfop = set()
+        
+        for idx, produto in enumerate(nota.produtos):
+            ncm = ''.join(filter(str.isdigit, produto.ncm))
+            cfop = ''.join(filter(str.isdigit, produto.cfop))
+            
+            # NCM fora do formato é tratado pelo motor de regras. Só o capítulo inexistente é
+            # inconsistência (a tabela traz todos os capítulos); item ausente da tabela é alerta,
+            # e só com a tabela completa: no recorte distribuído quase todo item estaria ausente
+            if len(ncm) == 8 and not self.referencias.ncm_valido(ncm):
+                hierarquia = self.referencias.hierarquia_ncm(ncm)
+                if not hierarquia:
+                    inconsistencias.append(
+                        f"Produto {idx+1} ({produto.descricao}): NCM {ncm} com capítulo {ncm[:2]} inexistente"
+                    )
+                elif self.referencias.ncm_completa:
+                    nivel, codigo, descricao = hierarquia[-1]
+                    alertas.append(
+                        f"Produto {idx+1} ({produto.descricao}): NCM {ncm} não encontrado na tabela de "
+                        f"referência ({nivel} {codigo}: {descricao})"
+                    )
+            
+            # Código ausente da tabela é alerta: a tabela distribuída pode estar desatualizada
+            if cfop:
+                if not self.referencias.cfop_valido(cfop):
+                    alertas.append(
+                        f"Produto {idx+1} ({produto.descricao}): CFOP {produto.cfop} não encontrado na "
+                        f"tabela de referência"
+                    )
+                else:
+                    sentidos_cfop.add("entrada" if cfop[0] in "123" else "saída")
+        
+        if len(sentidos_cfop) > 1:
+            inconsistencias.append("Nota mistura CFOPs de entrada (1/2/3.xxx) e de saída (5/6/7.xxx)")
+        
+        return inconsistencias, alertas
+    
+    @cronometrar("validador.ia")
     def validar_com_ia(self, nota: NotaFiscal) -> str:
         """Usa Gemini para análise inteligente da nota"""
         try:
@@ -162,60 +242,82 @@ Forneça uma análise detalhada mas concisa (máximo 500 palavras)."""
             return response.text
             
         except Exception as e:
-            return f"Erro na análise de IA: {str(e)}"
+            return f"{PREFIXO_ERRO_IA}: {str(e)}"
     
-    def validar_nota(self, nota: NotaFiscal) -> ResultadoValidacao:
+    @cronometrar("validador.nota")
+    def validar_nota(self, nota: NotaFiscal, usar_ia: bool = True) -> ResultadoValidacao:
         """Executa validação completa da nota"""
+        with metricas.medir("validador.regras"):
+            resultado_regras = self.motor_regras.avaliar([nota])
+        self.ultimo_resultado_regras = resultado_regras
+        return self._validar(nota, resultado_regras, 0, usar_ia)
+    
+    @cronometrar("validador.lote")
+    def validar_lote(self, notas: List[NotaFiscal], usar_ia: bool = False) -> List[ResultadoValidacao]:
+        """Valida um lote de notas executando o motor de regras uma única vez"""
+        with metricas.medir("validador.regras"):
+            resultado_regras = self.motor_regras.avaliar(notas)
+        self.ultimo_resultado_regras = resultado_regras
+        return [
+            self._validar(nota, resultado_regras, idx, usar_ia)
+            for idx, nota in enumerate(notas)
+        ]
+    
+    def _validar(
+        self,
+        nota: NotaFiscal,
+        resultado_regras: ResultadoRegras,
+        idx_nota: int,
+        usar_ia: bool
+    ) -> ResultadoValidacao:
+        """Combina validações documentais, de cálculo, regras e IA"""
         inconsistencias = []
         alertas = []
         recomendacoes = []
         
-        # Validação de documentos
-        if not self.validar_cnpj(nota.emitente.cnpj):
-            inconsistencias.append(f"CNPJ do emitente inválido: {nota.emitente.cnpj}")
-        
-        doc_dest = nota.destinatario.cpf_cnpj
-        if len(''.join(filter(str.isdigit, doc_dest))) == 14:
-            if not self.validar_cnpj(doc_dest):
-                inconsistencias.append(f"CNPJ do destinatário inválido: {doc_dest}")
-        elif len(''.join(filter(str.isdigit, doc_dest))) == 11:
-            if not self.validar_cpf(doc_dest):
-                inconsistencias.append(f"CPF do destinatário inválido: {doc_dest}")
+        # Validação de documentos e da chave de acesso (dígitos verificadores)
+        with metricas.medir("validador.digitos_verificadores"):
+            if not self.validar_cnpj(nota.emitente.cnpj):
+                inconsistencias.append(f"CNPJ do emitente inválido: {nota.emitente.cnpj}")
+            
+            doc_dest = nota.destinatario.cpf_cnpj
+            if len(''.join(filter(str.isdigit, doc_dest))) == 14:
+                if not self.validar_cnpj(doc_dest):
+                    inconsistencias.append(f"CNPJ do destinatário inválido: {doc_dest}")
+            elif len(''.join(filter(str.isdigit, doc_dest))) == 11:
+                if not self.validar_cpf(doc_dest):
+                    inconsistencias.append(f"CPF do destinatário inválido: {doc_dest}")
+            
+            if not self.validar_chave_acesso(nota.chave_acesso):
+                inconsistencias.append("Chave de acesso com dígito verificador inválido")
         
-        # Validação da chave de acesso
-        if not self.validar_chave_acesso(nota.chave_acesso):
-            inconsistencias.append("Chave de acesso com dígito verificador inválido")
+        # Campos que o extrator tolerante não conseguiu ler
+        for erro in nota.erros_extracao:
+            inconsistencias.append(f"Campo {erro.campo} inválido na extração: {erro.mensagem} (valor: {erro.valor!r})")
         
         # Validação de cálculos
         inconsistencias.extend(self.validar_calculos(nota))
         
-        # Alertas gerais
-        if nota.totalizadores.valor_total_nota > Decimal('100000'):
-            alertas.append("Valor elevado da nota - verificar necessidade de garantias")
+        # Validação de NCM e CFOP contra as tabelas de referência
+        inconsistencias_codigos, alertas_codigos = self.validar_codigos(nota)
+        inconsistencias.extend(inconsistencias_codigos)
+        alertas.extend(alertas_codigos)
         
-        if len(nota.produtos) > 50:
-            alertas.append("Nota com muitos itens - atenção ao prazo de conferência")
+        # Regras fiscais declarativas (alertas, recomendações e inconsistências)
+        resultado_regras.aplicar(idx_nota, inconsistencias, alertas, recomendacoes)
         
-        # Recomendações
-        if nota.totalizadores.valor_desconto > Decimal('0'):
-            recomendacoes.append("Verificar condições comerciais do desconto concedido")
-        
-        if nota.totalizadores.valor_icms == Decimal('0'):
-            recomendacoes.append("ICMS zerado - confirmar regime tributário ou benefício fiscal")
+        # Histórico do emitente (consulta O(1) ao perfil)
+        if self.participantes is not None:
+            alertas.extend(self.participantes.sinais_risco(nota))
         
         # Análise com IA
-        analise_ia = self.validar_com_ia(nota)
-        
-        # Calcula score de confiança
-        total_verificacoes = 5 + len(nota.produtos)
-        erros_graves = len(inconsistencias)
-        score = max(0.0, 1.0 - (erros_graves * 0.2))
+        analise_ia = self.validar_com_ia(nota) if usar_ia else None
         
         return ResultadoValidacao(
             valido=len(inconsistencias) == 0,
-            score_confianca=score,
+            score_confianca=score_confianca(inconsistencias),
             inconsistencias=inconsistencias,
             alertas=alertas,
             recomendacoes=recomendacoes,
             analise_ia=analise_ia
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,19 @@
+import importlib.abc
+import importlib.util
+import os
+import sys
+
+PASTA = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _NomesCurtos(importlib.abc.MetaPathFinder):
+    """Os módulos fiscal_*.py importam uns aos outros pelo nome curto (from diario import ...)"""
+
+    def find_spec(self, nome, caminho=None, alvo=None):
+        arquivo = os.path.join(PASTA, f"fiscal_{nome}.py")
+        if "." in nome or not os.path.exists(arquivo):
+            return None
+        return importlib.util.spec_from_file_location(nome, arquivo)
+
+
+sys.meta_path.insert(0, _NomesCurtos())
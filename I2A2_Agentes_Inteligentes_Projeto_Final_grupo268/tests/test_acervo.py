@@ -0,0 +1,93 @@
+import multiprocessing
+import sqlite3
+import zlib
+
+import pytest
+
+from acervo import AcervoXML
+from diario import DiarioProcessamento, hash_conteudo, processar_arquivo
+from extractor import NFeExtractor
+from sintetico import GeradorNFe
+from validator import ModeloDesligado, ValidadorInteligente
+
+
+def _lote(quantidade, seed=3):
+    """enviNFe simplificado: várias nfeProc em um único arquivo"""
+    gerador = GeradorNFe(seed=seed)
+    notas = [gerador.gerar_nota(i)[0].split(b"?>", 1)[1] for i in range(quantidade)]
+    return b"<lote>" + b"".join(notas) + b"</lote>"
+
+
+def test_todas_as_chaves_do_arquivo_sao_indexadas(tmp_path):
+    conteudo = _lote(3)
+    chaves = [nota.chave_acesso for nota in NFeExtractor().extrair_notas(conteudo)]
+    diario = DiarioProcessamento(str(tmp_path / "diario"))
+    acervo = AcervoXML(str(tmp_path / "acervo"))
+    validador = ValidadorInteligente("", modelo=ModeloDesligado())
+    processar_arquivo(diario, conteudo, "lote.xml", NFeExtractor(), validador, usar_ia=False, acervo=acervo)
+    acervo.fechar()
+
+    acervo = AcervoXML(str(tmp_path / "acervo"), somente_leitura=True)
+    assert len(acervo) == 1
+    for chave in chaves:
+        assert acervo.obter(chave) == conteudo
+
+
+def test_sem_compressao_leitura_sem_copia(tmp_path):
+    acervo = AcervoXML(str(tmp_path))
+    conteudo = _lote(1)
+    acervo.guardar(conteudo, "chave", "nota.xml")
+    assert isinstance(acervo.visao("chave"), memoryview)
+    assert acervo.obter("chave") == conteudo
+
+    comprimido = _lote(1, seed=4)
+    acervo.guardar(comprimido, "outra", "nota2.xml", comprimir=True)
+    assert acervo.visao("outra") == comprimido
+    assert acervo.entrada("outra").tamanho == len(zlib.compress(comprimido, 6))
+
+
+def test_acervo_antigo_ganha_indice_de_chaves(tmp_path):
+    acervo = AcervoXML(str(tmp_path))
+    acervo.guardar(b"<a/>", "chave-a", "a.xml")
+    acervo.fechar()
+    con = sqlite3.connect(tmp_path / "indice.sqlite")
+    con.execute("DROP TABLE chaves")
+    con.commit()
+    con.close()
+
+    assert AcervoXML(str(tmp_path), somente_leitura=True).obter("chave-a") == b"<a/>"
+    assert AcervoXML(str(tmp_path)).obter("chave-a") == b"<a/>"
+    con = sqlite3.connect(tmp_path / "indice.sqlite")
+    assert con.execute("SELECT chave, hash FROM chaves").fetchall() == [("chave-a", hash_conteudo(b"<a/>"))]
+
+
+def test_mesmo_conteudo_gravado_por_outro_processo(tmp_path):
+    primeiro = AcervoXML(str(tmp_path))
+    segundo = AcervoXML(str(tmp_path))  # índice carregado antes da gravação do primeiro
+    entrada = primeiro.guardar(b"<nota/>", ["c1", "c2"], "nota.xml")
+    assert segundo.guardar(b"<nota/>", ["c1", "c2"], "copia.xml") == entrada
+    assert segundo.obter("c2") == b"<nota/>"
+
+
+def _anexar(pasta, prefixo, quantidade):
+    acervo = AcervoXML(pasta)
+    for i in range(quantidade):
+        acervo.guardar(f"<nota>{prefixo}-{i}</nota>".encode() * (i % 7 + 1), f"{prefixo}-{i}", f"{prefixo}-{i}.xml")
+    acervo.fechar()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requer fork")
+def test_dois_processos_anexando_ao_mesmo_acervo(tmp_path):
+    contexto = multiprocessing.get_context("fork")
+    processos = [contexto.Process(target=_anexar, args=(str(tmp_path), prefixo, 200)) for prefixo in ("a", "b")]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join(60)
+        assert processo.exitcode == 0
+
+    acervo = AcervoXML(str(tmp_path), somente_leitura=True)
+    assert len(acervo) == 400
+    for prefixo in ("a", "b"):
+        for i in range(200):
+            assert acervo.obter(f"{prefixo}-{i}") == f"<nota>{prefixo}-{i}</nota>".encode() * (i % 7 + 1)
@@ -0,0 +1,109 @@
+import pickle
+import random
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from anomalias import DetectorAnomalias, EstatisticaRobusta, EstimadorP2, VolumeDiario
+from extractor import NFeExtractor
+from sintetico import GeradorNFe
+
+
+# --------- Estimadores em fluxo ---------
+
+@pytest.mark.parametrize("p", [0.1, 0.5, 0.9, 0.99])
+def test_p2_acompanha_percentil_exato(p):
+    rng = random.Random(42)
+    valores = [rng.lognormvariate(4, 0.5) for _ in range(20000)]
+    estimador = EstimadorP2(p)
+    for x in valores:
+        estimador.adicionar(x)
+    assert estimador.valor == pytest.approx(np.percentile(valores, p * 100), rel=0.03)
+
+
+def test_p2_exato_com_poucas_amostras():
+    estimador = EstimadorP2(0.5)
+    assert estimador.valor is None
+    for x in (5.0, 1.0, 3.0):
+        estimador.adicionar(x)
+    assert estimador.valor == 3.0
+
+
+def test_z_robusto_pelo_mad():
+    rng = random.Random(7)
+    estatistica = EstatisticaRobusta()
+    for _ in range(5000):
+        estatistica.adicionar(rng.gauss(100, 10))
+    # Em dados normais, MAD / 0,6745 estima o desvio-padrão: z robusto ~ z clássico
+    assert estatistica.z_robusto(100) == pytest.approx(0, abs=0.1)
+    assert estatistica.z_robusto(130) == pytest.approx(3, abs=0.3)
+    limite_z = DetectorAnomalias().limite_z
+    assert abs(estatistica.z_robusto(125)) < limite_z < abs(estatistica.z_robusto(145))
+
+
+def test_z_robusto_indefinido_sem_dispersao():
+    estatistica = EstatisticaRobusta()
+    for _ in range(20):
+        estatistica.adicionar(10.0)
+    assert estatistica.z_robusto(50.0) is None
+
+
+# --------- Volume diário ---------
+
+def test_volume_diario_soma_em_centavos_e_fecha_dias():
+    volume = VolumeDiario(alfa=0.5)
+    for _ in range(10):
+        assert volume.adicionar(date(2024, 1, 1), 10)  # R$ 0,10 dez vezes: exato em centavos
+    assert volume.centavos_dia == 100 and volume.total_dia == 1.0
+    assert volume.adicionar(date(2024, 1, 2), 300)
+    assert volume.dias_fechados == 1 and volume.media == 1.0
+    assert not volume.adicionar(date(2024, 1, 1), 500)  # dia já fechado
+    assert volume.adicionar(date(2024, 1, 3), 0)
+    assert volume.media == pytest.approx(2.0)
+    assert volume.desvio == pytest.approx(1.0)
+
+
+def test_volume_diario_antigo_em_float_e_migrado():
+    volume = VolumeDiario()
+    estado = dict(volume.__dict__)
+    del estado["centavos_dia"]
+    estado["total_dia"] = 12.34
+    migrado = VolumeDiario.__new__(VolumeDiario)
+    migrado.__setstate__(estado)
+    assert migrado.centavos_dia == 1234
+    assert pickle.loads(pickle.dumps(migrado)).total_dia == 12.34
+
+
+# --------- Duplicidade ---------
+
+def _nota(i, data_emissao, valor="150.00", cnpj="11222333000181"):
+    nota = next(NFeExtractor().extrair_notas(GeradorNFe(seed=5).gerar_nota(i)[0]))
+    nota.data_emissao = data_emissao
+    nota.emitente.cnpj = cnpj
+    nota.totalizadores.valor_total_nota = Decimal(valor)
+    return nota
+
+
+def test_duplicidade_entre_fusos_compara_em_utc():
+    # 23:50 em Brasília e 02:55 UTC do dia seguinte: 5 min de diferença, não 3h05
+    brasilia = timezone(timedelta(hours=-3))
+    primeira = _nota(0, datetime(2024, 1, 1, 23, 50, tzinfo=brasilia))
+    segunda = _nota(1, datetime(2024, 1, 2, 2, 55, tzinfo=timezone.utc))
+    detector = DetectorAnomalias(janela_duplicidade_min=60)
+    assert detector.registrar_lote([segunda, primeira]) == [
+        ["Possível duplicidade: nota do mesmo emitente e mesmo valor emitida com 5 min de diferença "
+         f"(chave {primeira.chave_acesso})"],
+        [],
+    ]
+
+
+def test_mesma_chave_e_valores_diferentes():
+    inicio = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+    detector = DetectorAnomalias()
+    nota = _nota(0, inicio)
+    assert not any("duplicidade" in a.lower() for a in detector.registrar(nota))
+    assert "Nota já registrada anteriormente (mesma chave de acesso)" in detector.registrar(nota)
+    outra = _nota(1, inicio + timedelta(minutes=5), valor="150.01")
+    assert not any("duplicidade" in a.lower() for a in detector.registrar(outra))
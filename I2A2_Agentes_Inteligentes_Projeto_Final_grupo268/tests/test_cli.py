@@ -0,0 +1,36 @@
+import json
+
+from acervo import AcervoXML
+from cli import main
+from diario import DiarioProcessamento
+from sintetico import GeradorNFe
+
+
+def _executar(capsys, *argv):
+    codigo = main(list(argv))
+    return codigo, json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+
+
+def test_segunda_execucao_ignora_arquivos_ja_processados(tmp_path, capsys):
+    fonte = tmp_path / "xmls"
+    fonte.mkdir()
+    gerador = GeradorNFe(seed=21)
+    for i in range(5):
+        (fonte / f"nota_{i}.xml").write_bytes(gerador.gerar_nota(i)[0])
+    argv = [
+        "batch", str(fonte), "--out", str(tmp_path / "resultados.db"), "--workers", "1", "--bloco", "2",
+        "--diario", str(tmp_path / "diario"), "--acervo", str(tmp_path / "acervo"), "--silencioso",
+    ]
+
+    codigo, resumo = _executar(capsys, *argv)
+    assert codigo == 0
+    assert (resumo["processados"], resumo["ignorados"], resumo["erros"]) == (5, 0, 0)
+
+    codigo, resumo = _executar(capsys, *argv)
+    assert codigo == 0
+    assert (resumo["processados"], resumo["ignorados"], resumo["erros"]) == (0, 5, 0)
+
+    # Sem IA, cada arquivo termina validado no diário e fica no acervo para a reextração
+    resumo = DiarioProcessamento(str(tmp_path / "diario")).resumo()
+    assert resumo["validado"] == 5 and resumo["com_falha"] == 0
+    assert len(AcervoXML(str(tmp_path / "acervo"), somente_leitura=True)) == 5
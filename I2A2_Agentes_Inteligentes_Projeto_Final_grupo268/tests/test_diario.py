@@ -0,0 +1,90 @@
+from diario import DiarioProcessamento, processar_arquivo
+from extractor import NFeExtractor
+from sintetico import GeradorNFe
+from validator import PREFIXO_ERRO_IA, ValidadorInteligente
+
+
+class ExtratorContado(NFeExtractor):
+    def __init__(self):
+        super().__init__()
+        self.chamadas = 0
+
+    def extrair_notas(self, conteudo):
+        self.chamadas += 1
+        return super().extrair_notas(conteudo)
+
+
+class ValidadorContado(ValidadorInteligente):
+    def __init__(self, modelo):
+        super().__init__("", modelo=modelo)
+        self.lotes = 0
+
+    def validar_lote(self, notas, usar_ia=False):
+        self.lotes += 1
+        return super().validar_lote(notas, usar_ia)
+
+
+class ModeloInstavel:
+    """Falha na primeira chamada e responde nas seguintes"""
+
+    def __init__(self):
+        self.chamadas = 0
+
+    def generate_content(self, prompt):
+        self.chamadas += 1
+        if self.chamadas == 1:
+            raise RuntimeError("cota excedida")
+
+        class Resposta:
+            text = "Risco baixo"
+        return Resposta()
+
+
+def _lote(quantidade, seed=8):
+    gerador = GeradorNFe(seed=seed)
+    notas = [gerador.gerar_nota(i)[0].split(b"?>", 1)[1] for i in range(quantidade)]
+    return b"<lote>" + b"".join(notas) + b"</lote>"
+
+
+def test_retomada_repete_so_a_ia_que_falhou(tmp_path):
+    diario = DiarioProcessamento(str(tmp_path / "diario"))
+    conteudo = _lote(2)
+    extrator = ExtratorContado()
+    modelo = ModeloInstavel()
+    validador = ValidadorContado(modelo)
+
+    # 1ª execução: a IA da primeira nota falha; as notas validadas são mantidas
+    processado = processar_arquivo(diario, conteudo, "lote.xml", extrator, validador, usar_ia=True)
+    assert (extrator.chamadas, validador.lotes, modelo.chamadas) == (1, 1, 2)
+    assert processado.validacoes[0].analise_ia == f"{PREFIXO_ERRO_IA}: cota excedida"
+    assert processado.validacoes[1].analise_ia == "Risco baixo"
+    entrada = diario.entrada(processado.hash)
+    assert (entrada.etapa, entrada.etapa_falha, entrada.tentativas) == ("validado", "analisado_ia", 1)
+
+    # 2ª execução: sem nova extração nem validação; só a nota pendente volta ao modelo
+    processado = processar_arquivo(diario, conteudo, "lote.xml", extrator, validador, usar_ia=True)
+    assert (extrator.chamadas, validador.lotes, modelo.chamadas) == (1, 1, 3)
+    assert not processado.retomado
+    assert [v.analise_ia for v in processado.validacoes] == ["Risco baixo", "Risco baixo"]
+    entrada = diario.entrada(processado.hash)
+    assert (entrada.etapa, entrada.erro, entrada.etapa_falha) == ("analisado_ia", None, None)
+
+    # 3ª execução: tudo concluído, nenhuma etapa é refeita
+    processado = processar_arquivo(diario, conteudo, "lote.xml", extrator, validador, usar_ia=True)
+    assert processado.retomado
+    assert (extrator.chamadas, validador.lotes, modelo.chamadas) == (1, 1, 3)
+
+
+def test_validacao_sem_ia_e_reaproveitada_quando_a_ia_e_ligada(tmp_path):
+    diario = DiarioProcessamento(str(tmp_path / "diario"))
+    conteudo = _lote(1)
+    extrator = ExtratorContado()
+    modelo = ModeloInstavel()
+    modelo.chamadas = 1  # sem a falha inicial
+    validador = ValidadorContado(modelo)
+
+    processado = processar_arquivo(diario, conteudo, "lote.xml", extrator, validador, usar_ia=False)
+    assert processado.validacoes[0].analise_ia is None
+    processado = processar_arquivo(diario, conteudo, "lote.xml", extrator, validador, usar_ia=True)
+    assert (extrator.chamadas, validador.lotes, modelo.chamadas) == (1, 1, 2)
+    assert processado.validacoes[0].analise_ia == "Risco baixo"
@@ -0,0 +1,100 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+from anomalias import DetectorAnomalias
+from cubo import CASAS, CuboFiscal
+from dinheiro import CASAS_VALOR, para_decimal, para_inteiro, somar
+from extractor import NFeExtractor
+from participantes import RegistroParticipantes
+from sintetico import GeradorNFe
+
+# Valores do leiaute (13v2), negativos (notas de ajuste, extração tolerante) e grandes
+VALORES = [Decimal(v) for v in (
+    "0", "0.01", "-0.01", "12.34", "-12.34", "1234567890123.45", "9999999999999.99", "-9999999999999.99", "0.10",
+)]
+# Mais casas do que o leiaute permite: arredondados uma vez por valor (meio para longe do zero)
+VALORES_LONGOS = [Decimal(v) for v in ("0.125", "-0.125", "2.675", "10.005", "-0.005", "1.0049999", "9999999999999.995")]
+
+MEDIDAS_NOTA = {"valor_total": "valor_total_nota", "icms": "valor_icms", "ipi": "valor_ipi", "pis": "valor_pis"}
+
+
+def _arredondado(valor: Decimal, casas: int = CASAS_VALOR) -> Decimal:
+    return valor.quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP)
+
+
+def _notas(valores):
+    """Notas sintéticas do mesmo emitente e dia com os totalizadores e o primeiro item trocados pelos valores"""
+    gerador = GeradorNFe(seed=11)
+    base = next(NFeExtractor().extrair_notas(gerador.gerar_nota(0)[0]))
+    notas = []
+    for i, valor in enumerate(valores):
+        nota = next(NFeExtractor().extrair_notas(gerador.gerar_nota(i)[0]))
+        nota.emitente = base.emitente
+        nota.data_emissao = base.data_emissao
+        for campo in MEDIDAS_NOTA.values():
+            setattr(nota.totalizadores, campo, valor)
+        nota.produtos = nota.produtos[:1]
+        nota.produtos[0].valor_total = valor
+        nota.produtos[0].impostos.icms_valor = -valor
+        notas.append(nota)
+    return notas
+
+
+def _conferir(notas, esperado):
+    cubo = CuboFiscal.de_notas(notas)
+    for medida in MEDIDAS_NOTA:
+        assert cubo.totais((medida,))[medida] == esperado, medida
+    itens = cubo.totais(("valor_total", "icms"), filtros={"ncm": cubo.valores("ncm")})
+    assert itens == {"valor_total": esperado, "icms": -esperado}
+
+    participantes = RegistroParticipantes()
+    for nota in notas:
+        participantes.registrar(nota)
+    perfil = participantes.emitente(notas[0].emitente.cnpj)
+    assert perfil.valor_total == esperado
+    assert perfil.impostos["icms"] == esperado
+
+    detector = DetectorAnomalias()
+    for nota in notas:
+        detector.registrar(nota)
+    assert para_decimal(detector.volumes[notas[0].emitente.cnpj].centavos_dia) == esperado
+
+
+def test_para_inteiro_exato_no_leiaute():
+    for valor in VALORES:
+        assert para_decimal(para_inteiro(valor, exato=True)) == valor
+    assert para_decimal(somar(VALORES)) == sum(VALORES, Decimal("0"))
+    assert para_inteiro(Decimal("99999999999.9999999999"), CASAS["valor_unitario"]) == 999999999999999999999
+
+
+def test_para_inteiro_arredonda_casas_excedentes():
+    for valor in VALORES_LONGOS:
+        assert para_decimal(para_inteiro(valor)) == _arredondado(valor)
+        with pytest.raises(ValueError):
+            para_inteiro(valor, exato=True)
+    assert para_decimal(somar(VALORES_LONGOS)) == sum(map(_arredondado, VALORES_LONGOS), Decimal("0"))
+
+
+def test_totais_iguais_a_soma_decimal():
+    _conferir(_notas(VALORES), sum(VALORES, Decimal("0")))
+
+
+def test_totais_com_casas_excedentes_somam_valores_arredondados():
+    _conferir(_notas(VALORES_LONGOS), sum(map(_arredondado, VALORES_LONGOS), Decimal("0")))
+
+
+def test_totais_acima_do_int64():
+    # 10 mil notas no valor máximo do leiaute: a soma em centavos passa de 2^63
+    nota = _notas([Decimal("9999999999999.99")])[0]
+    cubo = CuboFiscal()
+    for _ in range(10000):
+        cubo.adicionar(nota)
+    assert cubo.totais(("valor_total",))["valor_total"] == Decimal("9999999999999.99") * 10000
+
+
+def test_duplicidade_usa_o_mesmo_arredondamento():
+    nota = _notas([Decimal("0.125")])[0]
+    detector = DetectorAnomalias()
+    detector.registrar(nota)
+    assert (nota.emitente.cnpj, 13) in detector.recentes
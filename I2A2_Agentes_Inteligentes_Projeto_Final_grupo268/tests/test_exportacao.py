@@ -0,0 +1,49 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from exportacao import exportar_ndjson, importar_ndjson
+from extractor import NFeExtractor
+from sintetico import GeradorNFe
+from validator import ModeloDesligado, ValidadorInteligente
+
+
+@pytest.fixture(scope="module")
+def registros():
+    gerador = GeradorNFe(seed=13)
+    notas = [next(NFeExtractor().extrair_notas(gerador.gerar_nota(i)[0])) for i in range(5)]
+    # Valor que o float não representa exatamente
+    notas[0].totalizadores.valor_total_nota = Decimal("1234567890123.07")
+    validacoes = ValidadorInteligente("", modelo=ModeloDesligado()).validar_lote(notas)
+    return list(zip(notas, validacoes))
+
+
+@pytest.mark.parametrize("extensao", [".ndjson", ".ndjson.gz", ".ndjson.zst"])
+def test_ida_e_volta_com_decimais_exatos(tmp_path, registros, extensao):
+    if extensao.endswith(".zst"):
+        pytest.importorskip("zstandard")
+    caminho = str(tmp_path / f"notas{extensao}")
+    assert exportar_ndjson(iter(registros), caminho) == len(registros)
+
+    lidos = list(importar_ndjson(caminho))
+    assert [nota.model_dump() for nota, _ in lidos] == [nota.model_dump() for nota, _ in registros]
+    assert [v.model_dump() for _, v in lidos] == [v.model_dump() for _, v in registros]
+    total = lidos[0][0].totalizadores.valor_total_nota
+    assert isinstance(total, Decimal) and total == Decimal("1234567890123.07")
+
+
+def test_anexar_e_ignorar_linhas_de_erro(tmp_path, registros):
+    caminho = str(tmp_path / "notas.ndjson.gz")
+    exportar_ndjson(registros[:2], caminho)
+    exportar_ndjson(registros[2:], caminho, anexar=True)
+    with open(tmp_path / "erro.ndjson", "wb") as f:
+        f.write(b'{"arquivo": "x.xml", "erro": "falhou"}\n\n')
+    assert len(list(importar_ndjson(caminho))) == len(registros)
+    assert list(importar_ndjson(str(tmp_path / "erro.ndjson"))) == []
+
+
+def test_fluxo_em_memoria_e_linha_invalida():
+    buffer = io.BytesIO(b'{"nota": {"chave_acesso": 1}}\n')
+    with pytest.raises(ValueError, match="Linha 1 inválida"):
+        list(importar_ndjson(buffer))
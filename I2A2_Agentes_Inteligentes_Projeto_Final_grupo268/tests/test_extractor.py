@@ -0,0 +1,42 @@
+import re
+
+import pytest
+
+from extractor import NFeExtractor
+from sintetico import GeradorNFe
+from validator import ModeloDesligado, ValidadorInteligente
+
+
+def _xml_com_cnpj_invalido():
+    xml, _ = GeradorNFe(seed=2).gerar_nota(0)
+    return re.sub(rb"(<emit><CNPJ>)\d+", rb"\g<1>123", xml, count=1)
+
+
+def test_tolerante_mantem_nota_parcial_com_erros():
+    xml = re.sub(rb"<vProd>[^<]*</vProd>", b"<vProd>abc</vProd>", _xml_com_cnpj_invalido(), count=1)
+    nota = next(NFeExtractor(tolerante=True).extrair_notas(xml))
+
+    assert nota.emitente.cnpj == "123"  # valor bruto preservado
+    assert nota.produtos[0].valor_total == 0
+    erros = {erro.campo: erro for erro in nota.erros_extracao}
+    assert set(erros) == {"emitente.cnpj", "produtos.0.valor_total"}
+    assert erros["emitente.cnpj"].valor == "123" and "14 dígitos" in erros["emitente.cnpj"].mensagem
+    assert erros["produtos.0.valor_total"].valor == "abc"
+
+    # O validador transforma cada campo ilegível em inconsistência
+    resultado = ValidadorInteligente("", modelo=ModeloDesligado()).validar_nota(nota, usar_ia=False)
+    assert not resultado.valido
+    assert any(texto.startswith("Campo emitente.cnpj inválido na extração") for texto in resultado.inconsistencias)
+
+
+def test_estrito_rejeita_o_arquivo():
+    with pytest.raises(ValueError, match="CNPJ deve ter 14 dígitos"):
+        list(NFeExtractor().extrair_notas(_xml_com_cnpj_invalido()))
+
+
+def test_nota_valida_sem_erros_nos_dois_modos():
+    xml, _ = GeradorNFe(seed=2).gerar_nota(0)
+    estrita = next(NFeExtractor().extrair_notas(xml))
+    tolerante = next(NFeExtractor(tolerante=True).extrair_notas(xml))
+    assert estrita.erros_extracao == tolerante.erros_extracao == []
+    assert estrita.model_dump() == tolerante.model_dump()
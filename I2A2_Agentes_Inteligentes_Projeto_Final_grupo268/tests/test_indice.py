@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from indice import IndiceNotas, paginar
+
+
+def _nota(numero, emitente, cnpj, data_emissao, valor):
+    return SimpleNamespace(
+        numero=numero,
+        emitente=SimpleNamespace(razao_social=emitente, cnpj=cnpj),
+        data_emissao=data_emissao,
+        totalizadores=SimpleNamespace(valor_total_nota=Decimal(valor)),
+    )
+
+
+def _validacao(valido, score):
+    return SimpleNamespace(valido=valido, score_confianca=score)
+
+
+NOTAS = [
+    _nota("10", "Alfa Comércio", "11222333000181", datetime(2024, 3, 1, 10), "150.00"),
+    _nota("9", "Beta Indústria", "44555666000199", datetime(2024, 1, 15, 8, tzinfo=timezone.utc), "99.99"),
+    _nota("0011", "alfa serviços", "11222333000262", datetime(2024, 2, 10, 12), "1000.00"),
+    _nota("2", "Gama", "77888999000100", datetime(2024, 2, 10, 23, tzinfo=timezone(timedelta(hours=-3))), "150.00"),
+]
+VALIDACOES = [_validacao(True, 1.0), _validacao(False, 0.6), _validacao(True, 0.8), _validacao(False, 0.4)]
+
+
+@pytest.fixture
+def indice():
+    indice = IndiceNotas()
+    indice.sincronizar(NOTAS, VALIDACOES)
+    return indice
+
+
+def _posicoes(entradas):
+    return [entrada.posicao for entrada in entradas]
+
+
+def test_filtros(indice):
+    assert _posicoes(indice.consultar(emitente="ALFA")) == [0, 2]
+    assert _posicoes(indice.consultar(emitente="11.222.333")) == [0, 2]  # CNPJ com máscara
+    assert _posicoes(indice.consultar(status=False)) == [1, 3]
+    assert _posicoes(indice.consultar(data_inicio=date(2024, 2, 10), data_fim=date(2024, 2, 10))) == [2, 3]
+    assert _posicoes(indice.consultar(valor_min=Decimal("150.00"), valor_max=Decimal("150.00"))) == [0, 3]
+    assert _posicoes(indice.consultar(emitente="alfa", status=True, valor_min=Decimal("500"))) == [2]
+    assert indice.consultar(emitente="inexistente") == []
+
+
+def test_ordenacoes(indice):
+    assert _posicoes(indice.consultar(ordenar_por="Número")) == [3, 1, 0, 2]  # numérica, não lexicográfica
+    assert _posicoes(indice.consultar(ordenar_por="Data de emissão")) == [1, 2, 3, 0]  # com e sem fuso
+    assert _posicoes(indice.consultar(ordenar_por="Valor total", decrescente=True)) == [2, 3, 0, 1]
+    assert _posicoes(indice.consultar(ordenar_por="Emitente")) == [0, 2, 1, 3]
+    assert _posicoes(indice.consultar(ordenar_por="Confiança")) == [3, 1, 2, 0]
+    assert indice.intervalo_datas() == (date(2024, 1, 15), date(2024, 3, 1))
+
+
+def test_sincronizar_incremental_e_reconstrucao(indice):
+    notas = NOTAS + [_nota("1", "Delta", "00000000000191", datetime(2023, 12, 31), "5.00")]
+    validacoes = VALIDACOES + [_validacao(True, 1.0)]
+    assert _posicoes(indice.consultar(ordenar_por="Data de emissão"))[0] == 1
+    indice.sincronizar(notas, validacoes)
+    assert len(indice) == 5
+    assert _posicoes(indice.consultar(ordenar_por="Data de emissão"))[0] == 4  # ordenação refeita
+
+    indice.sincronizar(notas[:2], validacoes[:2])  # sessão limpa e recarregada
+    assert _posicoes(indice.consultar()) == [0, 1]
+
+
+@pytest.mark.parametrize("pagina, esperado", [
+    (1, ([0, 1, 2], 4)),
+    (4, ([9], 4)),
+    (0, ([0, 1, 2], 4)),   # antes da primeira: primeira
+    (99, ([9], 4)),        # depois da última: última
+])
+def test_paginar_limites(pagina, esperado):
+    itens, total = paginar(list(range(10)), pagina, 3)
+    assert (list(itens), total) == esperado
+
+
+def test_paginar_lista_vazia_tem_uma_pagina():
+    assert paginar([], 3, 25) == ([], 1)
+    assert paginar(list(range(6)), 2, 3) == ([3, 4, 5], 2)
@@ -0,0 +1,78 @@
+import pytest
+
+from metricas import BUCKETS_SEGUNDOS, TAMANHO_JANELA, Metricas
+
+
+def test_percentis_da_janela_recente():
+    m = Metricas(habilitado=True)
+    for ms in range(1, 101):
+        m.registrar("etapa", ms / 1000)
+    [linha] = m.resumo()
+    assert (linha["p50_ms"], linha["p95_ms"], linha["p99_ms"]) == pytest.approx((51, 96, 100))
+    assert linha["media_ms"] == pytest.approx(50.5)
+
+    # Amostras antigas saem da janela; contagem e soma continuam acumuladas
+    for _ in range(TAMANHO_JANELA):
+        m.registrar("etapa", 0.002)
+    [linha] = m.resumo()
+    assert linha["p50_ms"] == linha["p99_ms"] == pytest.approx(2)
+    assert linha["contagem"] == 100 + TAMANHO_JANELA
+    assert linha["total_ms"] == pytest.approx(5050 + 2 * TAMANHO_JANELA)
+
+
+def test_formato_prometheus():
+    m = Metricas(habilitado=True)
+    for segundos in (0.0004, 0.001, 0.003, 45.0):  # 0,001 cai no bucket le="0.001" (limite inclusivo)
+        m.registrar("extrator.nota", segundos)
+    m.registrar("extrator.nota", 0.02, erro=True)
+    linhas = m.exportar_prometheus().splitlines()
+
+    assert linhas[:2] == [
+        "# HELP fiscal_etapa_duracao_segundos Duração das etapas do pipeline fiscal",
+        "# TYPE fiscal_etapa_duracao_segundos histogram",
+    ]
+    buckets = {
+        linha.split('le="')[1].split('"')[0]: int(linha.rsplit(" ", 1)[1])
+        for linha in linhas if linha.startswith('fiscal_etapa_duracao_segundos_bucket{etapa="extrator.nota",')
+    }
+    assert list(buckets) == [str(limite) for limite in BUCKETS_SEGUNDOS] + ["+Inf"]
+    assert (buckets["0.0005"], buckets["0.001"], buckets["0.005"], buckets["0.025"], buckets["30.0"]) == (1, 2, 3, 4, 4)
+    assert buckets["+Inf"] == 5
+    assert 'fiscal_etapa_duracao_segundos_count{etapa="extrator.nota"} 5' in linhas
+    soma = next(l for l in linhas if l.startswith("fiscal_etapa_duracao_segundos_sum"))
+    assert float(soma.rsplit(" ", 1)[1]) == pytest.approx(45.0244)
+    assert "# TYPE fiscal_etapa_erros_total counter" in linhas
+    assert linhas[-1] == 'fiscal_etapa_erros_total{etapa="extrator.nota"} 1'
+
+
+def test_desabilitado_nao_mede_nada():
+    m = Metricas(habilitado=False)
+    contexto = m.medir("etapa")
+    assert contexto is m.medir("outra")  # o mesmo nullcontext, sem alocação por chamada
+    with contexto:
+        pass
+
+    @m.cronometrar("funcao")
+    def dobrar(x):
+        return 2 * x
+
+    assert dobrar(21) == 42
+    assert m.resumo() == []
+
+
+def test_habilitado_mede_e_conta_excecoes():
+    m = Metricas(habilitado=True)
+
+    @m.cronometrar("funcao")
+    def falhar():
+        raise KeyError("x")
+
+    with m.medir("bloco"):
+        pass
+    with pytest.raises(KeyError):
+        falhar()
+    resumo = {linha["etapa"]: linha for linha in m.resumo()}
+    assert (resumo["bloco"]["contagem"], resumo["bloco"]["erros"]) == (1, 0)
+    assert (resumo["funcao"]["contagem"], resumo["funcao"]["erros"]) == (1, 1)
+    m.limpar()
+    assert m.resumo() == []
@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+from extractor import NFeExtractor
+from participantes import RegistroParticipantes
+from sintetico import GeradorNFe
+
+CNPJ = "11222333000181"
+
+
+def _nota(i, cfop="5102", razao_social="FORNECEDOR UNICO LTDA"):
+    """Nota sintética i (mesma chave a cada chamada), sempre do mesmo emitente e com um único CFOP"""
+    nota = next(NFeExtractor().extrair_notas(GeradorNFe(seed=i).gerar_nota(i)[0]))
+    nota.emitente.cnpj = CNPJ
+    nota.emitente.razao_social = razao_social
+    for produto in nota.produtos:
+        produto.cfop = cfop
+    return nota
+
+
+def test_registrar_e_idempotente_por_chave():
+    registro = RegistroParticipantes()
+    nota = _nota(0)
+    assert registro.registrar(nota)
+    assert not registro.registrar(nota)
+    assert not registro.registrar(_nota(0))  # mesma chave lida de novo
+    perfil = registro.emitente(CNPJ)
+    assert perfil.notas == 1
+    assert perfil.valor_total == nota.totalizadores.valor_total_nota
+    assert registro.destinatario(nota.destinatario.cpf_cnpj).notas == 1
+
+    outra = _nota(1)
+    outra.emitente = nota.emitente.model_copy()  # mesmo cadastro, outro objeto
+    assert registro.registrar(outra)
+    assert perfil.notas == 2
+    assert perfil.valor_total == nota.totalizadores.valor_total_nota + outra.totalizadores.valor_total_nota
+    assert outra.emitente is nota.emitente  # cadastro internado: um objeto por participante
+
+
+def test_fornecedor_novo_so_antes_do_primeiro_registro():
+    registro = RegistroParticipantes(limite_valor_novo=Decimal("0.01"))
+    nota = _nota(0)
+    [alerta] = registro.sinais_risco(nota)
+    assert alerta.startswith("Fornecedor novo: primeira nota de FORNECEDOR UNICO LTDA")
+    assert "com valor elevado" in alerta
+    registro.registrar(nota)
+    assert registro.sinais_risco(_nota(1)) == []
+
+    assert registro.sinais_risco(_nota(2, razao_social="OUTRO NOME SA")) == [
+        "Razão social do emitente (OUTRO NOME SA) difere da registrada para o CNPJ (FORNECEDOR UNICO LTDA)"
+    ]
+
+
+def test_cfop_novo_so_depois_de_min_notas_cfop():
+    registro = RegistroParticipantes(min_notas_cfop=3)
+    for i in range(3):
+        incomum = _nota(100 + i, cfop="6949")
+        # Histórico ainda curto: nenhum sinal de CFOP
+        assert not any(a.startswith("CFOP") for a in registro.sinais_risco(incomum))
+        registro.registrar(_nota(i))
+
+    assert registro.sinais_risco(_nota(200, cfop="6949")) == [
+        "CFOP 6949 nunca usado pelo emitente em 3 notas (habituais: 5102)"
+    ]
+    assert registro.sinais_risco(_nota(201)) == []
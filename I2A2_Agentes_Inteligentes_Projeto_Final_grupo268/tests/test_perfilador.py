@@ -0,0 +1,71 @@
+import json
+import re
+
+import pytest
+
+from extractor import NFeExtractor
+from perfilador import Perfilador, ativar, desativar
+from sintetico import GeradorNFe
+from validator import ModeloDesligado, ValidadorInteligente
+
+
+@pytest.fixture(scope="module")
+def perfil():
+    """Perfil de um lote pequeno: extração e validação de algumas notas"""
+    gerador = GeradorNFe(seed=23)
+    xmls = [gerador.gerar_nota(i)[0] for i in range(10)]
+    extrator = NFeExtractor()
+    validador = ValidadorInteligente("", modelo=ModeloDesligado())
+    perfilador = ativar(intervalo=0.001)
+    try:
+        # Repete até a amostragem capturar pilhas (o lote leva poucos milissegundos)
+        for _ in range(50):
+            notas = [nota for xml in xmls for nota in extrator.extrair_notas(xml)]
+            validador.validar_lote(notas)
+            if sum(perfilador.pilhas.values()) >= 20:
+                break
+    finally:
+        desativar()
+    if not perfilador.estatisticas():
+        pytest.skip("outro profiler ativo no processo (ex.: cobertura)")
+    return perfilador
+
+
+def test_pilhas_colapsadas(perfil):
+    linhas = perfil.pilhas_colapsadas().splitlines()
+    assert linhas
+    for linha in linhas:
+        pilha, amostras = linha.rsplit(" ", 1)
+        assert int(amostras) > 0
+        etapa, *funcoes = pilha.split(";")
+        # A raiz é a etapa mais externa e cada frame tem arquivo:linha
+        assert re.fullmatch(r"(extrator|validador)\.\w+", etapa), etapa
+        assert all(re.search(r"\(\S+:\d+\)$", f) for f in funcoes[:-1]), pilha
+
+
+def test_hotspots_top_n(perfil):
+    hotspots = perfil.hotspots(5)
+    assert 0 < len(hotspots) <= 5
+    proprios = [h["proprio_ms"] for h in hotspots]
+    assert proprios == sorted(proprios, reverse=True)
+    assert {h["etapa"] for h in hotspots} <= set(perfil.estatisticas())
+    assert set(hotspots[0]) == {"etapa", "funcao", "biblioteca", "chamadas", "proprio_ms", "acumulado_ms"}
+
+    tabela = perfil.tabela(5).splitlines()
+    assert tabela[0].split()[:2] == ["próprio", "ms"]
+    assert len(tabela) == len(hotspots) + 1
+
+
+def test_exportar_importar_e_salvar(perfil, tmp_path):
+    perfil.exportar(str(tmp_path / "brutos"), "worker1")
+    consolidado = Perfilador(amostrar=False).importar(str(tmp_path / "brutos"))
+    assert consolidado.pilhas == perfil.pilhas
+    assert set(consolidado.estatisticas()) == set(perfil.estatisticas())
+
+    arquivos = consolidado.salvar(str(tmp_path / "perfil"), quantidade=3)
+    with open(arquivos["pilhas"], encoding="utf-8") as f:
+        assert f.read() == perfil.pilhas_colapsadas()
+    with open(arquivos["resumo"], encoding="utf-8") as f:
+        resumo = json.load(f)
+    assert resumo["amostras"] == sum(perfil.pilhas.values())
+    assert len(resumo["hotspots"]) <= 3
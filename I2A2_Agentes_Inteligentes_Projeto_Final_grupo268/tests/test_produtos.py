@@ -0,0 +1,34 @@
+import pytest
+
+from produtos import CatalogoProdutos, modelos, normalizar_descricao
+
+
+@pytest.mark.parametrize("descricoes, ncm", [
+    (["CERVEJA LATA 350ML", "CERV LT 350ML", "CERVEJA 350ML LATA"], "22030000"),
+    (["PAPEL A4 500 FOLHAS", "PAPEL A4 500 FLS"], "48025610"),
+    (["TONER HP 85A PRETO", "TONER HP 85A PRETO ORIGINAL"], "84433299"),
+])
+def test_variantes_agrupadas(descricoes, ncm):
+    catalogo = CatalogoProdutos()
+    assert len({catalogo.classificar(d, ncm).id for d in descricoes}) == 1
+
+
+@pytest.mark.parametrize("descricoes, ncm", [
+    (["TONER HP 85A PRETO", "TONER HP 12A PRETO"], "84433299"),
+    (["IPHONE 13 128GB", "IPHONE 15 128GB"], "85171300"),
+    (["CIMENTO CP II 50KG", "CIMENTO CP V 50KG"], "25232910"),
+    (["REFRIGERANTE 2L", "REFRIGERANTE 350ML"], "22021000"),
+])
+def test_modelos_e_medidas_diferentes_separados(descricoes, ncm):
+    catalogo = CatalogoProdutos()
+    assert len({catalogo.classificar(d, ncm).id for d in descricoes}) == len(descricoes)
+
+
+def test_numeros_distintos_nao_se_fundem():
+    catalogo = CatalogoProdutos()
+    assert len({catalogo.classificar(f"produto generico numero {i}").id for i in range(200)}) == 200
+
+
+def test_modelos():
+    assert modelos(normalizar_descricao("Cimento CP II-E 50kg")) == {"II"}
+    assert modelos(normalizar_descricao("Cerveja lata 350ml 12x")) == set()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from acervo import AcervoXML
+from diario import DiarioProcessamento, processar_arquivo
+from extractor import NFeExtractor
+from reextracao import reextrair
+from sintetico import GeradorNFe
+from validator import ValidadorInteligente
+
+ALERTA_ANOMALIA = "Preço unitário fora do padrão do produto"
+
+
+class ModeloFixo:
+    def generate_content(self, prompt):
+        class Resposta:
+            text = "Risco baixo"
+        return Resposta()
+
+
+@pytest.fixture
+def diario_com_nota_antiga(tmp_path):
+    """Arquivo processado até a IA e depois gravado como se viesse de um extrator anterior"""
+    diario = DiarioProcessamento(str(tmp_path / "diario"))
+    acervo = AcervoXML(str(tmp_path / "acervo"))
+    conteudo, _ = GeradorNFe(seed=5).gerar_nota(1)
+    validador = ValidadorInteligente("", modelo=ModeloFixo())
+    processado = processar_arquivo(diario, conteudo, "nota.xml", NFeExtractor(), validador, usar_ia=True, acervo=acervo)
+    acervo.fechar()
+
+    entrada = diario.entrada(processado.hash)
+    with open(entrada.resultado, encoding="utf-8") as f:
+        resultado = json.load(f)
+    resultado["notas"][0]["produtos"][0]["descricao"] = "DESCRICAO ANTIGA"
+    resultado["notas"][0]["versao_extrator"] = "0"
+    resultado["validacoes"][0]["alertas"].append(ALERTA_ANOMALIA)
+    with open(entrada.resultado, "w", encoding="utf-8") as f:
+        json.dump(resultado, f)
+    diario.marcar_versao([processado.hash], "0")
+    return diario, processado.hash, tmp_path
+
+
+def test_reextracao_preserva_alertas_e_analise_ia(diario_com_nota_antiga):
+    diario, hash_arquivo, pasta = diario_com_nota_antiga
+    resumo = reextrair(str(pasta / "diario"), str(pasta / "acervo"), workers=1, silencioso=True)
+    assert resumo["alterados"] == 1
+
+    entrada = diario.entrada(hash_arquivo)
+    assert entrada.etapa == "analisado_ia"
+    notas, validacoes = diario.carregar(entrada)
+    assert notas[0].produtos[0].descricao != "DESCRICAO ANTIGA"
+    assert validacoes[0].analise_ia == "Risco baixo"
+    assert ALERTA_ANOMALIA in validacoes[0].alertas
+    assert not any("DESCRICAO ANTIGA" in m for m in validacoes[0].alertas + validacoes[0].inconsistencias)
+
+
+def test_reextracao_sem_validacao_descarta_validacao_antiga(diario_com_nota_antiga):
+    diario, hash_arquivo, pasta = diario_com_nota_antiga
+    reextrair(str(pasta / "diario"), str(pasta / "acervo"), workers=1, revalidar=False, silencioso=True)
+
+    entrada = diario.entrada(hash_arquivo)
+    assert entrada.etapa == "extraido"
+    notas, validacoes = diario.carregar(entrada)
+    assert notas is not None and validacoes is None
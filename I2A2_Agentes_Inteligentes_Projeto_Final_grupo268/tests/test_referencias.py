@@ -0,0 +1,39 @@
+import shutil
+
+import referencias
+from extractor import NFeExtractor
+from referencias import DIRETORIO_REFERENCIAS, ReferenciasFiscais
+from sintetico import GeradorNFe
+from validator import ModeloDesligado, ValidadorInteligente
+
+
+def _nota_com_ncm(ncm):
+    nota = next(NFeExtractor().extrair_notas(GeradorNFe(seed=1).gerar_nota(0)[0]))
+    nota.produtos[0].ncm = ncm
+    return nota
+
+
+def _validar(nota, referencias_fiscais):
+    validador = ValidadorInteligente("", referencias=referencias_fiscais, modelo=ModeloDesligado())
+    return validador.validar_codigos(nota)
+
+
+def test_recorte_distribuido_nao_gera_alerta_por_item():
+    referencias_fiscais = ReferenciasFiscais()
+    assert not referencias_fiscais.ncm_completa
+    # Capítulo 84 existe, o item não está no recorte
+    inconsistencias, alertas = _validar(_nota_com_ncm("84719099"), referencias_fiscais)
+    assert not any("NCM" in texto for texto in inconsistencias + alertas)
+    # Capítulo inexistente continua inconsistência: todos os capítulos estão na tabela
+    inconsistencias, _ = _validar(_nota_com_ncm("77019999"), referencias_fiscais)
+    assert any("capítulo 77 inexistente" in texto for texto in inconsistencias)
+
+
+def test_tabela_completa_alerta_item_ausente(tmp_path, monkeypatch):
+    for nome in ("ncm.tsv", "cfop.tsv"):
+        shutil.copy(f"{DIRETORIO_REFERENCIAS}/{nome}", tmp_path / nome)
+    monkeypatch.setattr(referencias, "MIN_ITENS_NCM_COMPLETA", 10)
+    referencias_fiscais = ReferenciasFiscais(str(tmp_path))
+    assert referencias_fiscais.ncm_completa
+    _, alertas = _validar(_nota_com_ncm("84719099"), referencias_fiscais)
+    assert any("NCM 84719099 não encontrado na tabela de referência" in texto for texto in alertas)
@@ -0,0 +1,36 @@
+import pytest
+
+from extractor import NFeExtractor
+from regras import MotorRegras, carregar_motor_padrao, montar_dataframes, montar_linhas
+from sintetico import GeradorNFe
+
+
+def _notas(quantidade):
+    gerador = GeradorNFe(seed=7)
+    return [nota for i in range(quantidade) for nota in NFeExtractor().extrair_notas(gerador.gerar_nota(i)[0])]
+
+
+def test_avaliacao_por_linha_igual_a_vetorizada():
+    notas = _notas(120)
+    for idx in range(0, len(notas), 3):
+        nota = notas[idx]
+        nota.destinatario.endereco.uf = nota.emitente.endereco.uf
+        nota.produtos[0].cfop = "6102"
+        nota.produtos[-1].ncm = "2203"
+    motor = carregar_motor_padrao()
+    por_linha = motor.avaliar_linhas(*montar_linhas(notas))
+    vetorizado = motor.avaliar_dataframes(*montar_dataframes(notas))
+    assert por_linha.achados == vetorizado.achados
+    assert any(por_linha.achados.values())
+    assert [e.ocorrencias for e in por_linha.estatisticas] == [e.ocorrencias for e in vetorizado.estatisticas]
+
+
+@pytest.mark.parametrize("regra", [
+    {"id": "X", "condicao": {"campo": "valor_totl", "op": ">", "valor": 1}, "mensagem": "m"},
+    {"id": "X", "escopo": "item", "condicao": {"campo": "ncm", "op": "==", "valor": {"campo": "chave_acesso"}}, "mensagem": "m"},
+    {"id": "X", "condicao": {"campo": "valor_icms", "op": ">", "valor": {"por": "cnpj", "padrao": 1}}, "mensagem": "m"},
+    {"id": "X", "condicao": {"campo": "qtd_itens", "op": ">", "valor": 1}, "mensagem": "NCM {ncm}"},
+])
+def test_coluna_inexistente_rejeitada_ao_compilar(regra):
+    with pytest.raises(ValueError, match="coluna"):
+        MotorRegras.de_dict({"regras": [regra]})
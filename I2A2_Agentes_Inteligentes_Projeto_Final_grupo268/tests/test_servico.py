@@ -0,0 +1,163 @@
+import asyncio
+import io
+import json
+import threading
+import zipfile
+
+import servico
+from servico import ServicoIngestao
+from sintetico import GeradorNFe
+from validator import ModeloDesligado
+
+
+def _xmls(quantidade, seed=11):
+    gerador = GeradorNFe(seed=seed)
+    return [gerador.gerar_nota(i)[0] for i in range(quantidade)]
+
+
+def _zip(xmls):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as arquivo_zip:
+        for i, xml in enumerate(xmls):
+            arquivo_zip.writestr(f"nota_{i}.xml", xml)
+    return buffer.getvalue()
+
+
+async def _requisitar(app, metodo, caminho, corpo=b"", query=b"", tipo="application/xml", partes=1):
+    """Uma requisição HTTP pelo protocolo ASGI cru; retorna (status, cabeçalhos, corpo)"""
+    tamanho = -(-len(corpo) // partes) or 1
+    mensagens = [
+        {"type": "http.request", "body": corpo[i:i + tamanho], "more_body": i + tamanho < len(corpo)}
+        for i in range(0, max(len(corpo), 1), tamanho)
+    ]
+    enviadas = []
+
+    async def receive():
+        return mensagens.pop(0) if mensagens else {"type": "http.disconnect"}
+
+    async def send(mensagem):
+        enviadas.append(mensagem)
+
+    scope = {
+        "type": "http", "method": metodo, "path": caminho, "query_string": query,
+        "headers": [(b"content-type", tipo.encode())],
+    }
+    await app(scope, receive, send)
+    inicio, corpo_resposta = enviadas
+    cabecalhos = {k.decode(): v.decode() for k, v in inicio["headers"]}
+    return inicio["status"], cabecalhos, corpo_resposta["body"]
+
+
+async def _json(app, *args, **kwargs):
+    status, cabecalhos, corpo = await _requisitar(app, *args, **kwargs)
+    return status, cabecalhos, json.loads(corpo)
+
+
+def _executar(teste):
+    """Roda a corrotina de teste com um serviço novo, encerrado ao final"""
+    async def rodar():
+        app = ServicoIngestao(workers=2, tamanho_fila=4, modelo=ModeloDesligado())
+        try:
+            await teste(app)
+        finally:
+            await app.encerrar()
+    asyncio.run(rodar())
+
+
+def test_202_e_consulta_do_job():
+    async def teste(app):
+        status, cabecalhos, corpo = await _json(app, "POST", "/notas", _zip(_xmls(3)), tipo="application/zip")
+        assert status == 202 and corpo["total"] == 3
+        assert cabecalhos["location"] == f"/jobs/{corpo['job']}"
+
+        for _ in range(500):
+            status, _, job = await _json(app, "GET", cabecalhos["location"])
+            assert status == 200
+            if job["status"] == "concluido":
+                break
+            await asyncio.sleep(0.01)
+        assert job["pendentes"] == 0
+        assert [r["arquivo"] for r in job["resultados"]] == ["nota_0.xml", "nota_1.xml", "nota_2.xml"]
+        assert all(r["status"] == "ok" and r["validacao"] is not None for r in job["resultados"])
+
+        status, _, corpo = await _json(app, "GET", "/jobs/inexistente")
+        assert status == 404
+    _executar(teste)
+
+
+def test_aguardar_devolve_resultado_na_mesma_requisicao():
+    async def teste(app):
+        xml = _xmls(1)[0]
+        status, _, job = await _json(app, "POST", "/notas", xml, query=b"aguardar=1")
+        assert status == 200 and job["status"] == "concluido"
+        [resultado] = job["resultados"]
+        assert resultado["arquivo"] == "arquivo.xml"
+        # Decimais como strings exatas, como no NDJSON do exportador
+        assert isinstance(resultado["nota"]["totalizadores"]["valor_total_nota"], str)
+
+        status, _, job = await _json(app, "POST", "/notas", b"<nada/>", query=b"aguardar=1")
+        assert status == 200 and job["resultados"][0]["status"] == "erro"
+    _executar(teste)
+
+
+def test_429_com_a_fila_cheia(monkeypatch):
+    liberar = threading.Event()
+    processar = ServicoIngestao._processar
+
+    def processar_bloqueado(self, nome, conteudo):
+        liberar.wait(10)
+        return processar(self, nome, conteudo)
+
+    monkeypatch.setattr(ServicoIngestao, "_processar", processar_bloqueado)
+
+    async def teste(app):
+        app.workers = 1
+        app.tamanho_fila = 2
+        xmls = _xmls(4)
+        status, _, _ = await _json(app, "POST", "/notas", xmls[0])
+        assert status == 202
+        while app.em_execucao == 0:  # o único worker fica preso na primeira nota
+            await asyncio.sleep(0.01)
+        status, _, _ = await _json(app, "POST", "/notas", _zip(xmls[1:3]), tipo="application/zip")
+        assert status == 202
+
+        status, cabecalhos, corpo = await _json(app, "POST", "/notas", xmls[3])
+        assert status == 429 and cabecalhos["retry-after"] == "1"
+        assert corpo == {"erro": "fila cheia", "fila": 2, "capacidade": 2}
+        assert app.saude()["rejeitadas"] == 1
+
+        liberar.set()
+        await asyncio.wait_for(asyncio.gather(*(job.concluido.wait() for job in app.jobs.values())), 10)
+        assert app.saude()["processadas"] == 3
+    _executar(teste)
+
+
+def test_413_lote_maior_que_a_fila_e_corpo_grande(monkeypatch):
+    async def teste(app):
+        status, _, corpo = await _json(app, "POST", "/notas", _zip(_xmls(5)), tipo="application/zip")
+        assert status == 413 and corpo["capacidade"] == 4
+        assert app.saude()["rejeitadas"] == 0  # não é backpressure: repetir não adianta
+
+        monkeypatch.setattr(servico, "TAMANHO_MAXIMO_CORPO", 1000)
+        status, _, corpo = await _json(app, "POST", "/notas", _xmls(1)[0], partes=4)
+        assert status == 413 and "1000 bytes" in corpo["erro"]
+    _executar(teste)
+
+
+def test_saude_e_metricas():
+    async def teste(app):
+        status, _, saude = await _json(app, "GET", "/saude")
+        assert status == 200
+        assert saude["status"] == "ok" and saude["capacidade"] == 4 and saude["fila"] == 0
+
+        await _json(app, "POST", "/notas", _xmls(1)[0], query=b"aguardar=1")
+        status, cabecalhos, corpo = await _requisitar(app, "GET", "/metricas")
+        assert status == 200 and cabecalhos["content-type"].startswith("text/plain")
+        linhas = corpo.decode().splitlines()
+        assert "# TYPE fiscal_servico_notas_processadas_total counter" in linhas
+        assert "fiscal_servico_notas_processadas_total 1" in linhas
+        assert "fiscal_servico_capacidade_fila 4" in linhas
+
+        status, _, _ = await _requisitar(app, "GET", "/nada")
+        assert status == 404
+    _executar(teste)